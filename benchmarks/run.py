@@ -0,0 +1,247 @@
+"""
+Benchmarks of the buses dispatch hot paths.
+
+Usage:
+    python benchmarks/run.py [--output results.json] [--baseline benchmarks/baseline.json]
+                             [--save-baseline] [--tolerance 0.25] [--quick] [--filter substring]
+
+Each scenario reports the throughput (messages per second, measured on a tight loop) and
+the per-call latency percentiles (each call being timed on its own, which adds the cost of a
+`time.perf_counter_ns()` call to these figures).
+Right before each scenario, the throughput of a plain function call loop is measured too:
+the scenarios are compared with a baseline through their "relative throughput" - i.e. their
+throughput divided by that calibration one, so that the speed of the machine (and its load
+at that moment) cancels out.
+When a baseline file is given, the process exits with a non-zero status if the relative
+throughput of a scenario dropped by more than `tolerance` (a ratio) compared to that baseline.
+"""
+# pylint: disable=missing-function-docstring,too-few-public-methods
+import argparse
+import dataclasses
+import json
+import logging
+import platform
+import sys
+import time
+import typing as t
+
+from pymessagebus import CommandBus, MessageBus
+from pymessagebus.middleware.logger import get_logger_middleware
+
+BASELINE_PATH = "benchmarks/baseline.json"
+ROUNDS = 5
+
+
+class NamedTupleMessage(t.NamedTuple):
+    customer_id: int
+    amount: float
+
+
+@dataclasses.dataclass(frozen=True)
+class DataclassMessage:
+    customer_id: int
+    amount: float
+
+
+class SlottedMessage:
+    __slots__ = ("customer_id", "amount")
+
+    def __init__(self, customer_id: int, amount: float) -> None:
+        self.customer_id = customer_id
+        self.amount = amount
+
+
+MESSAGE_SHAPES: t.Dict[str, t.Callable[[], object]] = {
+    "namedtuple": lambda: NamedTupleMessage(42, 3.5),
+    "dataclass": lambda: DataclassMessage(42, 3.5),
+    "slotted": lambda: SlottedMessage(42, 3.5),
+}
+
+
+def noop_handler(message: object) -> object:
+    return message
+
+
+def noop_middleware(message: object, next_: t.Callable) -> object:
+    return next_(message)
+
+
+class Scenario(t.NamedTuple):
+    name: str
+    # returns the callable to benchmark and the message to send to it:
+    setup: t.Callable[[], t.Tuple[t.Callable[[object], t.Any], object]]
+
+
+def messagebus_scenario(
+    shape: str, handlers: int, middlewares: int = 0, logger: bool = False
+) -> Scenario:
+    def setup():
+        bus_middlewares: t.List[t.Callable] = [noop_middleware] * middlewares
+        if logger:
+            silent_logger = logging.getLogger("pymessagebus.benchmarks")
+            silent_logger.setLevel(logging.WARNING)
+            bus_middlewares.append(get_logger_middleware(silent_logger))
+        bus = MessageBus(middlewares=bus_middlewares)
+        message = MESSAGE_SHAPES[shape]()
+        for _ in range(handlers):
+            bus.add_handler(type(message), noop_handler)
+        return bus.handle, message
+
+    name = f"messagebus.handle[{shape},handlers={handlers},middlewares={middlewares}"
+    name += ",logger]" if logger else "]"
+    return Scenario(name, setup)
+
+
+def commandbus_scenario(shape: str, middlewares: int = 0, locking: bool = True):
+    def setup():
+        bus = CommandBus(middlewares=[noop_middleware] * middlewares, locking=locking)
+        message = MESSAGE_SHAPES[shape]()
+        bus.add_handler(type(message), noop_handler)
+        return bus.handle, message
+
+    return Scenario(
+        f"commandbus.handle[{shape},middlewares={middlewares},locking={locking}]", setup
+    )
+
+
+def get_scenarios() -> t.List[Scenario]:
+    scenarios = []
+    for shape in MESSAGE_SHAPES:
+        scenarios.append(messagebus_scenario(shape, handlers=1))
+        scenarios.append(commandbus_scenario(shape))
+    for handlers in (4, 16):  # fan-out width
+        scenarios.append(messagebus_scenario("namedtuple", handlers=handlers))
+    for middlewares in (1, 4, 16):  # middlewares chain depth
+        scenarios.append(messagebus_scenario("namedtuple", 1, middlewares=middlewares))
+        scenarios.append(commandbus_scenario("namedtuple", middlewares=middlewares))
+    scenarios.append(commandbus_scenario("namedtuple", locking=False))
+    scenarios.append(messagebus_scenario("namedtuple", handlers=1, logger=True))
+    return scenarios
+
+
+def measure_throughput(
+    target: t.Callable[[object], t.Any], message: object, iterations: int
+) -> float:
+    loop = range(iterations)
+    start = time.perf_counter()
+    for _ in loop:
+        target(message)
+    return iterations / (time.perf_counter() - start)
+
+
+def run_scenario(scenario: Scenario, iterations: int) -> t.Dict[str, float]:
+    target, message = scenario.setup()
+    for _ in range(min(iterations, 1000)):  # warm-up
+        target(message)
+
+    # As `timeit` does, the best of a few rounds is kept: the slower ones are slowed down by
+    # some other processes, not by the scenario.
+    calibration = throughput = 0.0
+    for _ in range(ROUNDS):
+        calibration = max(
+            calibration, measure_throughput(noop_handler, message, iterations)
+        )
+        throughput = max(throughput, measure_throughput(target, message, iterations))
+
+    loop = range(iterations)
+
+    latencies = []
+    clock = time.perf_counter_ns
+    for _ in loop:
+        call_start = clock()
+        target(message)
+        latencies.append(clock() - call_start)
+    latencies.sort()
+
+    def percentile(ratio: float) -> float:
+        return float(latencies[min(len(latencies) - 1, int(len(latencies) * ratio))])
+
+    return {
+        "iterations": iterations,
+        "messages_per_second": throughput,
+        "relative_throughput": throughput / calibration,
+        "latency_ns_p50": percentile(0.50),
+        "latency_ns_p90": percentile(0.90),
+        "latency_ns_p99": percentile(0.99),
+        "latency_ns_max": float(latencies[-1]),
+    }
+
+
+def compare_with_baseline(
+    results: t.Dict[str, t.Dict[str, float]],
+    baseline: t.Dict[str, t.Dict[str, float]],
+    tolerance: float,
+) -> t.List[str]:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        reference = baseline[name]["relative_throughput"]
+        ratio = result["relative_throughput"] / reference
+        if ratio < 1 - tolerance:
+            regressions.append(
+                f"{name}: {result['relative_throughput']:.3f} vs {reference:.3f} "
+                f"relative throughput in the baseline ({ratio - 1:+.1%})"
+            )
+    return regressions
+
+
+def main(argv: t.List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--output", help="path of the JSON results file")
+    parser.add_argument(
+        "--baseline", help="path of a JSON results file to compare with"
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help=f"write the results as the new baseline ({BASELINE_PATH})",
+    )
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--iterations", type=int, default=200_000)
+    parser.add_argument("--quick", action="store_true", help="10x less iterations")
+    parser.add_argument("--filter", default="", help="only run matching scenarios")
+    args = parser.parse_args(argv)
+
+    iterations = args.iterations // 10 if args.quick else args.iterations
+    results: t.Dict[str, t.Dict[str, float]] = {}
+    for scenario in get_scenarios():
+        if args.filter not in scenario.name:
+            continue
+        result = run_scenario(scenario, iterations)
+        results[scenario.name] = result
+        print(
+            f"{scenario.name:<70} {result['messages_per_second']:>12,.0f} msg/s"
+            f"  relative={result['relative_throughput']:.3f}"
+            f"  p50={result['latency_ns_p50']:>7,.0f}ns"
+            f"  p99={result['latency_ns_p99']:>7,.0f}ns"
+        )
+
+    report = {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2, sort_keys=True)
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as baseline_file:
+            json.dump(report, baseline_file, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print("\nPerformance regressions compared to the baseline:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            return 1
+        print("\nNo performance regression compared to the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
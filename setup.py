@@ -26,7 +26,6 @@ setuptools.setup(
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
         "Topic :: Software Development :: Libraries :: Python Modules",
-        "Programming Language :: Python :: 3.6",
         "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: 3.9",
@@ -38,7 +37,7 @@ setuptools.setup(
     include_package_data=True,
     zip_safe=False,
     install_requires=[],
-    python_requires=">=3.6",
+    python_requires=">=3.7",
     tests_require=[
         "pytest",
         "pylint",
@@ -1,2 +1,13 @@
 from ._messagebus import MessageBus
 from ._commandbus import CommandBus
+from ._async_messagebus import AsyncMessageBus
+from ._async_commandbus import AsyncCommandBus
+from ._parallel import ParallelExecutionConfig
+from ._queued import QueuedBus, AsyncQueuedBus, QueueOverflowPolicy
+from ._coalescing import CoalescingConfig
+from ._lazy import LazyHandler
+from ._serialization import SerializerRegistry
+from ._multiprocess import ProcessMessageBus
+from ._partitioned import PartitionedBus, AsyncPartitionedBus
+from ._deadlines import deadline, remaining_time, check_deadline
+from ._profiling import Profiler, ProfilerConfig
@@ -0,0 +1,97 @@
+import asyncio
+import contextvars
+import functools
+import types
+import typing as t
+
+from . import api
+from ._async_messagebus import AsyncMessageBus, _trigger_handler
+from ._commandbus import BaseCommandBus
+from ._messagebus import DispatchPlan, Handlers, Predicates
+
+# The asyncio Task which is processing a message, for each bus (keyed by their `id()`).
+# As each Task runs in a copy of the context of its parent, this state is inherited by the
+# Tasks a handler starts - hence the comparison with the current Task:
+_PROCESSING_TASKS: contextvars.ContextVar[
+    t.Mapping[int, t.Optional[asyncio.Task]]
+] = contextvars.ContextVar(
+    "pymessagebus_async_commandbus_processing_tasks", default=types.MappingProxyType({})
+)
+
+
+class AsyncCommandBus(BaseCommandBus, api.AsyncCommandBus):
+    __slots__ = ()
+
+    _messagebus: "_AsyncCommandHandlersBus"
+
+    def __init__(
+        self,
+        *,
+        middlewares: t.List[api.AsyncMiddleware] = None,
+        allow_result: bool = True,
+        locking: bool = True,
+    ) -> None:
+        # The locking is scoped to the current asyncio Task: concurrent Tasks can share the bus,
+        # but a handler awaiting the handling of another command on the same bus will be stopped.
+        super().__init__(
+            _AsyncCommandHandlersBus(middlewares=middlewares),
+            allow_result=allow_result,
+            locking=locking,
+        )
+
+    async def handle(self, message: object) -> t.Any:
+        try:
+            dispatch_plan = self._dispatch_plans[message.__class__]
+        except KeyError:
+            dispatch_plan = self._compile_dispatch_plan(message.__class__)
+
+        if self._locking:
+            current_task = asyncio.current_task()
+            processing_tasks = _PROCESSING_TASKS.get()
+            if processing_tasks.get(id(self), False) is current_task:
+                raise api.CommandBusAlreadyProcessingAMessage(
+                    f"CommandBus already processing a message when received a '{message.__class__}' one."  # pylint: disable=line-too-long
+                )
+            # The mapping is shared with the copied contexts, hence replaced rather than mutated:
+            token = _PROCESSING_TASKS.set({**processing_tasks, id(self): current_task})
+            try:
+                result = await dispatch_plan(message)
+            finally:
+                _PROCESSING_TASKS.reset(token)
+        else:
+            result = await dispatch_plan(message)
+        return result if self._allow_result else None
+
+
+class _AsyncCommandHandlersBus(AsyncMessageBus):
+    """
+    See `_commandbus._CommandHandlersBus`: the result of a dispatch plan is the result of
+    the command handler itself, and the middlewares get a one-item list.
+    """
+
+    __slots__ = ()
+
+    def _get_handlers_trigger(
+        self, message_class: type, handlers: Handlers, predicates: Predicates
+    ) -> t.Callable[[object], t.Awaitable[t.Any]]:
+        handler = handlers[0]
+        if asyncio.iscoroutinefunction(handler):
+            return handler
+        return functools.partial(_trigger_handler, handler)
+
+    def _wrap_in_middlewares(
+        self, middlewares: t.List[api.Middleware], handlers_trigger: t.Callable
+    ) -> DispatchPlan:
+        async def trigger_handler(
+            message: object, unused_next: t.Callable
+        ) -> t.List[t.Any]:
+            return [await handlers_trigger(message)]
+
+        dispatch_plan = self._get_middlewares_callables_chain(
+            middlewares, trigger_handler
+        )
+
+        async def unwrap_result(message: object) -> t.Any:
+            return (await dispatch_plan(message))[0]
+
+        return unwrap_result
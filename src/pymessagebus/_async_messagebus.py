@@ -0,0 +1,156 @@
+import asyncio
+import inspect
+import typing as t
+
+from . import api
+from .api import StopPropagation
+from ._messagebus import BaseMessageBus, DispatchPlan, Handlers, Predicates
+from ._profiling import Profiler
+
+
+class AsyncMessageBus(BaseMessageBus, api.AsyncMessageBus):
+    __slots__ = ("_concurrent_handlers",)
+
+    def __init__(
+        self,
+        *,
+        middlewares: t.List[api.AsyncMiddleware] = None,
+        polymorphic: bool = False,
+        concurrent_handlers: bool = False,
+    ) -> None:
+        """
+        Middlewares have to be coroutine functions, awaiting their "next" parameter.
+        Handlers can be either coroutine functions or regular callables.
+        With `concurrent_handlers=True` the handlers of a same message are run
+        concurrently, with `asyncio.gather()`, rather than one after another.
+        """
+        super().__init__(middlewares=middlewares, polymorphic=polymorphic)  # type: ignore
+        self._concurrent_handlers = bool(concurrent_handlers)
+
+    async def handle(self, message: object) -> t.List[t.Any]:
+        try:
+            dispatch_plan = self._dispatch_plans[message.__class__]
+        except KeyError:
+            dispatch_plan = self._compile_dispatch_plan(message.__class__)
+        return await dispatch_plan(message)
+
+    async def handle_first(self, message: object) -> t.Any:
+        """
+        Awaits the handlers of the message one after another, until one of them returns
+        something else than `None`: this result is returned, and the remaining handlers are
+        not triggered - even with `concurrent_handlers=True`.
+        """
+        try:
+            dispatch_plan = self._first_result_dispatch_plans[message.__class__]
+        except KeyError:
+            dispatch_plan = self._compile_first_result_dispatch_plan(message.__class__)
+        return await dispatch_plan(message)
+
+    def _get_handlers_trigger(
+        self, message_class: type, handlers: Handlers, predicates: Predicates
+    ) -> t.Callable[[object], t.Awaitable[t.List[t.Any]]]:
+        if predicates is not None:
+            conditional_handlers = tuple(zip(handlers, predicates))
+            concurrent_handlers = self._concurrent_handlers
+
+            async def conditional_handlers_trigger(message: object) -> t.List[t.Any]:
+                selected_handlers = [
+                    handler
+                    for handler, predicate in conditional_handlers
+                    if predicate is None or predicate(message)
+                ]
+                if concurrent_handlers:
+                    return _unwrap_results(
+                        await asyncio.gather(
+                            *[_trigger_handler(h, message) for h in selected_handlers]
+                        )
+                    )
+                return await _trigger_handlers_in_turn(selected_handlers, message)
+
+            return conditional_handlers_trigger
+
+        if self._concurrent_handlers:
+
+            async def concurrent_handlers_trigger(message: object) -> t.List[t.Any]:
+                return _unwrap_results(
+                    await asyncio.gather(
+                        *[_trigger_handler(handler, message) for handler in handlers]
+                    )
+                )
+
+            return concurrent_handlers_trigger
+
+        if len(handlers) == 1:
+            handler = handlers[0]
+
+            async def single_handler_trigger(message: object) -> t.List[t.Any]:
+                result = await _trigger_handler(handler, message)
+                if result.__class__ is StopPropagation:
+                    return [result.result]
+                return [result]
+
+            return single_handler_trigger
+
+        async def handlers_trigger(message: object) -> t.List[t.Any]:
+            return await _trigger_handlers_in_turn(handlers, message)
+
+        return handlers_trigger
+
+    def _get_first_result_trigger(
+        self, handlers: Handlers, predicates: Predicates
+    ) -> t.Callable[[object], t.Awaitable[t.Any]]:
+        conditional_handlers = tuple(
+            zip(handlers, predicates or (None,) * len(handlers))
+        )
+
+        async def first_result_trigger(message: object) -> t.Any:
+            for handler, predicate in conditional_handlers:
+                if predicate is not None and not predicate(message):
+                    continue
+                result = await _trigger_handler(handler, message)
+                if result is None:
+                    continue
+                return result.result if result.__class__ is StopPropagation else result
+            return None
+
+        return first_result_trigger
+
+    def _get_no_handlers_dispatch_plan(self) -> DispatchPlan:
+        return _no_handlers_dispatch_plan
+
+    @staticmethod
+    def _profile(
+        profiler: Profiler, function: t.Callable, frame_name: str
+    ) -> t.Callable:
+        return profiler.profile_async(function, frame_name)
+
+
+async def _trigger_handler(handler: t.Callable, message: object) -> t.Any:
+    result = handler(message)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+async def _trigger_handlers_in_turn(
+    handlers: t.Iterable[t.Callable], message: object
+) -> t.List[t.Any]:
+    # The handlers which come after a `StopPropagation` result are not triggered:
+    results = []
+    for handler in handlers:
+        results.append(await _trigger_handler(handler, message))
+        if results[-1].__class__ is StopPropagation:
+            break
+    return _unwrap_results(results)
+
+
+def _unwrap_results(results: t.Iterable[t.Any]) -> t.List[t.Any]:
+    # Concurrent handlers are all triggered at once, so `StopPropagation` is only unwrapped:
+    return [
+        result.result if result.__class__ is StopPropagation else result
+        for result in results
+    ]
+
+
+async def _no_handlers_dispatch_plan(unused_message: object) -> t.List[t.Any]:
+    return []
@@ -0,0 +1,147 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+import typing as t
+
+_logger = logging.getLogger(__name__)
+
+
+class CoalescingConfig(t.NamedTuple):
+    """
+    Makes a MessageBus defer the handling of the messages of a class by `window` seconds,
+    during which the messages with the same `key` are coalesced: only the latest one is kept -
+    or, if a `merge` function is given, `merge(pending_message, new_message)` is kept instead.
+    The handlers are then triggered once per key, from a scheduler thread: as nobody awaits
+    their results there, the exceptions they raise are given to `on_error(message, error)` -
+    or logged, if it's `None`.
+    """
+
+    window: float
+    key: t.Callable[[object], t.Hashable] = lambda message: message
+    merge: t.Optional[t.Callable[[object, object], object]] = None
+    on_error: t.Optional[t.Callable[[object, Exception], t.Any]] = None
+
+
+class CoalescingStats(t.NamedTuple):
+    received: int
+    dispatched: int
+    pending: int
+
+
+class Coalescer:  # pylint: disable=too-many-instance-attributes
+    __slots__ = (
+        "_window",
+        "_key",
+        "_merge",
+        "_on_error",
+        "_dispatch",
+        "_pending",
+        "_deadlines",
+        "_generations",
+        "_condition",
+        "_scheduler",
+        "_received",
+        "_dispatched",
+    )
+
+    def __init__(
+        self, config: CoalescingConfig, dispatch: t.Callable[[object], t.Any]
+    ) -> None:
+        self._window = config.window
+        self._key = config.key
+        self._merge = config.merge
+        self._on_error = config.on_error
+        self._dispatch = dispatch
+        # Key -> (pending message, generation): each key gets a new generation when its first
+        # message is pushed, so that the deadlines of the keys flushed meanwhile are ignored.
+        self._pending: t.Dict[t.Hashable, t.Tuple[object, int]] = {}
+        # A heap of (deadline, generation, key) tuples - the generations being unique,
+        # the keys themselves are never compared:
+        self._deadlines: t.List[t.Tuple[float, int, t.Hashable]] = []
+        self._generations = itertools.count()
+        self._condition = threading.Condition()
+        # Only runs while some messages are pending:
+        self._scheduler: t.Optional[threading.Thread] = None
+        self._received = 0
+        self._dispatched = 0
+
+    def push(self, message: object) -> t.List[t.Any]:
+        """
+        Acts as the dispatch plan of the coalesced message class: as the message handling is
+        deferred, an empty list of results is returned.
+        """
+        key = self._key(message)
+        with self._condition:
+            self._received += 1
+            if key in self._pending:
+                pending_message, generation = self._pending[key]
+                self._pending[key] = (
+                    self._merge(pending_message, message) if self._merge else message,
+                    generation,
+                )
+                return []
+            generation = next(self._generations)
+            self._pending[key] = (message, generation)
+            # All the windows have the same duration: the earliest deadline never changes,
+            # and the scheduler doesn't need to be woken up.
+            heapq.heappush(
+                self._deadlines, (time.monotonic() + self._window, generation, key)
+            )
+            if self._scheduler is None:
+                self._scheduler = threading.Thread(
+                    target=self._run_scheduler,
+                    name="pymessagebus-coalescer",
+                    daemon=True,
+                )
+                self._scheduler.start()
+        return []
+
+    def flush(self) -> None:
+        """
+        Dispatches all the pending messages right away, in the current thread.
+        """
+        with self._condition:
+            pending, self._pending = self._pending, {}
+            self._deadlines = []
+            self._dispatched += len(pending)
+            self._condition.notify()
+        for message, _ in pending.values():
+            self._dispatch_safely(message)
+
+    def stats(self) -> CoalescingStats:
+        with self._condition:
+            return CoalescingStats(
+                received=self._received,
+                dispatched=self._dispatched,
+                pending=len(self._pending),
+            )
+
+    def _run_scheduler(self) -> None:
+        while True:
+            with self._condition:
+                if not self._deadlines:
+                    self._scheduler = None
+                    return
+                deadline, generation, key = self._deadlines[0]
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                heapq.heappop(self._deadlines)
+                message, pending_generation = self._pending.get(key, (None, None))
+                if pending_generation != generation:
+                    continue  # already flushed
+                del self._pending[key]
+                self._dispatched += 1
+            self._dispatch_safely(message)
+
+    def _dispatch_safely(self, message: object) -> None:
+        try:
+            self._dispatch(message)
+        except Exception as err:  # pylint: disable=broad-except
+            if self._on_error is None:
+                _logger.exception("Error while handling coalesced message %r", message)
+            else:
+                self._on_error(message, err)
@@ -1,48 +1,220 @@
+import threading
 import typing as t
 
-from ._messagebus import api, MessageBus
+from ._messagebus import (
+    api,
+    BaseMessageBus,
+    BatchDispatchPlan,
+    DispatchPlan,
+    Handlers,
+    MessageBus,
+    Predicates,
+    _handle_by_chunks,
+)
+from ._profiling import Profiler
 
 
-class CommandBus(api.CommandBus):
+class BaseCommandBus:
+    """
+    Handlers registry management, shared by the synchronous `CommandBus` and its
+    `AsyncCommandBus` counterpart: both wrap a message bus, and only the way they
+    handle the commands differs.
+    """
+
+    __slots__ = (
+        "_messagebus",
+        "_dispatch_plans",
+        "_allow_result",
+        "_locking",
+    )
+
     def __init__(
-        self,
-        *,
-        middlewares: t.List[api.Middleware] = None,
-        allow_result: bool = True,
-        locking: bool = True,
+        self, messagebus: BaseMessageBus, *, allow_result: bool, locking: bool
     ) -> None:
-        self._messagebus = MessageBus(middlewares=middlewares)
+        self._messagebus = messagebus
+        # Shared with our message bus, which keeps it up to date:
+        # pylint: disable=protected-access
+        self._dispatch_plans = messagebus._dispatch_plans
         self._allow_result = bool(allow_result)
         self._locking = bool(locking)
-        self._is_processing_a_message = False
 
     def add_handler(self, message_class: type, message_handler: t.Callable) -> None:
-        if self._messagebus.has_handler_for(message_class):
-            raise api.CommandHandlerAlreadyRegisteredForAType(
-                f"A command handler is already registed for message class '{message_class}'."
-            )
-        self._messagebus.add_handler(message_class, message_handler)
+        # pylint: disable=protected-access
+        with self._messagebus._registry_lock:
+            if self._messagebus.has_handler_for(message_class):
+                raise api.CommandHandlerAlreadyRegisteredForAType(
+                    f"A command handler is already registed for message class '{message_class}'."  # pylint: disable=line-too-long
+                )
+            self._messagebus.add_handler(message_class, message_handler)
 
     def remove_handler(self, message_class: type) -> bool:
+        # pylint: disable=protected-access
+        with self._messagebus._registry_lock:
+            if not self._messagebus.has_handler_for(message_class):
+                return False
+            return self._messagebus.remove_handler(
+                message_class, self._messagebus._handlers[message_class][0].handler
+            )
+
+    def add_middleware(self, message_class: type, middleware: t.Callable) -> None:
+        """
+        Adds a middleware which only wraps the handling of the commands of the given class.
+        """
+        self._messagebus.add_middleware(message_class, middleware)
+
+    def remove_middleware(self, message_class: type, middleware: t.Callable) -> bool:
+        return self._messagebus.remove_middleware(message_class, middleware)
+
+    def set_profiler(self, profiler: t.Optional[Profiler]) -> None:
+        self._messagebus.set_profiler(profiler)
+
+    def freeze(self) -> None:
+        """
+        Makes the bus read-only: see `MessageBus.freeze()`.
+        """
+        self._messagebus.freeze()
+
+    @property
+    def frozen(self) -> bool:
+        return self._messagebus.frozen
+
+    def has_handler_for(self, message_class: type) -> bool:
+        return self._messagebus.has_handler_for(message_class)
+
+    def prewarm(self, *message_classes: type) -> None:
+        for message_class in message_classes:
+            self._compile_dispatch_plan(message_class)
+
+    def _compile_dispatch_plan(self, message_class: type) -> DispatchPlan:
         if not self._messagebus.has_handler_for(message_class):
-            return False
-        return self._messagebus.remove_handler(
-            message_class, self._messagebus._handlers[message_class][0]
+            raise api.CommandHandlerNotFound(
+                f"No command handler is registered for message class '{message_class}'."
+            )
+        # pylint: disable=protected-access
+        return self._messagebus._compile_dispatch_plan(message_class)
+
+
+class CommandBus(BaseCommandBus, api.CommandBus):
+    __slots__ = ("_processing_state",)
+
+    _messagebus: "_CommandHandlersBus"
+
+    def __init__(
+        self,
+        *,
+        middlewares: t.List[api.Middleware] = None,
+        allow_result: bool = True,
+        locking: bool = True,
+    ) -> None:
+        super().__init__(
+            _CommandHandlersBus(middlewares=middlewares),
+            allow_result=allow_result,
+            locking=locking,
         )
+        # The locking is scoped to the current thread: a bus shared between threads
+        # can process one message per thread at a time.
+        self._processing_state = _ProcessingState()
 
     def handle(self, message: object) -> t.Any:
-        if not self._messagebus.has_handler_for(message.__class__):
-            raise api.CommandHandlerNotFound(
-                f"No command handler is registered for message class '{message.__class__}'."
-            )
-        if self._locking and self._is_processing_a_message:
+        try:
+            dispatch_plan = self._dispatch_plans[message.__class__]
+        except KeyError:
+            dispatch_plan = self._compile_dispatch_plan(message.__class__)
+
+        if not self._locking:
+            result = dispatch_plan(message)
+            return result if self._allow_result else None
+
+        processing_state = self._processing_state
+        if processing_state.is_processing_a_message:
             raise api.CommandBusAlreadyProcessingAMessage(
                 f"CommandBus already processing a message when received a '{message.__class__}' one."  # pylint: disable=line-too-long
             )
-        self._is_processing_a_message = True
-        result = self._messagebus.handle(message)
-        self._is_processing_a_message = False
-        return result[0] if self._allow_result else None
+        processing_state.is_processing_a_message = True
+        try:
+            result = dispatch_plan(message)
+        finally:
+            processing_state.is_processing_a_message = False
+        return result if self._allow_result else None
 
-    def has_handler_for(self, message_class: type) -> bool:
-        return self._messagebus.has_handler_for(message_class)
+    def handle_many(self, messages: t.Iterable[object]) -> t.List[t.Any]:
+        """
+        Handles a batch of commands, and returns their results in the same order.
+        The existence of a handler is checked for every command before any of them is handled,
+        and the locking (if enabled) covers the whole batch.
+        """
+        messages = list(messages)
+        for message_class in {message.__class__ for message in messages}:
+            if not self._messagebus.has_handler_for(message_class):
+                raise api.CommandHandlerNotFound(
+                    f"No command handler is registered for message class '{message_class}'."
+                )
+        processing_state = self._processing_state
+        if self._locking and processing_state.is_processing_a_message:
+            raise api.CommandBusAlreadyProcessingAMessage(
+                "CommandBus already processing a message when received a batch of messages."
+            )
+        processing_state.is_processing_a_message = True
+        try:
+            results = self._messagebus.handle_many(messages)
+        finally:
+            processing_state.is_processing_a_message = False
+        if not self._allow_result:
+            return [None] * len(results)
+        return results
+
+    def iter_handle_many(
+        self, messages: t.Iterable[object], *, chunk_size: int = 1000
+    ) -> t.Iterator[t.Any]:
+        """
+        Streaming version of `handle_many()`: the commands are consumed lazily, by chunks of
+        `chunk_size` commands, and the results are yielded in input order.
+        """
+        return _handle_by_chunks(self.handle_many, messages, chunk_size)
+
+
+class _CommandHandlersBus(MessageBus):
+    """
+    As a command has one - and only one - handler, we can trigger it directly rather
+    than collecting its result into a list: the result of a dispatch plan is then the result of
+    the command handler itself. Like the MessageBus ones, the CommandBus middlewares still get
+    a list of results from their "next" function - which is thus only built for them.
+    """
+
+    __slots__ = ()
+
+    def _get_handlers_trigger(
+        self, message_class: type, handlers: Handlers, predicates: Predicates
+    ) -> t.Callable[[object], t.Any]:
+        return handlers[0]
+
+    def _wrap_in_middlewares(
+        self, middlewares: t.List[api.Middleware], handlers_trigger: t.Callable
+    ) -> DispatchPlan:
+        def trigger_handler(message: object, unused_next: t.Callable) -> t.List[t.Any]:
+            return [handlers_trigger(message)]
+
+        dispatch_plan = self._get_middlewares_callables_chain(
+            middlewares, trigger_handler
+        )
+
+        def unwrap_result(message: object) -> t.Any:
+            return dispatch_plan(message)[0]
+
+        return unwrap_result
+
+    def _chain_batch_middlewares(
+        self, middlewares: t.List[api.Middleware], handlers_trigger: t.Callable
+    ) -> BatchDispatchPlan:
+        batch_dispatch_plan = super()._chain_batch_middlewares(
+            middlewares, lambda message: [handlers_trigger(message)]
+        )
+
+        def unwrap_results(messages: t.List[object]) -> t.List[t.Any]:
+            return [results[0] for results in batch_dispatch_plan(messages)]
+
+        return unwrap_results
+
+
+class _ProcessingState(threading.local):  # pylint: disable=too-few-public-methods
+    is_processing_a_message = False
@@ -0,0 +1,55 @@
+import contextlib
+import contextvars
+import time
+import typing as t
+
+from . import api
+
+# The deadline of the message being handled, as a `time.monotonic()` timestamp. As it lives
+# in a `contextvars.ContextVar`, the messages sent to the buses while handling a message
+# (and the asyncio Tasks it starts) inherit its remaining time budget.
+_DEADLINE: contextvars.ContextVar[t.Optional[float]] = contextvars.ContextVar(
+    "pymessagebus_deadline", default=None
+)
+
+
+@contextlib.contextmanager
+def deadline(timeout: t.Optional[float]) -> t.Iterator[t.Optional[float]]:
+    """
+    Gives the code of the block at most `timeout` seconds - or less, if the current deadline
+    is closer. Yields the resulting deadline, as a `time.monotonic()` timestamp (or `None` if
+    there is no deadline at all).
+    """
+    current_deadline = _DEADLINE.get()
+    if timeout is None:
+        yield current_deadline
+        return
+    new_deadline = time.monotonic() + timeout
+    if current_deadline is not None and current_deadline < new_deadline:
+        new_deadline = current_deadline
+    token = _DEADLINE.set(new_deadline)
+    try:
+        yield new_deadline
+    finally:
+        _DEADLINE.reset(token)
+
+
+def remaining_time() -> t.Optional[float]:
+    """
+    Returns the number of seconds left before the current deadline (which can be negative
+    if it has been exceeded), or `None` if there is no deadline.
+    """
+    current_deadline = _DEADLINE.get()
+    if current_deadline is None:
+        return None
+    return current_deadline - time.monotonic()
+
+
+def check_deadline() -> None:
+    """
+    Raises a `api.DeadlineExceeded` exception if the current deadline has been exceeded -
+    which allows long-running handlers to give up cooperatively.
+    """
+    current_deadline = _DEADLINE.get()
+    if current_deadline is not None and current_deadline <= time.monotonic():
+        raise api.DeadlineExceeded("The deadline of the message has been exceeded.")
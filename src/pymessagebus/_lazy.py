@@ -0,0 +1,85 @@
+import importlib
+import threading
+import typing as t
+
+from . import api
+
+HandlerLoader = t.Callable[[], t.Callable]
+
+
+class LazyHandler:
+    """
+    A reference to a handler which is only imported (or loaded) when it's needed for the first
+    time - i.e. when the first message of a class it's registered for is handled.
+    The reference is either a "package.module:function" string (where "function" can also be a
+    dotted path, like "Class.method"), or a loader callable which returns the handler.
+    """
+
+    __slots__ = ("reference", "_handler", "_lock")
+
+    def __init__(self, reference: t.Union[str, HandlerLoader]) -> None:
+        if isinstance(reference, str):
+            if reference.count(":") != 1:
+                raise api.MessageHandlerMappingRequiresACallable(
+                    f"A lazy handler reference must be a 'package.module:function' string, got '{reference}'"  # pylint: disable=line-too-long
+                )
+        elif not callable(reference):
+            raise api.MessageHandlerMappingRequiresACallable(
+                f"A lazy handler reference must be a string or a callable, got '{type(reference)}'"
+            )
+        self.reference = reference
+        self._handler: t.Optional[t.Callable] = None
+        self._lock = threading.Lock()
+
+    def resolve(self) -> t.Callable:
+        if self._handler is not None:
+            return self._handler
+        with self._lock:
+            if self._handler is None:
+                handler = (
+                    _import_reference(self.reference)
+                    if isinstance(self.reference, str)
+                    else self.reference()
+                )
+                if not callable(handler):
+                    raise api.MessageHandlerMappingRequiresACallable(
+                        f"Lazy handler '{self.reference}' resolved to a '{type(handler)}', which is not callable"  # pylint: disable=line-too-long
+                    )
+                self._handler = handler
+        return self._handler
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, LazyHandler) and other.reference == self.reference
+
+    def __hash__(self) -> int:
+        return hash(self.reference)
+
+    def __repr__(self) -> str:
+        return f"LazyHandler({self.reference!r})"
+
+
+def as_handler_registration(message_handler: t.Any) -> t.Any:
+    """
+    Handler references given as strings are turned into `LazyHandler` instances.
+    """
+    if isinstance(message_handler, str):
+        return LazyHandler(message_handler)
+    return message_handler
+
+
+def is_valid_handler(message_handler: t.Any) -> bool:
+    return isinstance(message_handler, LazyHandler) or callable(message_handler)
+
+
+def resolve_handler(message_handler: t.Any) -> t.Callable:
+    if isinstance(message_handler, LazyHandler):
+        return message_handler.resolve()
+    return message_handler
+
+
+def _import_reference(reference: str) -> t.Any:
+    module_path, attributes_path = reference.split(":")
+    target: t.Any = importlib.import_module(module_path)
+    for attribute in attributes_path.split("."):
+        target = getattr(target, attribute)
+    return target
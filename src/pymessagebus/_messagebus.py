@@ -1,27 +1,131 @@
-from collections import defaultdict
+import itertools
+import threading
+import types
 import typing as t
 
 from . import api
+from .api import StopPropagation
+from ._coalescing import Coalescer, CoalescingConfig, CoalescingStats
+from ._lazy import as_handler_registration, is_valid_handler, resolve_handler
+from ._parallel import ParallelExecutionConfig, get_parallel_handlers_trigger
+from ._profiling import Profiler, get_frame_name, rename_function
 
+DispatchPlan = t.Callable[[object], t.Any]
+BatchDispatchPlan = t.Callable[[t.List[object]], t.List[t.Any]]
+# The handlers of a message class, by decreasing priority:
+Handlers = t.Tuple[t.Callable, ...]
+Predicate = t.Callable[[object], bool]
+# Either `None`, when none of the handlers has a predicate, or one (optional) predicate per handler:
+Predicates = t.Optional[t.Tuple[t.Optional[Predicate], ...]]
 
-class MessageBus(api.MessageBus):
-    def __init__(self, *, middlewares: t.List[api.Middleware] = None) -> None:
-        self._handlers: t.Dict[type, t.List[t.Callable]] = defaultdict(list)
-        self._middlewares_chain = self._get_middlewares_callables_chain(
-            middlewares, self._trigger_handlers_for_message_as_a_middleware
-        )
 
-    def add_handler(self, message_class: type, message_handler: t.Callable) -> None:
+class _HandlerRegistration(t.NamedTuple):
+    handler: t.Any  # a callable or a `LazyHandler`
+    priority: int
+    predicate: t.Optional[Predicate]
+
+
+class BaseMessageBus:  # pylint: disable=too-many-instance-attributes
+    """
+    Handlers registry and dispatch plans management, shared by the synchronous
+    `MessageBus` and its `AsyncMessageBus` counterpart: only the way the handlers
+    are triggered differs between those two.
+    """
+
+    __slots__ = (
+        "_handlers",
+        "_middlewares",
+        "_middlewares_per_class",
+        "_polymorphic",
+        "_dispatch_plans",
+        "_first_result_dispatch_plans",
+        "_profiler",
+        "_registry_lock",
+        "_registry_version",
+        "_frozen",
+    )
+
+    def __init__(
+        self, *, middlewares: t.List[api.Middleware] = None, polymorphic: bool = False
+    ) -> None:
+        # The registry is "copy-on-write": its mappings are read-only snapshots, which are
+        # replaced by updated copies when the registrations change. The messages can then be
+        # dispatched without any lock, while the changes are serialized by this lock:
+        self._registry_lock = threading.RLock()
+        # ...and bump this version, so that the plans compiled meanwhile are not kept:
+        self._registry_version = 0
+        self._frozen = False
+        # Handlers are stored in tuples, which are only rebuilt when the registrations change -
+        # sorted by decreasing priority, and then by registration order:
+        self._handlers: t.Mapping[
+            type, t.Tuple[_HandlerRegistration, ...]
+        ] = _EMPTY_MAPPING
+        self._middlewares: t.List[api.Middleware] = list(middlewares or [])
+        # Middlewares which only wrap the messages of a given class - inside the bus-wide ones:
+        self._middlewares_per_class: t.Mapping[
+            type, t.Tuple[api.Middleware, ...]
+        ] = _EMPTY_MAPPING
+        # When the bus is "polymorphic", the handlers registered for the parent classes of
+        # a message class (i.e. the classes of its MRO) are triggered as well:
+        self._polymorphic = bool(polymorphic)
+        # Each message class gets its own "dispatch plan", compiled on the first
+        # `handle()` of a message of that class and dropped as soon as its handlers change:
+        self._dispatch_plans: t.Dict[type, DispatchPlan] = {}
+        # ...and another one for `handle_first()`:
+        self._first_result_dispatch_plans: t.Dict[type, DispatchPlan] = {}
+        # Only checked when the dispatch plans are compiled:
+        self._profiler: t.Optional[Profiler] = None
+
+    def add_handler(
+        self,
+        message_class: type,
+        message_handler: t.Callable,
+        *,
+        priority: int = 0,
+        predicate: t.Optional[Predicate] = None,
+    ) -> None:
+        """
+        The handler can also be a lazy reference - either a "package.module:function" string,
+        or a `LazyHandler` instance - which will only be resolved when the first message of this
+        class is handled (or when `prewarm()` is called for this class).
+        Handlers with a higher `priority` are triggered first. When a `predicate` is given, the
+        handler is only triggered for the messages for which it returns `True` - and it doesn't
+        get any slot in the results list for the others.
+        """
         if not isinstance(message_class, type):
             raise api.MessageHandlerMappingRequiresAType(
                 f"add_handler() first argument must be a type, got '{type(message_class)}"
             )
-        if not callable(message_handler):
+        message_handler = as_handler_registration(message_handler)
+        if not is_valid_handler(message_handler):
             raise api.MessageHandlerMappingRequiresACallable(
                 f"add_handler() second argument must be a callable, got '{type(message_handler)}"
             )
 
-        self._handlers[message_class].append(message_handler)
+        if predicate is not None and not callable(predicate):
+            raise api.MessageHandlerMappingRequiresACallable(
+                f"add_handler() predicate must be a callable, got '{type(predicate)}"
+            )
+
+        registration = _HandlerRegistration(message_handler, priority, predicate)
+        with self._registry_lock:
+            self._check_not_frozen("add_handler")
+            registrations = self._handlers.get(message_class, ())
+            # Let's insert the new handler after the ones which have the same or a higher
+            # priority:
+            insertion_index = len(registrations)
+            for index, other_registration in enumerate(registrations):
+                if other_registration.priority < priority:
+                    insertion_index = index
+                    break
+            self._handlers = _copy_with(
+                self._handlers,
+                message_class,
+                registrations[:insertion_index]
+                + (registration,)
+                + registrations[insertion_index:],
+            )
+            self._invalidate_dispatch_plan(message_class)
 
     def remove_handler(self, message_class: type, message_handler: t.Callable) -> bool:
         """
@@ -32,37 +136,321 @@ class MessageBus(api.MessageBus):
             raise api.MessageHandlerMappingRequiresAType(
                 f"add_handler() first argument must be a type, got '{type(message_class)}"
             )
-        if not callable(message_handler):
+        message_handler = as_handler_registration(message_handler)
+        if not is_valid_handler(message_handler):
             raise api.MessageHandlerMappingRequiresACallable(
                 f"add_handler() second argument must be a callable, got '{type(message_handler)}"
             )
-        if message_class not in self._handlers:
-            return False
-        if message_handler not in self._handlers[message_class]:
-            return False
+        with self._registry_lock:
+            self._check_not_frozen("remove_handler")
+            registrations = self._handlers.get(message_class, ())
+            handler_index = next(
+                (
+                    index
+                    for index, registration in enumerate(registrations)
+                    if registration.handler == message_handler
+                ),
+                None,
+            )
+            if handler_index is None:
+                return False
 
-        self._handlers[message_class].remove(message_handler)
+            self._handlers = _copy_with(
+                self._handlers,
+                message_class,
+                registrations[:handler_index] + registrations[handler_index + 1 :],
+            )
+            self._invalidate_dispatch_plan(message_class)
 
-        if len(self._handlers[message_class]) == 0:
-            del self._handlers[message_class]
+        return True
 
+    def add_middleware(self, message_class: type, middleware: api.Middleware) -> None:
+        """
+        Adds a middleware which only wraps the handling of the messages of the given class
+        (and of its subclasses, when the bus is polymorphic), inside the bus-wide middlewares.
+        The other message classes don't pay anything for it.
+        """
+        if not isinstance(message_class, type):
+            raise api.MessageHandlerMappingRequiresAType(
+                f"add_middleware() first argument must be a type, got '{type(message_class)}"
+            )
+        if not callable(middleware):
+            raise api.MessageHandlerMappingRequiresACallable(
+                f"add_middleware() second argument must be a callable, got '{type(middleware)}"
+            )
+        with self._registry_lock:
+            self._check_not_frozen("add_middleware")
+            self._middlewares_per_class = _copy_with(
+                self._middlewares_per_class,
+                message_class,
+                self._middlewares_per_class.get(message_class, ()) + (middleware,),
+            )
+            self._invalidate_dispatch_plan(message_class)
+
+    def remove_middleware(
+        self, message_class: type, middleware: api.Middleware
+    ) -> bool:
+        """
+        Returns `True` if this middleware was added for this message class and removed,
+        `False` otherwise
+        """
+        with self._registry_lock:
+            self._check_not_frozen("remove_middleware")
+            middlewares = self._middlewares_per_class.get(message_class, ())
+            if middleware not in middlewares:
+                return False
+            middlewares_list = list(middlewares)
+            middlewares_list.remove(middleware)
+            self._middlewares_per_class = _copy_with(
+                self._middlewares_per_class, message_class, tuple(middlewares_list)
+            )
+            self._invalidate_dispatch_plan(message_class)
         return True
 
-    def handle(self, message: object) -> t.List[t.Any]:
-        if not self.has_handler_for(message.__class__):
-            return []
-        result = self._middlewares_chain(message)
-        return result
+    def freeze(self) -> None:
+        """
+        Makes the bus read-only, once its startup is done: the lazy handlers are resolved and
+        the dispatch plans of all the registered message classes are compiled right away, and
+        any later change of the handlers or middlewares raises a `api.MessageBusFrozen`
+        exception. Attaching a profiler is still possible.
+        """
+        with self._registry_lock:
+            self._frozen = True
+            self.prewarm(*self._handlers)
+
+    @property
+    def frozen(self) -> bool:
+        return self._frozen
+
+    def set_profiler(self, profiler: t.Optional[Profiler]) -> None:
+        """
+        Recompiles the dispatch plans with timed middleware layers and handlers, which
+        report to the given profiler - or back to the regular ones, with `None`.
+        """
+        with self._registry_lock:
+            self._profiler = profiler
+            self._registry_version += 1
+            for dispatch_plans in self._get_dispatch_plans_caches():
+                dispatch_plans.clear()
+
+    def prewarm(self, *message_classes: type) -> None:
+        """
+        Compiles right away the dispatch plans of the given message classes - resolving
+        their lazy handlers, if any.
+        """
+        for message_class in message_classes:
+            self._compile_dispatch_plan(message_class)
 
     def has_handler_for(self, message_class: type) -> bool:
+        if self._polymorphic:
+            return any(cls in self._handlers for cls in message_class.__mro__)
         return message_class in self._handlers
 
-    def _trigger_handlers_for_message_as_a_middleware(
-        self, message: object, unused_next: t.Callable
-    ) -> t.List[t.Any]:
-        handlers: t.List[t.Callable] = self._handlers[message.__class__]
-        results = [self._trigger_handler(message, handler) for handler in handlers]
-        return results
+    def _compile_dispatch_plan(self, message_class: type) -> DispatchPlan:
+        registry_version = self._registry_version
+        dispatch_plan = self._build_dispatch_plan(message_class)
+        self._cache_dispatch_plan(
+            self._dispatch_plans, message_class, dispatch_plan, registry_version
+        )
+        return dispatch_plan
+
+    def _cache_dispatch_plan(
+        self,
+        dispatch_plans: t.Dict[type, t.Any],
+        message_class: type,
+        dispatch_plan: t.Callable,
+        registry_version: int,
+    ) -> None:
+        dispatch_plans[message_class] = dispatch_plan
+        if self._registry_version != registry_version:
+            # The registry has changed while we were compiling this plan, which may thus be
+            # stale already: it's still used for the current message, but not kept.
+            dispatch_plans.pop(message_class, None)
+
+    def _build_dispatch_plan(self, message_class: type) -> DispatchPlan:
+        """
+        Builds the callable that will process every message of the given class - i.e. the
+        middlewares chain wrapped around a flat loop on the handlers.
+        """
+        handlers, predicates = self._resolve_handlers(message_class)
+        if not handlers:
+            # No handlers means no middlewares either: we just return an empty list
+            return self._get_no_handlers_dispatch_plan()
+        middlewares = self._resolve_middlewares(message_class)
+        get_trigger = lambda handlers: self._get_handlers_trigger(
+            message_class, handlers, predicates
+        )
+        dispatch_plan = self._chain_middlewares(middlewares, get_trigger(handlers))
+        if self._profiler is None:
+            return dispatch_plan
+        return self._profile_dispatch_plan(
+            self._profiler,
+            message_class,
+            dispatch_plan,
+            handlers,
+            middlewares,
+            get_trigger,
+        )
+
+    def _compile_first_result_dispatch_plan(self, message_class: type) -> DispatchPlan:
+        registry_version = self._registry_version
+        handlers, predicates = self._resolve_handlers(message_class)
+        get_trigger = lambda handlers: self._get_first_result_trigger(
+            handlers, predicates
+        )
+        dispatch_plan: DispatchPlan
+        if not handlers:
+            # No handlers means no middlewares either: the trigger just returns `None`
+            dispatch_plan = get_trigger(handlers)
+        else:
+            middlewares = self._resolve_middlewares(message_class)
+            dispatch_plan = self._chain_middlewares(middlewares, get_trigger(handlers))
+            if self._profiler is not None:
+                dispatch_plan = self._profile_dispatch_plan(
+                    self._profiler,
+                    message_class,
+                    dispatch_plan,
+                    handlers,
+                    middlewares,
+                    get_trigger,
+                )
+        self._cache_dispatch_plan(
+            self._first_result_dispatch_plans,
+            message_class,
+            dispatch_plan,
+            registry_version,
+        )
+        return dispatch_plan
+
+    def _chain_middlewares(
+        self, middlewares: t.List[api.Middleware], handlers_trigger: t.Callable
+    ) -> DispatchPlan:
+        if not middlewares:
+            return handlers_trigger
+        return self._wrap_in_middlewares(middlewares, handlers_trigger)
+
+    def _wrap_in_middlewares(
+        self, middlewares: t.List[api.Middleware], handlers_trigger: t.Callable
+    ) -> DispatchPlan:
+        def trigger_handlers(message: object, unused_next: t.Callable) -> t.Any:
+            return handlers_trigger(message)
+
+        return self._get_middlewares_callables_chain(middlewares, trigger_handlers)
+
+    def _profile_dispatch_plan(  # pylint: disable=too-many-arguments
+        self,
+        profiler: Profiler,
+        message_class: type,
+        dispatch_plan: DispatchPlan,
+        handlers: Handlers,
+        middlewares: t.List[api.Middleware],
+        get_trigger: t.Callable[[Handlers], t.Callable],
+    ) -> DispatchPlan:
+        """
+        Builds a profiled version of the given dispatch plan - where the message, each
+        middleware layer and each handler get their own frame - and lets the profiler
+        sample between them.
+        """
+        profiled_middlewares = [
+            self._profile(
+                profiler, middleware, get_frame_name("middleware", middleware)
+            )
+            for middleware in middlewares
+        ]
+        profiled_handlers = self._get_profiled_handlers(
+            profiler, message_class, handlers
+        )
+        profiled_dispatch_plan = self._profile(
+            profiler,
+            self._chain_middlewares(
+                profiled_middlewares, get_trigger(profiled_handlers)
+            ),
+            get_frame_name("message", message_class),
+        )
+        return profiler.get_sampled_dispatch_plan(dispatch_plan, profiled_dispatch_plan)
+
+    def _get_profiled_handlers(
+        self,
+        profiler: Profiler,
+        unused_message_class: type,
+        handlers: Handlers,
+    ) -> Handlers:
+        return tuple(
+            self._profile(profiler, handler, get_frame_name("handler", handler))
+            for handler in handlers
+        )
+
+    @staticmethod
+    def _profile(
+        profiler: Profiler, function: t.Callable, frame_name: str
+    ) -> t.Callable:
+        return profiler.profile(function, frame_name)
+
+    def _resolve_handlers(self, message_class: type) -> t.Tuple[Handlers, Predicates]:
+        registrations: t.Sequence[_HandlerRegistration]
+        all_registrations = self._handlers  # the current snapshot
+        if not self._polymorphic:
+            registrations = all_registrations.get(message_class, ())
+        else:
+            # For a same priority, handlers of the most specific classes come first:
+            registrations = sorted(
+                (
+                    registration
+                    for cls in message_class.__mro__
+                    for registration in all_registrations.get(cls, ())
+                ),
+                key=lambda registration: -registration.priority,
+            )
+        handlers = tuple(resolve_handler(r.handler) for r in registrations)
+        predicates = tuple(r.predicate for r in registrations)
+        if all(predicate is None for predicate in predicates):
+            return handlers, None
+        return handlers, predicates
+
+    def _resolve_middlewares(self, message_class: type) -> t.List[api.Middleware]:
+        middlewares_per_class = self._middlewares_per_class  # the current snapshot
+        if not middlewares_per_class:
+            return self._middlewares
+        classes = message_class.__mro__ if self._polymorphic else (message_class,)
+        # The middlewares of the most generic classes wrap the ones of the most specific classes:
+        return self._middlewares + [
+            middleware
+            for cls in reversed(classes)
+            for middleware in middlewares_per_class.get(cls, ())
+        ]
+
+    def _check_not_frozen(self, method_name: str) -> None:
+        if self._frozen:
+            raise api.MessageBusFrozen(
+                f"{method_name}() can't be called on a frozen bus."
+            )
+
+    def _invalidate_dispatch_plan(self, message_class: type) -> None:
+        # Has to be called - with the registry lock held - once the new registry snapshot
+        # is in place: the plans being compiled from the previous one won't be kept.
+        self._registry_version += 1
+        for dispatch_plans in self._get_dispatch_plans_caches():
+            if self._polymorphic:
+                # The plans of all the subclasses of this message class are now stale too:
+                dispatch_plans.clear()
+            else:
+                dispatch_plans.pop(message_class, None)
+
+    def _get_dispatch_plans_caches(self) -> t.List[t.Dict[type, t.Callable]]:
+        return [self._dispatch_plans, self._first_result_dispatch_plans]
+
+    def _get_handlers_trigger(
+        self, message_class: type, handlers: Handlers, predicates: Predicates
+    ) -> t.Callable:
+        raise NotImplementedError()
+
+    def _get_first_result_trigger(
+        self, handlers: Handlers, predicates: Predicates
+    ) -> t.Callable:
+        raise NotImplementedError()
+
+    def _get_no_handlers_dispatch_plan(self) -> DispatchPlan:
+        raise NotImplementedError()
 
     @staticmethod
     def _get_middlewares_callables_chain(
@@ -80,7 +468,7 @@ class MessageBus(api.MessageBus):
         chain = lambda _: None
 
         for middleware in reversed(all_middlewares):
-            chain = MessageBus._get_middleware_callable_for_middleware(
+            chain = BaseMessageBus._get_middleware_callable_for_middleware(
                 middleware, chain
             )
         return chain
@@ -92,8 +480,353 @@ class MessageBus(api.MessageBus):
         def middleware_callable(message: object):
             return middleware(message, next_middleware)
 
-        return middleware_callable
+        # Each layer is named after its middleware, so that profilers and tracebacks
+        # can tell them apart:
+        middleware_name = getattr(middleware, "__name__", middleware.__class__.__name__)
+        return rename_function(
+            middleware_callable, f"middleware_callable[{middleware_name}]"
+        )
 
-    @staticmethod
-    def _trigger_handler(message: object, handler: t.Callable) -> t.Any:
-        return handler(message)
+
+class MessageBus(BaseMessageBus, api.MessageBus):
+    __slots__ = (
+        "_batch_dispatch_plans",
+        "_parallel_execution",
+        "_parallel_execution_per_class",
+        "_coalescers",
+        "_coalesced_dispatch_plans",
+    )
+
+    def __init__(
+        self,
+        *,
+        middlewares: t.List[api.Middleware] = None,
+        polymorphic: bool = False,
+        parallel_execution: t.Optional[ParallelExecutionConfig] = None,
+    ) -> None:
+        super().__init__(middlewares=middlewares, polymorphic=polymorphic)
+        self._batch_dispatch_plans: t.Dict[type, BatchDispatchPlan] = {}
+        self._parallel_execution = parallel_execution
+        # Copy-on-write too, like the handlers registry:
+        self._parallel_execution_per_class: t.Mapping[
+            type, ParallelExecutionConfig
+        ] = _EMPTY_MAPPING
+        self._coalescers: t.Mapping[type, Coalescer] = _EMPTY_MAPPING
+        # The dispatch plans used when the coalesced messages are eventually handled:
+        self._coalesced_dispatch_plans: t.Dict[type, DispatchPlan] = {}
+
+    def set_parallel_execution(
+        self, message_class: type, config: t.Optional[ParallelExecutionConfig]
+    ) -> None:
+        """
+        Overrides the bus-wide `parallel_execution` option for the given message class.
+        Setting it to `None` makes this message class use the bus-wide option again.
+        """
+        with self._registry_lock:
+            self._check_not_frozen("set_parallel_execution")
+            self._parallel_execution_per_class = _copy_with(
+                self._parallel_execution_per_class, message_class, config
+            )
+            self._invalidate_dispatch_plan(message_class)
+
+    def set_coalescing(
+        self, message_class: type, config: t.Optional[CoalescingConfig]
+    ) -> None:
+        """
+        Enables (or disables, with a `None` config) the coalescing of the messages of the given
+        class: their handling is deferred, and `handle()` returns an empty list for them.
+        When the coalescing of a class is disabled, its pending messages are handled right away.
+        """
+        with self._registry_lock:
+            self._check_not_frozen("set_coalescing")
+            previous_coalescer = self._coalescers.get(message_class)
+            self._coalescers = _copy_with(
+                self._coalescers,
+                message_class,
+                Coalescer(config, self._handle_coalesced)
+                if config is not None
+                else None,
+            )
+            self._invalidate_dispatch_plan(message_class)
+        if previous_coalescer is not None:
+            previous_coalescer.flush()
+
+    def flush_coalesced(self) -> None:
+        """
+        Handles right away all the messages which are waiting for the end of their coalescing
+        window.
+        """
+        for coalescer in self._coalescers.values():
+            coalescer.flush()
+
+    def coalescing_stats(self, message_class: type) -> t.Optional[CoalescingStats]:
+        coalescer = self._coalescers.get(message_class)
+        return coalescer.stats() if coalescer is not None else None
+
+    def handle(self, message: object) -> t.List[t.Any]:
+        try:
+            dispatch_plan = self._dispatch_plans[message.__class__]
+        except KeyError:
+            dispatch_plan = self._compile_dispatch_plan(message.__class__)
+        return dispatch_plan(message)
+
+    def handle_first(self, message: object) -> t.Any:
+        """
+        Triggers the handlers of the message one after another, until one of them returns
+        something else than `None`: this result is returned, and the remaining handlers are
+        not triggered. Returns `None` if no handler returned a result.
+        Coalescing and parallel execution don't apply here.
+        """
+        try:
+            dispatch_plan = self._first_result_dispatch_plans[message.__class__]
+        except KeyError:
+            dispatch_plan = self._compile_first_result_dispatch_plan(message.__class__)
+        return dispatch_plan(message)
+
+    def handle_many(self, messages: t.Iterable[object]) -> t.List[t.List[t.Any]]:
+        """
+        Handles a batch of messages, and returns their results in the same order.
+        Messages are grouped by class, and each group is processed in one go: the messages of a
+        same class are handled in their input order, but the groups are processed one after
+        another - in the order in which their classes first appear in the batch.
+        """
+        messages = list(messages)
+        results: t.List[t.Any] = [None] * len(messages)
+        for message_class, indexes in _group_indexes_by_class(messages).items():
+            try:
+                batch_dispatch_plan = self._batch_dispatch_plans[message_class]
+            except KeyError:
+                batch_dispatch_plan = self._compile_batch_dispatch_plan(message_class)
+            group_results = batch_dispatch_plan([messages[i] for i in indexes])
+            for index, result in zip(indexes, group_results):
+                results[index] = result
+        return results
+
+    def iter_handle_many(
+        self, messages: t.Iterable[object], *, chunk_size: int = 1000
+    ) -> t.Iterator[t.List[t.Any]]:
+        """
+        Streaming version of `handle_many()`: the messages are consumed lazily, by chunks of
+        `chunk_size` messages, and the results are yielded in input order.
+        """
+        return _handle_by_chunks(self.handle_many, messages, chunk_size)
+
+    def _compile_batch_dispatch_plan(self, message_class: type) -> BatchDispatchPlan:
+        registry_version = self._registry_version
+        handlers, predicates = self._resolve_handlers(message_class)
+        middlewares = self._resolve_middlewares(message_class)
+        batch_dispatch_plan: BatchDispatchPlan
+        if (
+            handlers
+            and middlewares
+            and message_class not in self._coalescers
+            and _are_batch_aware(middlewares)
+        ):
+            batch_dispatch_plan = self._chain_batch_middlewares(
+                middlewares,
+                self._get_handlers_trigger(message_class, handlers, predicates),
+            )
+        else:
+            try:
+                dispatch_plan = self._dispatch_plans[message_class]
+            except KeyError:
+                dispatch_plan = self._compile_dispatch_plan(message_class)
+
+            def dispatch_each_message(messages: t.List[object]) -> t.List[t.Any]:
+                return [dispatch_plan(message) for message in messages]
+
+            batch_dispatch_plan = dispatch_each_message
+
+        self._cache_dispatch_plan(
+            self._batch_dispatch_plans,
+            message_class,
+            batch_dispatch_plan,
+            registry_version,
+        )
+        return batch_dispatch_plan
+
+    def _chain_batch_middlewares(
+        self, middlewares: t.List[api.Middleware], handlers_trigger: t.Callable
+    ) -> BatchDispatchPlan:
+        return self._get_middlewares_callables_chain(
+            [middleware.handle_batch for middleware in middlewares],  # type: ignore
+            lambda messages, unused_next: [handlers_trigger(m) for m in messages],
+        )
+
+    def _get_profiled_handlers(
+        self,
+        profiler: Profiler,
+        message_class: type,
+        handlers: Handlers,
+    ) -> Handlers:
+        if (
+            message_class in self._parallel_execution_per_class
+            or self._parallel_execution is not None
+        ):
+            # The handlers run on an executor (maybe in other processes), out of the
+            # context of the message: only the message and the middlewares are profiled.
+            return handlers
+        return super()._get_profiled_handlers(profiler, message_class, handlers)
+
+    def _build_dispatch_plan(self, message_class: type) -> DispatchPlan:
+        coalescer = self._coalescers.get(message_class)
+        if coalescer is not None:
+            return coalescer.push
+        return super()._build_dispatch_plan(message_class)
+
+    def _handle_coalesced(self, message: object) -> t.List[t.Any]:
+        try:
+            dispatch_plan = self._coalesced_dispatch_plans[message.__class__]
+        except KeyError:
+            registry_version = self._registry_version
+            dispatch_plan = super()._build_dispatch_plan(message.__class__)
+            self._cache_dispatch_plan(
+                self._coalesced_dispatch_plans,
+                message.__class__,
+                dispatch_plan,
+                registry_version,
+            )
+        return dispatch_plan(message)
+
+    def _get_dispatch_plans_caches(self) -> t.List[t.Dict[type, t.Callable]]:
+        return super()._get_dispatch_plans_caches() + [
+            self._batch_dispatch_plans,
+            self._coalesced_dispatch_plans,
+        ]
+
+    def _get_handlers_trigger(
+        self, message_class: type, handlers: Handlers, predicates: Predicates
+    ) -> t.Callable[[object], t.List[t.Any]]:
+        parallel_execution = self._parallel_execution_per_class.get(
+            message_class, self._parallel_execution
+        )
+        if parallel_execution is not None:
+            return get_parallel_handlers_trigger(
+                handlers, predicates, parallel_execution
+            )
+
+        if predicates is not None:
+            conditional_handlers = tuple(zip(handlers, predicates))
+
+            def conditional_handlers_trigger(message: object) -> t.List[t.Any]:
+                results = []
+                for handler, predicate in conditional_handlers:
+                    if predicate is not None and not predicate(message):
+                        continue
+                    result = handler(message)
+                    if result.__class__ is StopPropagation:
+                        results.append(result.result)
+                        break
+                    results.append(result)
+                return results
+
+            return conditional_handlers_trigger
+
+        if len(handlers) == 1:
+            handler = handlers[0]
+
+            def single_handler_trigger(message: object) -> t.List[t.Any]:
+                result = handler(message)
+                if result.__class__ is StopPropagation:
+                    return [result.result]
+                return [result]
+
+            return single_handler_trigger
+
+        def handlers_trigger(message: object) -> t.List[t.Any]:
+            results = []
+            for handler in handlers:
+                result = handler(message)
+                if result.__class__ is StopPropagation:
+                    results.append(result.result)
+                    break
+                results.append(result)
+            return results
+
+        return handlers_trigger
+
+    def _get_first_result_trigger(
+        self, handlers: Handlers, predicates: Predicates
+    ) -> t.Callable[[object], t.Any]:
+        conditional_handlers = tuple(
+            zip(handlers, predicates or (None,) * len(handlers))
+        )
+
+        def first_result_trigger(message: object) -> t.Any:
+            for handler, predicate in conditional_handlers:
+                if predicate is not None and not predicate(message):
+                    continue
+                result = handler(message)
+                if result.__class__ is StopPropagation:
+                    return result.result
+                if result is not None:
+                    return result
+            return None
+
+        return first_result_trigger
+
+    def _get_no_handlers_dispatch_plan(self) -> DispatchPlan:
+        return _no_handlers_dispatch_plan
+
+
+def _no_handlers_dispatch_plan(unused_message: object) -> t.List[t.Any]:
+    return []
+
+
+_EMPTY_MAPPING: t.Mapping[t.Any, t.Any] = types.MappingProxyType({})
+
+_V = t.TypeVar("_V")
+
+
+def _copy_with(
+    mapping: t.Mapping[type, _V], key: type, value: t.Optional[_V]
+) -> t.Mapping[type, _V]:
+    """
+    Returns a read-only copy of the given registry mapping, where the given key is bound to
+    the given value - or removed, if the value is empty.
+    """
+    updated_mapping = dict(mapping)
+    if value:
+        updated_mapping[key] = value
+    elif key in updated_mapping:
+        del updated_mapping[key]
+    return types.MappingProxyType(updated_mapping)
+
+
+def _are_batch_aware(middlewares: t.List[api.Middleware]) -> bool:
+    return all(callable(getattr(m, "handle_batch", None)) for m in middlewares)
+
+
+def _group_indexes_by_class(messages: t.List[object]) -> t.Dict[type, t.List[int]]:
+    groups: t.Dict[type, t.List[int]] = {}
+    for index, message in enumerate(messages):
+        try:
+            groups[message.__class__].append(index)
+        except KeyError:
+            groups[message.__class__] = [index]
+    return groups
+
+
+def _handle_by_chunks(
+    handle_many: t.Callable[[t.List[object]], t.List[t.Any]],
+    messages: t.Iterable[object],
+    chunk_size: int,
+) -> t.Iterator[t.Any]:
+    # Not a generator itself, so that an invalid chunk size is reported right away rather
+    # than when the results are first consumed:
+    if chunk_size < 1:
+        raise ValueError(f"The chunk size must be at least 1, got {chunk_size}.")
+    return itertools.chain.from_iterable(
+        map(handle_many, _chunks(messages, chunk_size))
+    )
+
+
+def _chunks(
+    iterable: t.Iterable[object], chunk_size: int
+) -> t.Iterator[t.List[object]]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
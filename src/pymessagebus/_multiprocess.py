@@ -0,0 +1,582 @@
+import concurrent.futures
+import itertools
+import multiprocessing
+import pickle
+import struct
+import sys
+import threading
+import typing as t
+
+from . import api
+from ._deadlines import remaining_time
+from ._lazy import LazyHandler, as_handler_registration, is_valid_handler
+from ._messagebus import MessageBus
+from ._serialization import PickleSerializer
+
+# The positions of the writer and of the reader in the ring buffer. They only ever grow:
+# their difference is the number of bytes which are waiting to be read. The last field is
+# raised by the writer when it waits for the reader to free some room.
+_RING_HEADER = struct.Struct("<QQQ")
+_RING_FIELD = struct.Struct("<Q")
+_WRITE_POSITION_OFFSET = 0
+_READ_POSITION_OFFSET = 8
+_WRITER_WAITING_OFFSET = 16
+# Each frame is prefixed with the size of its payload. A frame never wraps around the end of
+# the ring: the writer skips to its beginning instead, writing a "wrap" marker if there is
+# enough room for it (otherwise the reader knows it has to skip the remaining bytes anyway).
+_FRAME_HEADER = struct.Struct("<I")
+_WRAP_MARKER = 0xFFFFFFFF
+
+_REQUEST_HEADER = struct.Struct("<Q")  # request id
+_RESULT_HEADER = struct.Struct("<QB")  # request id, status
+_RESULT_OK = 0
+_RESULT_FAILED = 1
+# The request id used to stop the workers (and acknowledged by them with the same id):
+_STOP_REQUEST_ID = 0
+
+
+class _RingHandles(t.NamedTuple):
+    """
+    What a process needs to open a ring buffer - and what is sent to the worker processes.
+    """
+
+    memory: t.Any  # a `multiprocessing.shared_memory.SharedMemory`
+    # A `multiprocessing` semaphore counting the frames which are waiting to be read, so that
+    # the reader can block until some are available...
+    items: t.Any
+    # ...and another one, released by the reader when the writer waits for some room:
+    space: t.Any
+
+
+class _RingBuffer:
+    """
+    A single-producer, single-consumer queue of byte frames, in a shared memory block.
+    """
+
+    __slots__ = ("_memory", "_buffer", "_capacity", "_items", "_space")
+
+    def __init__(self, handles: _RingHandles) -> None:
+        self._memory = handles.memory
+        self._buffer = handles.memory.buf
+        self._capacity = handles.memory.size - _RING_HEADER.size
+        self._items = handles.items
+        self._space = handles.space
+
+    def put(self, *payload_parts: bytes, is_reader_alive: t.Callable[[], bool]) -> None:
+        """
+        Blocks until there is enough room in the ring for the frame - or raises a
+        `RuntimeError` if the reader is gone meanwhile.
+        """
+        buffer = self._buffer
+        capacity = self._capacity
+        size = sum(len(part) for part in payload_parts)
+        frame_size = _FRAME_HEADER.size + size
+        if frame_size > capacity // 2:
+            raise api.MessageQueueFull(
+                f"A {size} bytes message cannot fit in a {capacity} bytes ring buffer."
+            )
+        while True:
+            write_position, read_position, _ = _RING_HEADER.unpack_from(buffer)
+            offset = write_position % capacity
+            skipped = capacity - offset if capacity - offset < frame_size else 0
+            if skipped + frame_size <= capacity - (write_position - read_position):
+                break
+            # The reader is late: let's ask it to wake us up once it has freed some room...
+            _RING_FIELD.pack_into(buffer, _WRITER_WAITING_OFFSET, 1)
+            if (
+                _RING_FIELD.unpack_from(buffer, _READ_POSITION_OFFSET)[0]
+                != read_position
+            ):
+                continue  # ...unless it just did
+            # The timeout covers the wake-ups which could be missed in between:
+            if not self._space.acquire(timeout=0.05) and not is_reader_alive():
+                raise RuntimeError("The reader of the ring buffer is gone.")
+
+        if skipped:
+            if skipped >= _FRAME_HEADER.size:
+                _FRAME_HEADER.pack_into(
+                    buffer, _RING_HEADER.size + offset, _WRAP_MARKER
+                )
+            offset = 0
+        position = _RING_HEADER.size + offset
+        _FRAME_HEADER.pack_into(buffer, position, size)
+        position += _FRAME_HEADER.size
+        for part in payload_parts:
+            buffer[position : position + len(part)] = part
+            position += len(part)
+        # Only the writer updates the write position:
+        _RING_FIELD.pack_into(
+            buffer, _WRITE_POSITION_OFFSET, write_position + skipped + frame_size
+        )
+        self._items.release()
+
+    def get(
+        self, decode: t.Callable[[memoryview], t.Any], timeout: t.Optional[float] = None
+    ) -> t.Tuple[bool, t.Any]:
+        """
+        Decodes the next frame right from the shared memory, without copying it first - which is
+        why a decoding function has to be given. Returns `(False, None)` after `timeout` seconds
+        if no frame is available.
+        """
+        if not self._items.acquire(timeout=timeout):
+            return False, None
+        buffer = self._buffer
+        capacity = self._capacity
+        _, read_position, _ = _RING_HEADER.unpack_from(buffer)
+        offset = read_position % capacity
+        if capacity - offset < _FRAME_HEADER.size:
+            read_position += capacity - offset
+            offset = 0
+        else:
+            (size,) = _FRAME_HEADER.unpack_from(buffer, _RING_HEADER.size + offset)
+            if size == _WRAP_MARKER:
+                read_position += capacity - offset
+                offset = 0
+        position = _RING_HEADER.size + offset
+        (size,) = _FRAME_HEADER.unpack_from(buffer, position)
+        position += _FRAME_HEADER.size
+        frame = buffer[position : position + size]
+        try:
+            result = decode(frame)
+        finally:
+            frame.release()
+        # Only the reader updates the read position:
+        _RING_FIELD.pack_into(
+            buffer, _READ_POSITION_OFFSET, read_position + _FRAME_HEADER.size + size
+        )
+        if _RING_FIELD.unpack_from(buffer, _WRITER_WAITING_OFFSET)[0]:
+            _RING_FIELD.pack_into(buffer, _WRITER_WAITING_OFFSET, 0)
+            self._space.release()
+        return True, result
+
+    def release(self) -> None:
+        self._buffer = None
+        self._memory.close()
+
+
+class _Worker(t.NamedTuple):
+    process: t.Any  # a `multiprocessing.Process`
+    requests: _RingBuffer
+    # Held while sending a request - and while stopping to do so:
+    requests_lock: threading.Lock
+    results: _RingBuffer
+    results_thread: threading.Thread
+    memories: t.Tuple[t.Any, ...]
+    # The futures of the requests sent to this worker, by request id:
+    futures: t.Dict[int, concurrent.futures.Future]
+    # Set once the worker doesn't accept requests any more (it's stopped, or dead):
+    gone: threading.Event
+
+
+class ProcessMessageBus(api.MessageBus):  # pylint: disable=too-many-instance-attributes
+    """
+    A MessageBus whose handlers run in a pool of worker processes - which is what CPU-bound
+    handlers need to escape the GIL. Requires Python 3.8+.
+
+    Handlers (and middlewares) are registered before the workers are started, and must be
+    picklable - or be given as "package.module:function" references, which each worker
+    imports. Messages are sent to the workers through shared memory ring buffers, serialized
+    with the given `serializer` (pickle by default - see `SerializerRegistry` for a faster one).
+    The lists of results (which have to be picklable) come back the same way.
+
+    By default, messages are dispatched to the workers in a round-robin way. The messages of
+    a class can also be routed to a given worker, or partitioned by a key: messages with the
+    same key are always handled by the same worker, and therefore in their dispatching order.
+    """
+
+    def __init__(
+        self,
+        *,
+        workers: t.Optional[int] = None,
+        middlewares: t.List[api.Middleware] = None,
+        serializer: t.Any = None,
+        ring_size: int = 1 << 20,
+        mp_context: t.Any = None,
+        timeout: t.Optional[float] = None,
+    ) -> None:
+        self._workers_count = workers or multiprocessing.cpu_count()
+        self._middlewares = list(middlewares or [])
+        self._serializer = serializer or PickleSerializer()
+        self._ring_size = ring_size
+        self._mp_context = mp_context or multiprocessing.get_context()
+        # Maximum number of seconds `handle()` waits for the results of a message:
+        self._timeout = timeout
+        self._handlers: t.Dict[type, t.List[t.Any]] = {}
+        self._routes: t.Dict[type, int] = {}
+        self._partition_keys: t.Dict[type, t.Callable[[object], t.Hashable]] = {}
+        self._round_robin = itertools.count()
+        self._workers: t.List[_Worker] = []
+        self._request_ids = itertools.count(_STOP_REQUEST_ID + 1)
+        # Protects the futures of the workers, the start and the shutdown:
+        self._lock = threading.Lock()
+        self._is_shut_down = False
+
+    def add_handler(self, message_class: type, message_handler: t.Callable) -> None:
+        self._check_not_started()
+        if not isinstance(message_class, type):
+            raise api.MessageHandlerMappingRequiresAType(
+                f"add_handler() first argument must be a type, got '{type(message_class)}"
+            )
+        if not is_valid_handler(as_handler_registration(message_handler)):
+            raise api.MessageHandlerMappingRequiresACallable(
+                f"add_handler() second argument must be a callable, got '{type(message_handler)}"
+            )
+        if isinstance(message_handler, LazyHandler) and isinstance(
+            message_handler.reference, str
+        ):
+            # Lazy handlers are not picklable, but their reference is:
+            message_handler = message_handler.reference
+        self._handlers.setdefault(message_class, []).append(message_handler)
+
+    def remove_handler(self, message_class: type, message_handler: t.Callable) -> bool:
+        self._check_not_started()
+        handlers = self._handlers.get(message_class, [])
+        if message_handler not in handlers:
+            return False
+        handlers.remove(message_handler)
+        if not handlers:
+            del self._handlers[message_class]
+        return True
+
+    def has_handler_for(self, message_class: type) -> bool:
+        return message_class in self._handlers
+
+    def route(self, message_class: type, worker: int) -> None:
+        """
+        All the messages of this class will be handled by the given worker (from 0 to workers - 1).
+        """
+        if not 0 <= worker < self._workers_count:
+            raise ValueError(f"Invalid worker index {worker}.")
+        self._partition_keys.pop(message_class, None)
+        self._routes[message_class] = worker
+
+    def partition_by(
+        self, message_class: type, key: t.Callable[[object], t.Hashable]
+    ) -> None:
+        """
+        The messages of this class which have the same key (e.g. an aggregate id) will be handled
+        by the same worker, in their dispatching order.
+        """
+        self._routes.pop(message_class, None)
+        self._partition_keys[message_class] = key
+
+    def start(self) -> None:
+        """
+        Starts the worker processes - which is done automatically on the first dispatched message.
+        """
+        self._check_not_started()
+        if sys.version_info < (3, 8):
+            raise RuntimeError("The ProcessMessageBus requires Python 3.8+.")
+        # pylint: disable=import-outside-toplevel,no-name-in-module
+        from multiprocessing import shared_memory
+
+        registrations = [
+            (message_class, handler)
+            for message_class, handlers in self._handlers.items()
+            for handler in handlers
+        ]
+        for index in range(self._workers_count):
+            memories = (
+                shared_memory.SharedMemory(create=True, size=self._ring_size),
+                shared_memory.SharedMemory(create=True, size=self._ring_size),
+            )
+            requests, results = [
+                _RingHandles(
+                    memory, self._mp_context.Semaphore(0), self._mp_context.Semaphore(0)
+                )
+                for memory in memories
+            ]
+            for memory in memories:
+                _RING_HEADER.pack_into(memory.buf, 0, 0, 0, 0)
+            process = self._mp_context.Process(
+                target=_worker_main,
+                args=(
+                    requests,
+                    results,
+                    registrations,
+                    self._middlewares,
+                    self._serializer,
+                ),
+                name=f"pymessagebus-process-worker-{index}",
+                daemon=True,
+            )
+            process.start()
+            results_thread = threading.Thread(
+                target=self._collect_results,
+                args=(index,),
+                name=f"pymessagebus-process-results-{index}",
+                daemon=True,
+            )
+            self._workers.append(
+                _Worker(
+                    process=process,
+                    requests=_RingBuffer(requests),
+                    requests_lock=threading.Lock(),
+                    results=_RingBuffer(results),
+                    results_thread=results_thread,
+                    memories=memories,
+                    futures={},
+                    gone=threading.Event(),
+                )
+            )
+        # The threads which collect the results are only started once all the worker
+        # processes have been forked:
+        for worker in self._workers:
+            worker.results_thread.start()
+
+    def dispatch(self, message: object) -> concurrent.futures.Future:
+        """
+        Sends the message to a worker, and returns immediately a `concurrent.futures.Future`
+        which will get the list of the results of its handlers.
+        """
+        if not self._workers:
+            with self._lock:
+                if not self._workers and not self._is_shut_down:
+                    self.start()
+        if self._is_shut_down:
+            raise RuntimeError(
+                "Cannot dispatch a message on a shut down ProcessMessageBus."
+            )
+        worker = self._get_worker(message)
+        payload = self._serializer.dumps(message)
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        future.set_running_or_notify_cancel()
+        request_id = next(self._request_ids)
+        with worker.requests_lock:
+            # Checked with the requests lock held, so that no request can be sent after the
+            # "stop" one - or once the results of the worker are not collected any more:
+            if self._is_shut_down:
+                raise RuntimeError(
+                    "Cannot dispatch a message on a shut down ProcessMessageBus."
+                )
+            if worker.gone.is_set():
+                raise RuntimeError(f"Worker process {worker.process.name} is dead.")
+            with self._lock:
+                worker.futures[request_id] = future
+            try:
+                worker.requests.put(
+                    _REQUEST_HEADER.pack(request_id),
+                    payload,
+                    is_reader_alive=worker.process.is_alive,
+                )
+            except BaseException:
+                with self._lock:
+                    worker.futures.pop(request_id, None)
+                raise
+        return future
+
+    def handle(self, message: object) -> t.List[t.Any]:
+        """
+        Waits for the results at most `timeout` seconds - or until the current deadline, if
+        it comes first (see `deadline()`) - before raising a `api.MessageHandlersTimeout`
+        (or `api.DeadlineExceeded`) exception. The message is still handled by its worker.
+        """
+        future = self.dispatch(message)
+        timeout = self._timeout
+        wait_timeout, error_class = timeout, api.MessageHandlersTimeout
+        remaining = remaining_time()
+        if remaining is not None and (timeout is None or remaining < timeout):
+            wait_timeout, error_class = max(remaining, 0.0), api.DeadlineExceeded
+        try:
+            return future.result(timeout=wait_timeout)
+        except concurrent.futures.TimeoutError:
+            raise error_class(
+                f"The handling of a '{message.__class__}' message did not complete "
+                f"within {wait_timeout}s."
+            ) from None
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stops the workers once the messages already sent to them have been handled, and then
+        releases the shared memory - in a background thread, with `wait=False`.
+        """
+        with self._lock:
+            if self._is_shut_down:
+                return
+            self._is_shut_down = True
+        for worker in self._workers:
+            with worker.requests_lock:
+                if worker.gone.is_set():
+                    continue
+                try:
+                    worker.requests.put(
+                        _REQUEST_HEADER.pack(_STOP_REQUEST_ID),
+                        is_reader_alive=worker.process.is_alive,
+                    )
+                except RuntimeError:
+                    pass  # the worker is dead: its results thread is cleaning up
+        if wait:
+            self._join_workers()
+        else:
+            # Not a daemon thread: the interpreter waits for it before exiting, so that the
+            # shared memory is always released.
+            threading.Thread(
+                target=self._join_workers, name="pymessagebus-process-shutdown"
+            ).start()
+
+    def __enter__(self) -> "ProcessMessageBus":
+        return self
+
+    def __exit__(self, *unused_exc_info) -> None:
+        self.shutdown()
+
+    def _check_not_started(self) -> None:
+        if self._workers or self._is_shut_down:
+            raise RuntimeError(
+                "Handlers must be registered before the ProcessMessageBus is started."
+            )
+
+    def _get_worker(self, message: object) -> _Worker:
+        message_class = message.__class__
+        worker_index = self._routes.get(message_class)
+        if worker_index is not None:
+            return self._workers[worker_index]
+        partition_key = self._partition_keys.get(message_class)
+        if partition_key is not None:
+            return self._workers[hash(partition_key(message)) % self._workers_count]
+        # The dead workers are skipped - unless they are all dead:
+        for _ in range(self._workers_count):
+            worker = self._workers[next(self._round_robin) % self._workers_count]
+            if not worker.gone.is_set():
+                break
+        return worker
+
+    def _join_workers(self) -> None:
+        for worker in self._workers:
+            worker.results_thread.join()
+            worker.process.join()
+
+    def _collect_results(self, worker_index: int) -> None:
+        worker = self._workers[worker_index]
+        try:
+            self._receive_results(worker)
+        finally:
+            with worker.requests_lock:
+                # No more requests can be sent to this worker, and we are the last user of
+                # its shared memory:
+                worker.gone.set()
+                worker.requests.release()
+                worker.results.release()
+                for memory in worker.memories:
+                    memory.unlink()
+            # Only the requests of a dead worker can still be pending at this point:
+            with self._lock:
+                futures = list(worker.futures.values())
+                worker.futures.clear()
+            error = RuntimeError(
+                f"Worker process {worker.process.name} died unexpectedly."
+            )
+            for future in futures:
+                future.set_exception(error)
+
+    def _receive_results(self, worker: _Worker) -> None:
+        while True:
+            received, result = worker.results.get(_decode_result, timeout=0.5)
+            if not received:
+                if worker.process.is_alive():
+                    continue
+                return
+            request_id, status, value = result
+            if request_id == _STOP_REQUEST_ID:
+                return
+            with self._lock:
+                future = worker.futures.pop(request_id, None)
+            if future is None:
+                continue
+            if status == _RESULT_OK:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+
+def _worker_main(
+    requests_handles: _RingHandles,
+    results_handles: _RingHandles,
+    registrations: t.List[t.Tuple[type, t.Any]],
+    middlewares: t.List[api.Middleware],
+    serializer: t.Any,
+) -> None:
+    message_bus = MessageBus(middlewares=middlewares)
+    for message_class, handler in registrations:
+        message_bus.add_handler(message_class, handler)
+    requests = _RingBuffer(requests_handles)
+    results = _RingBuffer(results_handles)
+    try:
+        _serve_requests(message_bus, requests, results, serializer.loads)
+    finally:
+        requests.release()
+        results.release()
+
+
+def _serve_requests(
+    message_bus: MessageBus,
+    requests: _RingBuffer,
+    results: _RingBuffer,
+    loads: t.Callable[[memoryview], t.Any],
+) -> None:
+    # pylint: disable=no-member
+    is_parent_alive = multiprocessing.parent_process().is_alive  # type: ignore
+
+    def decode_request(frame: memoryview) -> t.Tuple[int, t.Any]:
+        (request_id,) = _REQUEST_HEADER.unpack_from(frame)
+        if request_id == _STOP_REQUEST_ID:
+            return request_id, None
+        try:
+            return request_id, loads(frame[_REQUEST_HEADER.size :])
+        except Exception as err:  # pylint: disable=broad-except
+            return request_id, _DecodingError(err)
+
+    while True:
+        received, request = requests.get(decode_request, timeout=1.0)
+        if not received:
+            if is_parent_alive():
+                continue
+            return
+        request_id, message = request
+        if request_id == _STOP_REQUEST_ID:
+            results.put(
+                _RESULT_HEADER.pack(_STOP_REQUEST_ID, _RESULT_OK),
+                is_reader_alive=is_parent_alive,
+            )
+            return
+        status, payload = _handle_request(message_bus, message)
+        try:
+            results.put(
+                _RESULT_HEADER.pack(request_id, status),
+                payload,
+                is_reader_alive=is_parent_alive,
+            )
+        except api.MessageQueueFull as err:
+            results.put(
+                _RESULT_HEADER.pack(request_id, _RESULT_FAILED),
+                _dumps_exception(err),
+                is_reader_alive=is_parent_alive,
+            )
+
+
+def _handle_request(message_bus: MessageBus, message: t.Any) -> t.Tuple[int, bytes]:
+    try:
+        if isinstance(message, _DecodingError):
+            raise message.error
+        result = message_bus.handle(message)
+        return _RESULT_OK, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception as err:  # pylint: disable=broad-except
+        return _RESULT_FAILED, _dumps_exception(err)
+
+
+class _DecodingError(t.NamedTuple):
+    error: Exception
+
+
+def _decode_result(frame: memoryview) -> t.Tuple[int, int, t.Any]:
+    request_id, status = _RESULT_HEADER.unpack_from(frame)
+    if request_id == _STOP_REQUEST_ID:
+        return request_id, status, None
+    return request_id, status, pickle.loads(frame[_RESULT_HEADER.size :])
+
+
+def _dumps_exception(error: Exception) -> bytes:
+    try:
+        return pickle.dumps(error, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:  # pylint: disable=broad-except
+        return pickle.dumps(RuntimeError(repr(error)), protocol=pickle.HIGHEST_PROTOCOL)
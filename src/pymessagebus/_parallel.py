@@ -0,0 +1,80 @@
+import concurrent.futures
+import contextvars
+import typing as t
+
+from . import api
+from ._deadlines import remaining_time
+
+
+class ParallelExecutionConfig(t.NamedTuple):
+    """
+    Makes a MessageBus run the handlers of a same message in parallel, on the given
+    `concurrent.futures` executor (a `ProcessPoolExecutor` requires picklable handlers and
+    messages). On a thread pool, each handler runs in a copy of the dispatching context - so
+    the message deadline and the other context variables are visible to the handlers.
+
+    Results always come in the handlers registration order. All the handlers are waited for,
+    then if some of them raised an exception the first one in registration order is re-raised -
+    unless `return_exceptions` is `True`, in which case exceptions take the place of the results.
+    If the handlers are not all done after `timeout` seconds, the ones which have not been
+    started yet are cancelled and a `api.MessageHandlersTimeout` exception is raised - or a
+    `api.DeadlineExceeded` one, if the deadline of the message (see `deadline()`) comes first.
+    """
+
+    executor: concurrent.futures.Executor
+    timeout: t.Optional[float] = None
+    return_exceptions: bool = False
+
+
+def get_parallel_handlers_trigger(
+    handlers: t.Tuple[t.Callable, ...],
+    predicates: t.Optional[t.Tuple[t.Optional[t.Callable[[object], bool]], ...]],
+    config: ParallelExecutionConfig,
+) -> t.Callable[[object], t.List[t.Any]]:
+    submit = config.executor.submit
+    # Contexts can't be pickled: they are only propagated to the threads.
+    copy_context = (
+        None
+        if isinstance(config.executor, concurrent.futures.ProcessPoolExecutor)
+        else contextvars.copy_context
+    )
+    timeout = config.timeout
+    return_exceptions = config.return_exceptions
+    conditional_handlers = tuple(zip(handlers, predicates or (None,) * len(handlers)))
+
+    def parallel_handlers_trigger(message: object) -> t.List[t.Any]:
+        futures = [
+            submit(handler, message)
+            if copy_context is None
+            else submit(copy_context().run, handler, message)
+            for handler, predicate in conditional_handlers
+            if predicate is None or predicate(message)
+        ]
+        wait_timeout, error_class = timeout, api.MessageHandlersTimeout
+        remaining = remaining_time()
+        if remaining is not None and (timeout is None or remaining < timeout):
+            wait_timeout, error_class = max(remaining, 0.0), api.DeadlineExceeded
+        _, not_done = concurrent.futures.wait(futures, timeout=wait_timeout)
+        if not_done:
+            for future in not_done:
+                future.cancel()
+            raise error_class(
+                f"{len(not_done)} handler(s) out of {len(futures)} did not complete "
+                f"within {wait_timeout}s for message class '{message.__class__}'."
+            )
+        results = []
+        for future in futures:
+            error = future.exception()
+            if error is None:
+                result = future.result()
+                # Handlers are all triggered at once, so `StopPropagation` is only unwrapped:
+                if result.__class__ is api.StopPropagation:
+                    result = result.result
+                results.append(result)
+            elif return_exceptions:
+                results.append(error)
+            else:
+                raise error
+        return results
+
+    return parallel_handlers_trigger
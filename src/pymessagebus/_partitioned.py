@@ -0,0 +1,142 @@
+import asyncio
+import concurrent.futures
+import itertools
+import typing as t
+
+from . import api
+from ._queued import AsyncQueuedBus, QueuedBus, QueueMetrics, QueueOverflowPolicy
+
+PartitionKey = t.Callable[[object], t.Hashable]
+
+
+class _PartitionsRouter:
+    """
+    Picks the lane of a message: the messages of a same class which have the same partition
+    key always go to the same lane, while the messages of the classes without a partition key
+    are spread over the lanes in a round-robin way.
+    """
+
+    __slots__ = ("_lanes_count", "_partition_keys", "_round_robin")
+
+    def __init__(self, lanes_count: int) -> None:
+        if lanes_count < 1:
+            raise ValueError(f"At least one lane is needed, got {lanes_count}.")
+        self._lanes_count = lanes_count
+        self._partition_keys: t.Dict[type, PartitionKey] = {}
+        self._round_robin = itertools.count()
+
+    def set_partition_key(
+        self, message_class: type, key: t.Optional[PartitionKey]
+    ) -> None:
+        if key is None:
+            self._partition_keys.pop(message_class, None)
+        else:
+            self._partition_keys[message_class] = key
+
+    def get_lane_index(self, message: object) -> int:
+        key = self._partition_keys.get(message.__class__)
+        if key is None:
+            return next(self._round_robin) % self._lanes_count
+        return hash(key(message)) % self._lanes_count
+
+
+class PartitionedBus:
+    """
+    Runs the messages sent to a CommandBus (or a MessageBus) on N serial "lanes" - i.e. N
+    single-worker `QueuedBus` - picked according to a partition key per message class (an
+    aggregate id, typically): the messages with the same key are handled one after another,
+    in their dispatching order, while the other ones are handled concurrently.
+    `dispatch(message)` returns immediately a `concurrent.futures.Future`.
+    """
+
+    def __init__(
+        self,
+        bus: t.Union[api.MessageBus, api.CommandBus],
+        *,
+        lanes: int = 8,
+        max_size: int = 1000,
+        overflow: QueueOverflowPolicy = QueueOverflowPolicy.BLOCK,
+        block_timeout: t.Optional[float] = None,
+    ) -> None:
+        """
+        `max_size`, `overflow` and `block_timeout` apply to the queue of each lane.
+        """
+        self._router = _PartitionsRouter(lanes)
+        self._lanes = [
+            QueuedBus(
+                bus,
+                workers=1,
+                max_size=max_size,
+                overflow=overflow,
+                block_timeout=block_timeout,
+            )
+            for _ in range(lanes)
+        ]
+
+    def set_partition_key(
+        self, message_class: type, key: t.Optional[PartitionKey]
+    ) -> None:
+        """
+        Setting it to `None` spreads the messages of this class over the lanes again.
+        """
+        self._router.set_partition_key(message_class, key)
+
+    def dispatch(self, message: object) -> concurrent.futures.Future:
+        return self._lanes[self._router.get_lane_index(message)].dispatch(message)
+
+    def metrics(self) -> t.List[QueueMetrics]:
+        """
+        Returns the metrics of each lane - which makes hot partitions easy to spot.
+        """
+        return [lane.metrics() for lane in self._lanes]
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stops the lanes once the messages already in their queues have been processed.
+        """
+        for lane in self._lanes:
+            lane.shutdown(wait=False)
+        if wait:
+            for lane in self._lanes:
+                lane.shutdown(wait=True)
+
+    def __enter__(self) -> "PartitionedBus":
+        return self
+
+    def __exit__(self, *unused_exc_info) -> None:
+        self.shutdown()
+
+
+class AsyncPartitionedBus:
+    """
+    The asyncio counterpart of `PartitionedBus`, for an AsyncCommandBus or AsyncMessageBus:
+    each lane is a single-Task `AsyncQueuedBus`.
+    """
+
+    def __init__(
+        self,
+        bus: t.Union[api.AsyncMessageBus, api.AsyncCommandBus],
+        *,
+        lanes: int = 8,
+        max_size: int = 1000,
+        overflow: QueueOverflowPolicy = QueueOverflowPolicy.BLOCK,
+    ) -> None:
+        self._router = _PartitionsRouter(lanes)
+        self._lanes = [
+            AsyncQueuedBus(bus, workers=1, max_size=max_size, overflow=overflow)
+            for _ in range(lanes)
+        ]
+
+    def set_partition_key(
+        self, message_class: type, key: t.Optional[PartitionKey]
+    ) -> None:
+        self._router.set_partition_key(message_class, key)
+
+    async def dispatch(self, message: object) -> asyncio.Future:
+        return await self._lanes[self._router.get_lane_index(message)].dispatch(message)
+
+    def metrics(self) -> t.List[QueueMetrics]:
+        return [lane.metrics() for lane in self._lanes]
+
+    async def shutdown(self) -> None:
+        await asyncio.gather(*[lane.shutdown() for lane in self._lanes])
@@ -0,0 +1,215 @@
+import contextvars
+import inspect
+import itertools
+import sys
+import threading
+import time
+import types
+import typing as t
+
+SpanFactory = t.Callable[[str, object], t.ContextManager]
+
+
+class ProfilerConfig(t.NamedTuple):
+    """
+    Only one message out of `sample_every` is profiled - the other ones go through the
+    regular dispatch plans, at no extra cost. The messages handled while a profiled
+    message is being handled are always profiled, so that their frames nest properly.
+    When a `span_factory` is given, each profiled frame is wrapped in the context manager
+    it returns for `(frame_name, message)` - e.g. an OpenTelemetry span:
+    `lambda name, message: tracer.start_as_current_span(name)`.
+    """
+
+    sample_every: int = 1
+    span_factory: t.Optional[SpanFactory] = None
+
+
+class FrameStats(t.NamedTuple):
+    calls: int
+    total_ns: int  # including the time spent in the nested frames
+    self_ns: int  # excluding it
+
+
+class _Frame:  # pylint: disable=too-few-public-methods
+    __slots__ = ("path", "children_ns")
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.children_ns = 0
+
+
+# The frame being profiled - as it lives in a `contextvars.ContextVar`, the frames of the
+# nested messages (and of the concurrent asyncio handlers) are attached to their parent:
+_CURRENT_FRAME: contextvars.ContextVar[t.Optional[_Frame]] = contextvars.ContextVar(
+    "pymessagebus_profiler_frame", default=None
+)
+
+
+class Profiler:
+    """
+    Times each message, each middleware layer and each handler separately - aggregated
+    by stack, i.e. by "message;middleware;...;handler" path. Attach it to a bus with
+    `set_profiler()`: the dispatch plans are then recompiled with timed layers - and
+    recompiled back to the regular ones with `set_profiler(None)`.
+    """
+
+    def __init__(self, config: t.Optional[ProfilerConfig] = None) -> None:
+        # pylint: disable=E1120
+        self._config = config or ProfilerConfig()
+        self._frames: t.Dict[str, t.List[int]] = {}
+        self._lock = threading.Lock()
+
+    def stats(self) -> t.Dict[str, FrameStats]:
+        with self._lock:
+            return {
+                path: FrameStats(*counters) for path, counters in self._frames.items()
+            }
+
+    def collapsed_stacks(self) -> str:
+        """
+        Returns the self time of each stack in the "collapsed" format of Brendan Gregg's
+        `flamegraph.pl` (and of speedscope, inferno...): one "frame;frame;frame <value>" line
+        per stack, the value being a number of microseconds.
+        """
+        lines = [
+            f"{path} {frame_stats.self_ns // 1000}"
+            for path, frame_stats in sorted(self.stats().items())
+        ]
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def reset(self) -> None:
+        with self._lock:
+            self._frames.clear()
+
+    def get_sampled_dispatch_plan(
+        self, dispatch_plan: t.Callable, profiled_dispatch_plan: t.Callable
+    ) -> t.Callable:
+        sample_every = self._config.sample_every
+        if sample_every <= 1:
+            return profiled_dispatch_plan
+        counter = itertools.count()
+        get_current_frame = _CURRENT_FRAME.get
+
+        def sampled_dispatch_plan(message: object) -> t.Any:
+            if next(counter) % sample_every and get_current_frame() is None:
+                return dispatch_plan(message)
+            return profiled_dispatch_plan(message)
+
+        return sampled_dispatch_plan
+
+    def profile(self, function: t.Callable, frame_name: str) -> t.Callable:
+        """
+        Wraps a handler, a middleware or a dispatch plan into a profiled frame.
+        """
+        record = self._record
+        span_factory = self._config.span_factory
+        clock = time.perf_counter_ns
+
+        def profiled_callable(message: object, *args: t.Any) -> t.Any:
+            parent = _CURRENT_FRAME.get()
+            frame = _Frame(
+                frame_name if parent is None else f"{parent.path};{frame_name}"
+            )
+            token = _CURRENT_FRAME.set(frame)
+            start = clock()
+            try:
+                if span_factory is None:
+                    return function(message, *args)
+                with span_factory(frame_name, message):
+                    return function(message, *args)
+            finally:
+                elapsed = clock() - start
+                _CURRENT_FRAME.reset(token)
+                if parent is not None:
+                    parent.children_ns += elapsed
+                record(frame, elapsed)
+
+        return rename_function(profiled_callable, f"profiled[{frame_name}]")
+
+    def profile_async(self, function: t.Callable, frame_name: str) -> t.Callable:
+        """
+        The asyncio version of `profile()`: the wrapped function can either be a coroutine
+        function or a regular callable.
+        """
+        record = self._record
+        span_factory = self._config.span_factory
+        clock = time.perf_counter_ns
+
+        async def profiled_callable(message: object, *args: t.Any) -> t.Any:
+            parent = _CURRENT_FRAME.get()
+            frame = _Frame(
+                frame_name if parent is None else f"{parent.path};{frame_name}"
+            )
+            token = _CURRENT_FRAME.set(frame)
+            start = clock()
+            try:
+                if span_factory is None:
+                    result = function(message, *args)
+                    return (await result) if inspect.isawaitable(result) else result
+                with span_factory(frame_name, message):
+                    result = function(message, *args)
+                    return (await result) if inspect.isawaitable(result) else result
+            finally:
+                elapsed = clock() - start
+                _CURRENT_FRAME.reset(token)
+                if parent is not None:
+                    parent.children_ns += elapsed
+                record(frame, elapsed)
+
+        return rename_function(profiled_callable, f"profiled[{frame_name}]")
+
+    def _record(self, frame: _Frame, elapsed_ns: int) -> None:
+        # Concurrent children can overlap, and take more time than their parent:
+        self_ns = max(elapsed_ns - frame.children_ns, 0)
+        with self._lock:
+            counters = self._frames.get(frame.path)
+            if counters is None:
+                self._frames[frame.path] = [1, elapsed_ns, self_ns]
+            else:
+                counters[0] += 1
+                counters[1] += elapsed_ns
+                counters[2] += self_ns
+
+
+def get_frame_name(kind: str, obj: t.Any) -> str:
+    qualname = getattr(obj, "__qualname__", None) or obj.__class__.__qualname__
+    name = f"{getattr(obj, '__module__', None) or obj.__class__.__module__}.{qualname}"
+    # Semicolons separate the frames of a collapsed stack, and spaces its value:
+    return f"{kind}:{name}".replace(";", ":").replace(" ", "_")
+
+
+def rename_function(function: t.Callable, name: str) -> t.Callable:
+    """
+    Returns a copy of the given function - closure included - whose code object is renamed:
+    that's the name the profilers (cProfile, py-spy...) and the tracebacks display.
+    """
+    function = t.cast(types.FunctionType, function)
+    code = function.__code__
+    if sys.version_info >= (3, 11):
+        code = code.replace(co_name=name, co_qualname=name)
+    elif sys.version_info >= (3, 8):
+        code = code.replace(co_name=name)
+    else:
+        code = types.CodeType(
+            code.co_argcount,
+            code.co_kwonlyargcount,
+            code.co_nlocals,
+            code.co_stacksize,
+            code.co_flags,
+            code.co_code,
+            code.co_consts,
+            code.co_names,
+            code.co_varnames,
+            code.co_filename,
+            name,
+            code.co_firstlineno,
+            code.co_lnotab,
+            code.co_freevars,
+            code.co_cellvars,
+        )
+    renamed = types.FunctionType(
+        code, function.__globals__, name, function.__defaults__, function.__closure__
+    )
+    renamed.__qualname__ = name
+    renamed.__kwdefaults__ = function.__kwdefaults__
+    return renamed
@@ -0,0 +1,305 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import enum
+import queue
+import threading
+import time
+import typing as t
+
+from . import api
+
+
+class QueueOverflowPolicy(enum.Enum):
+    BLOCK = "block"  # the caller waits for some room in the queue
+    RAISE = "raise"  # a `api.MessageQueueFull` exception is raised
+    SHED = "shed"  # the message is dropped, and the returned future is cancelled
+
+
+class QueueMetrics(t.NamedTuple):
+    depth: int
+    max_size: int
+    enqueued: int
+    processed: int
+    failed: int
+    shed: int
+    total_wait_time: float
+    max_wait_time: float
+
+    @property
+    def mean_wait_time(self) -> float:
+        return self.total_wait_time / self.processed if self.processed else 0.0
+
+
+class _MetricsRecorder:
+    """
+    Counters shared by the queued buses. Wait times are measured between the moment a
+    message is put in the queue and the moment a worker starts processing it.
+    """
+
+    __slots__ = (
+        "_lock",
+        "enqueued",
+        "processed",
+        "failed",
+        "shed",
+        "total_wait_time",
+        "max_wait_time",
+    )
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.shed = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def record_enqueued(self) -> None:
+        with self._lock:
+            self.enqueued += 1
+
+    def record_shed(self) -> None:
+        with self._lock:
+            self.shed += 1
+
+    def record_processed(self, wait_time: float, failed: bool) -> None:
+        with self._lock:
+            self.processed += 1
+            if failed:
+                self.failed += 1
+            self.total_wait_time += wait_time
+            if wait_time > self.max_wait_time:
+                self.max_wait_time = wait_time
+
+    def snapshot(self, depth: int, max_size: int) -> QueueMetrics:
+        with self._lock:
+            return QueueMetrics(
+                depth=depth,
+                max_size=max_size,
+                enqueued=self.enqueued,
+                processed=self.processed,
+                failed=self.failed,
+                shed=self.shed,
+                total_wait_time=self.total_wait_time,
+                max_wait_time=self.max_wait_time,
+            )
+
+
+_STOP = object()
+
+
+class QueuedBus:  # pylint: disable=too-many-instance-attributes
+    """
+    Puts the messages sent to a MessageBus or CommandBus on a bounded in-process queue,
+    drained by a pool of worker threads which send them to the wrapped bus (and therefore
+    through its Middlewares chain).
+    `dispatch(message)` returns immediately a `concurrent.futures.Future`, which will get the
+    result of the bus `handle(message)` call.
+    """
+
+    def __init__(
+        self,
+        bus: t.Union[api.MessageBus, api.CommandBus],
+        *,
+        workers: int = 1,
+        max_size: int = 1000,
+        overflow: QueueOverflowPolicy = QueueOverflowPolicy.BLOCK,
+        block_timeout: t.Optional[float] = None,
+    ) -> None:
+        self._bus = bus
+        self._max_size = max_size
+        self._overflow = overflow
+        self._block_timeout = block_timeout
+        self._queue: queue.Queue = queue.Queue(maxsize=max_size)
+        self._metrics = _MetricsRecorder()
+        self._is_shut_down = False
+        # `shutdown()` waits for the ongoing `dispatch()` calls before sending the workers
+        # the `_STOP` markers, so that no message can be enqueued behind them:
+        self._dispatching = threading.Condition()
+        self._ongoing_dispatches = 0
+        self._workers = [
+            threading.Thread(
+                target=self._worker, name=f"pymessagebus-queue-worker-{i}", daemon=True
+            )
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def dispatch(self, message: object) -> concurrent.futures.Future:
+        with self._dispatching:
+            if self._is_shut_down:
+                raise RuntimeError(
+                    "Cannot dispatch a message on a shut down QueuedBus."
+                )
+            self._ongoing_dispatches += 1
+        try:
+            return self._enqueue(message)
+        finally:
+            with self._dispatching:
+                self._ongoing_dispatches -= 1
+                if not self._ongoing_dispatches:
+                    self._dispatching.notify_all()
+
+    def metrics(self) -> QueueMetrics:
+        return self._metrics.snapshot(self._queue.qsize(), self._max_size)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stops the workers once the messages already in the queue have been processed.
+        Can be called again - with `wait=True` - to wait for the workers of a bus which was
+        shut down without waiting.
+        """
+        with self._dispatching:
+            stop_workers = not self._is_shut_down
+            self._is_shut_down = True
+            self._dispatching.wait_for(lambda: not self._ongoing_dispatches)
+        if stop_workers:
+            for _ in self._workers:
+                self._queue.put(_STOP)
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def __enter__(self) -> "QueuedBus":
+        return self
+
+    def __exit__(self, *unused_exc_info) -> None:
+        self.shutdown()
+
+    def _enqueue(self, message: object) -> concurrent.futures.Future:
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        item = (message, future, time.monotonic())
+        try:
+            if self._overflow is QueueOverflowPolicy.BLOCK:
+                self._queue.put(item, timeout=self._block_timeout)
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full as err:
+            if self._overflow is QueueOverflowPolicy.SHED:
+                self._metrics.record_shed()
+                future.cancel()
+                return future
+            raise api.MessageQueueFull(
+                f"The queue is full ({self._max_size} messages) when received a '{message.__class__}' one."  # pylint: disable=line-too-long
+            ) from err
+        self._metrics.record_enqueued()
+        return future
+
+    def _worker(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            message, future, enqueued_at = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            wait_time = time.monotonic() - enqueued_at
+            try:
+                result = self._bus.handle(message)
+            except BaseException as err:  # pylint: disable=broad-except
+                self._metrics.record_processed(wait_time, failed=True)
+                future.set_exception(err)
+            else:
+                self._metrics.record_processed(wait_time, failed=False)
+                future.set_result(result)
+
+
+class AsyncQueuedBus:
+    """
+    The asyncio counterpart of `QueuedBus`, for an AsyncMessageBus or AsyncCommandBus:
+    the queue is drained by a pool of asyncio Tasks, started on the first dispatched message.
+    Each message is handled in a copy of the `contextvars` context of its `dispatch()` call.
+    """
+
+    def __init__(
+        self,
+        bus: t.Union[api.AsyncMessageBus, api.AsyncCommandBus],
+        *,
+        workers: int = 1,
+        max_size: int = 1000,
+        overflow: QueueOverflowPolicy = QueueOverflowPolicy.BLOCK,
+    ) -> None:
+        self._bus = bus
+        self._workers_count = workers
+        self._max_size = max_size
+        self._overflow = overflow
+        self._queue: t.Optional[asyncio.Queue] = None
+        self._workers: t.List[asyncio.Task] = []
+        self._metrics = _MetricsRecorder()
+
+    async def dispatch(self, message: object) -> asyncio.Future:
+        if self._queue is None:
+            self._start()
+        queue_ = t.cast(asyncio.Queue, self._queue)
+        future = asyncio.get_running_loop().create_future()
+        item = (message, future, time.monotonic(), contextvars.copy_context())
+        if self._overflow is QueueOverflowPolicy.BLOCK:
+            await queue_.put(item)
+        else:
+            try:
+                queue_.put_nowait(item)
+            except asyncio.QueueFull as err:
+                if self._overflow is QueueOverflowPolicy.SHED:
+                    self._metrics.record_shed()
+                    future.cancel()
+                    return future
+                raise api.MessageQueueFull(
+                    f"The queue is full ({self._max_size} messages) when received a '{message.__class__}' one."  # pylint: disable=line-too-long
+                ) from err
+        self._metrics.record_enqueued()
+        return future
+
+    def metrics(self) -> QueueMetrics:
+        depth = self._queue.qsize() if self._queue is not None else 0
+        return self._metrics.snapshot(depth, self._max_size)
+
+    async def shutdown(self) -> None:
+        """
+        Stops the workers once the messages already in the queue have been processed.
+        """
+        if self._queue is None:
+            return
+        await self._queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    def _start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self._max_size)
+        loop = asyncio.get_running_loop()
+        # The workers Tasks would otherwise inherit the context of the first `dispatch()`:
+        context = contextvars.Context()
+        self._workers = [
+            context.run(loop.create_task, self._worker(self._queue))
+            for _ in range(self._workers_count)
+        ]
+
+    async def _worker(self, queue_: asyncio.Queue) -> None:
+        while True:
+            message, future, enqueued_at, context = await queue_.get()
+            try:
+                if future.cancelled():
+                    continue
+                wait_time = time.monotonic() - enqueued_at
+                try:
+                    result = await context.run(
+                        asyncio.ensure_future, self._bus.handle(message)
+                    )
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                except Exception as err:  # pylint: disable=broad-except
+                    self._metrics.record_processed(wait_time, failed=True)
+                    if not future.cancelled():
+                        future.set_exception(err)
+                else:
+                    self._metrics.record_processed(wait_time, failed=False)
+                    if not future.cancelled():
+                        future.set_result(result)
+            finally:
+                queue_.task_done()
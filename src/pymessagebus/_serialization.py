@@ -0,0 +1,315 @@
+import dataclasses
+import operator
+import pickle
+import struct
+import typing as t
+
+from . import api
+
+Buffer = t.Union[bytes, bytearray, memoryview]
+
+# Every serialized message starts with a header made of its class id and version:
+_HEADER_FORMAT = "<HH"
+_HEADER = struct.Struct(_HEADER_FORMAT)
+
+# The `struct` formats of the supported field types. `str` and `bytes` values have
+# a variable size: only their length is stored in the fixed-size part of the message,
+# and their content comes after it.
+_FIXED_SIZE_FORMATS = {int: "q", float: "d", bool: "?"}
+_VARIABLE_SIZE_TYPES = (str, bytes)
+_NONE_VALUES = {int: 0, float: 0.0, bool: False, str: "", bytes: b""}
+
+
+class _Field(t.NamedTuple):
+    type_: type
+    optional: bool
+
+
+class _Codec(t.NamedTuple):
+    encode: t.Callable[[object], bytes]
+    decode: t.Callable[[Buffer], object]
+
+
+class PickleSerializer:
+    """
+    The default serializer of the outbox and of the multi-process bus. Any object with the
+    same `dumps(message) -> bytes` and `loads(data) -> object` methods can be used instead.
+    """
+
+    __slots__ = ("protocol",)
+
+    def __init__(self, protocol: int = pickle.HIGHEST_PROTOCOL) -> None:
+        self.protocol = protocol
+
+    def dumps(self, message: object) -> bytes:
+        return pickle.dumps(message, protocol=self.protocol)
+
+    @staticmethod
+    def loads(data: Buffer) -> object:
+        return pickle.loads(data)
+
+
+class SerializerRegistry:
+    """
+    A compact binary serializer for NamedTuple and dataclass messages, whose codecs are
+    generated from the annotations of their fields (`int`, `float`, `bool`, `str`, `bytes`,
+    and `t.Optional` versions of those).
+
+    Each message class is registered with a class id and a version, which are written in the
+    header of its serialized messages: the ids and versions must therefore be the same in all
+    the processes that exchange messages. The older versions of a message class can be kept
+    registered (with the legacy class they were decoded to) so that the messages serialized
+    before a change of its fields can still be decoded.
+
+    Its `dumps()` / `loads()` methods make it usable as the serializer of the outbox middleware.
+    """
+
+    __slots__ = ("_encoders", "_decoders")
+
+    def __init__(self) -> None:
+        # Message class -> (version, codec) of its latest registered version:
+        self._encoders: t.Dict[type, t.Tuple[int, _Codec]] = {}
+        # (class id, version) -> (message class, codec):
+        self._decoders: t.Dict[t.Tuple[int, int], t.Tuple[type, _Codec]] = {}
+
+    def register(self, message_class: type, class_id: int, *, version: int = 1) -> None:
+        if not 0 <= class_id <= 0xFFFF or not 0 <= version <= 0xFFFF:
+            raise api.MessageSerializationError(
+                f"Class ids and versions must be between 0 and 65535, got {class_id} and {version}."  # pylint: disable=line-too-long
+            )
+        registered_class, _ = self._decoders.get((class_id, version), (None, None))
+        if registered_class is not None and registered_class is not message_class:
+            raise api.MessageSerializationError(
+                f"Class id {class_id} (version {version}) is already registered for '{registered_class}'."  # pylint: disable=line-too-long
+            )
+        codec = _build_codec(message_class, class_id, version)
+        self._decoders[(class_id, version)] = (message_class, codec)
+        latest_version, _ = self._encoders.get(message_class, (-1, None))
+        if version > latest_version:
+            self._encoders[message_class] = (version, codec)
+
+    def class_ids(self) -> t.Dict[t.Tuple[int, int], type]:
+        """
+        Returns the (class id, version) -> message class table of this registry.
+        """
+        return {
+            key: message_class for key, (message_class, _) in self._decoders.items()
+        }
+
+    def dumps(self, message: object) -> bytes:
+        try:
+            _, codec = self._encoders[message.__class__]
+        except KeyError:
+            raise api.MessageSerializationError(
+                f"No serializer registered for message class '{message.__class__}'."
+            ) from None
+        return codec.encode(message)
+
+    def loads(self, data: Buffer) -> object:
+        """
+        `data` can be a `memoryview`: the message fields are decoded straight from it,
+        without copying the buffer first.
+        """
+        try:
+            class_id, version = _HEADER.unpack_from(data)
+            _, codec = self._decoders[(class_id, version)]
+        except (KeyError, struct.error):
+            raise api.MessageSerializationError(
+                "Unknown or invalid serialized message header."
+            ) from None
+        try:
+            return codec.decode(data)
+        except struct.error as err:
+            raise api.MessageSerializationError(
+                "Truncated serialized message."
+            ) from err
+
+
+def _build_codec(message_class: type, class_id: int, version: int) -> _Codec:
+    field_names, fields = _get_fields(message_class)
+    # Messages which only have non-optional, fixed-size fields are (de)serialized with
+    # a single `struct` call:
+    if all(f.type_ in _FIXED_SIZE_FORMATS and not f.optional for f in fields):
+        codec_builder = _build_fixed_size_codec
+    else:
+        codec_builder = _build_variable_size_codec
+    return codec_builder(message_class, class_id, version, field_names, fields)
+
+
+def _build_fixed_size_codec(
+    message_class: type,
+    class_id: int,
+    version: int,
+    field_names: t.Tuple[str, ...],
+    fields: t.Tuple[_Field, ...],
+) -> _Codec:
+    message_struct = struct.Struct(
+        _HEADER_FORMAT + "".join(_FIXED_SIZE_FORMATS[f.type_] for f in fields)
+    )
+    pack = message_struct.pack
+    unpack_from = message_struct.unpack_from
+    get_values = _get_values_getter(message_class, field_names)
+
+    def encode(message: object) -> bytes:
+        try:
+            return pack(class_id, version, *get_values(message))
+        except struct.error as err:
+            raise api.MessageSerializationError(str(err)) from err
+
+    def decode(data: Buffer) -> object:
+        return message_class(*unpack_from(data)[2:])
+
+    return _Codec(encode, decode)
+
+
+def _build_variable_size_codec(
+    message_class: type,
+    class_id: int,
+    version: int,
+    field_names: t.Tuple[str, ...],
+    fields: t.Tuple[_Field, ...],
+) -> _Codec:
+    # As for `collections.namedtuple()` or `dataclasses`, the source code of the encoding
+    # and decoding functions is generated from the fields - so that they don't have to loop
+    # over them and check their types for every message.
+    fixed_size_format, encode_source = _get_encode_source(class_id, version, fields)
+    fixed_size_struct = struct.Struct(fixed_size_format)
+    decode_source = _get_decode_source(fields, fixed_size_struct.size)
+    namespace = {
+        "api": api,
+        "struct": struct,
+        "get_values": _get_values_getter(message_class, field_names),
+        "pack": fixed_size_struct.pack,
+        "unpack_from": fixed_size_struct.unpack_from,
+        "message_class": message_class,
+    }
+    source = "\n".join(encode_source + decode_source)
+    exec(source, namespace)  # pylint: disable=exec-used
+    return _Codec(
+        t.cast(t.Callable[[object], bytes], namespace["encode"]),
+        t.cast(t.Callable[[Buffer], object], namespace["decode"]),
+    )
+
+
+def _get_encode_source(
+    class_id: int, version: int, fields: t.Tuple[_Field, ...]
+) -> t.Tuple[str, t.List[str]]:
+    """
+    Returns the `struct` format of the fixed-size part of the messages, and the source code
+    of their `encode()` function.
+    """
+    fixed_size_format = _HEADER_FORMAT
+    encode_lines = []
+    fixed_size_values = []
+    variable_size_values = []
+    for index, field in enumerate(fields):
+        value = f"values[{index}]"
+        if field.optional:
+            fixed_size_format += "?"
+            fixed_size_values.append(f"{value} is not None")
+            encode_lines.append(
+                f"v{index} = {_NONE_VALUES[field.type_]!r} if {value} is None else {value}"
+            )
+            value = f"v{index}"
+        if field.type_ in _VARIABLE_SIZE_TYPES:
+            fixed_size_format += "I"
+            if field.type_ is str:
+                encode_lines.append(f"v{index} = {value}.encode('utf-8')")
+                value = f"v{index}"
+            fixed_size_values.append(f"len({value})")
+            variable_size_values.append(value)
+        else:
+            fixed_size_format += _FIXED_SIZE_FORMATS[field.type_]
+            fixed_size_values.append(value)
+    return fixed_size_format, [
+        "def encode(message):",
+        "    values = get_values(message)",
+        *(f"    {line}" for line in encode_lines),
+        "    try:",
+        f"        fixed_size_part = pack({class_id}, {version}, {', '.join(fixed_size_values)})",  # pylint: disable=line-too-long
+        "    except struct.error as err:",
+        "        raise api.MessageSerializationError(str(err)) from err",
+        f"    return b''.join((fixed_size_part, {', '.join(variable_size_values)}))",
+    ]
+
+
+def _get_decode_source(fields: t.Tuple[_Field, ...], fixed_size: int) -> t.List[str]:
+    """
+    Returns the source code of the `decode()` function of the messages.
+    """
+    unpacked_names = ["_", "_"]
+    variable_sizes = [str(fixed_size)]
+    decode_lines = []
+    decoded_values = []
+    for index, field in enumerate(fields):
+        if field.optional:
+            unpacked_names.append(f"p{index}")
+        unpacked_names.append(f"f{index}")
+
+        decoded_value = f"f{index}"
+        if field.type_ in _VARIABLE_SIZE_TYPES:
+            variable_sizes.append(f"f{index}")
+            decode_lines.append(f"end = offset + f{index}")
+            if field.type_ is str:
+                decode_lines.append(f"f{index} = str(view[offset:end], 'utf-8')")
+            else:
+                decode_lines.append(f"f{index} = view[offset:end].tobytes()")
+            decode_lines.append("offset = end")
+        if field.optional:
+            decoded_value = f"(f{index} if p{index} else None)"
+        decoded_values.append(decoded_value)
+    return [
+        "def decode(data):",
+        "    view = memoryview(data)",
+        f"    {', '.join(unpacked_names)}, = unpack_from(view)",
+        # The slices of the variable-size values would be silently cut short otherwise:
+        f"    if {' + '.join(variable_sizes)} > len(view):",
+        "        raise api.MessageSerializationError('Truncated serialized message.')",
+        f"    offset = {fixed_size}",
+        *(f"    {line}" for line in decode_lines),
+        f"    return message_class({', '.join(decoded_values)})",
+    ]
+
+
+def _get_fields(
+    message_class: type,
+) -> t.Tuple[t.Tuple[str, ...], t.Tuple[_Field, ...]]:
+    if issubclass(message_class, tuple) and hasattr(message_class, "_fields"):
+        field_names = tuple(message_class._fields)  # type: ignore
+    elif dataclasses.is_dataclass(message_class):
+        field_names = tuple(f.name for f in dataclasses.fields(message_class) if f.init)
+    else:
+        raise api.MessageSerializationError(
+            f"Only NamedTuple and dataclass messages can be serialized, got '{message_class}'."  # pylint: disable=line-too-long
+        )
+    type_hints = t.get_type_hints(message_class)
+    fields = []
+    for field_name in field_names:
+        type_hint = type_hints.get(field_name)
+        optional = False
+        # `t.Optional[X]` is `t.Union[X, None]`:
+        if getattr(type_hint, "__origin__", None) is t.Union:
+            union_members = type_hint.__args__  # type: ignore
+            if len(union_members) == 2 and type(None) in union_members:
+                type_hint = [m for m in union_members if m is not type(None)][0]
+                optional = True
+        if type_hint not in _NONE_VALUES:
+            raise api.MessageSerializationError(
+                f"Field '{field_name}' of message class '{message_class}' has an unsupported type: {type_hint}."  # pylint: disable=line-too-long
+            )
+        fields.append(_Field(type_hint, optional))
+    return field_names, tuple(fields)
+
+
+def _get_values_getter(
+    message_class: type, field_names: t.Tuple[str, ...]
+) -> t.Callable[[object], t.Sequence[t.Any]]:
+    if issubclass(message_class, tuple):
+        # NamedTuples already are the sequence of their values:
+        return lambda message: message  # type: ignore
+    if len(field_names) == 1:
+        getter = operator.attrgetter(field_names[0])
+        return lambda message: (getter(message),)
+    if not field_names:
+        return lambda message: ()
+    return operator.attrgetter(*field_names)
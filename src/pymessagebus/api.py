@@ -4,8 +4,35 @@ import typing as t
 CallNextMiddleware = t.Callable[[object], t.Any]
 Middleware = t.Callable[[object, CallNextMiddleware], t.Any]
 
+# A Middleware can opt into batch processing (see `MessageBus.handle_many()`) by exposing a
+# `handle_batch(messages: t.List[object], next_batch: CallNextBatchMiddleware)` method,
+# which has to return a list of results in the same order as the messages:
+CallNextBatchMiddleware = t.Callable[[t.List[object]], t.List[t.Any]]
+BatchMiddleware = t.Callable[[t.List[object], CallNextBatchMiddleware], t.List[t.Any]]
+
+AsyncCallNextMiddleware = t.Callable[[object], t.Awaitable[t.Any]]
+AsyncMiddleware = t.Callable[[object, AsyncCallNextMiddleware], t.Awaitable[t.Any]]
+
+
+class StopPropagation:  # pylint: disable=too-few-public-methods
+    """
+    A MessageBus handler can return its result wrapped in a `StopPropagation`, so that the
+    next handlers of the message are not triggered. The bus unwraps it: only `result` ends up
+    in the list of results.
+    """
+
+    __slots__ = ("result",)
+
+    def __init__(self, result: t.Any = None) -> None:
+        self.result = result
+
+    def __repr__(self) -> str:
+        return f"StopPropagation({self.result!r})"
+
 
 class MessageBus(ABC):
+    __slots__ = ()
+
     @abstractmethod
     def add_handler(self, message_class: type, message_handler: t.Callable) -> None:
         pass
@@ -24,6 +51,8 @@ class MessageBus(ABC):
 
 
 class CommandBus(ABC):
+    __slots__ = ()
+
     @abstractmethod
     def add_handler(self, message_class: type, message_handler: t.Callable) -> None:
         pass
@@ -41,6 +70,46 @@ class CommandBus(ABC):
         pass
 
 
+class AsyncMessageBus(ABC):
+    __slots__ = ()
+
+    @abstractmethod
+    def add_handler(self, message_class: type, message_handler: t.Callable) -> None:
+        pass
+
+    @abstractmethod
+    def remove_handler(self, message_class: type, message_handler: t.Callable) -> bool:
+        pass
+
+    @abstractmethod
+    async def handle(self, message: object) -> t.List[t.Any]:
+        pass
+
+    @abstractmethod
+    def has_handler_for(self, message_class: type) -> bool:
+        pass
+
+
+class AsyncCommandBus(ABC):
+    __slots__ = ()
+
+    @abstractmethod
+    def add_handler(self, message_class: type, message_handler: t.Callable) -> None:
+        pass
+
+    @abstractmethod
+    def remove_handler(self, message_class: type) -> bool:
+        pass
+
+    @abstractmethod
+    async def handle(self, message: object) -> None:
+        pass
+
+    @abstractmethod
+    def has_handler_for(self, message_class: type) -> bool:
+        pass
+
+
 class MessageBusError(Exception, ABC):
     pass
 
@@ -63,3 +132,27 @@ class CommandHandlerAlreadyRegisteredForAType(MessageBusError):
 
 class CommandBusAlreadyProcessingAMessage(MessageBusError):
     pass
+
+
+class MessageHandlersTimeout(MessageBusError):
+    pass
+
+
+class DeadlineExceeded(MessageHandlersTimeout):
+    pass
+
+
+class MessageQueueFull(MessageBusError):
+    pass
+
+
+class MessageSerializationError(MessageBusError):
+    pass
+
+
+class CircuitBreakerOpen(MessageBusError):
+    pass
+
+
+class MessageBusFrozen(MessageBusError):
+    pass
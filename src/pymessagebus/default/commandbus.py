@@ -20,3 +20,4 @@ def register_handler(message_class: type):
 add_handler = _DEFAULT_COMMAND_BUS.add_handler
 handle = _DEFAULT_COMMAND_BUS.handle
 has_handler_for = _DEFAULT_COMMAND_BUS.has_handler_for
+prewarm = _DEFAULT_COMMAND_BUS.prewarm
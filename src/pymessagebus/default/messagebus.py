@@ -19,4 +19,6 @@ def register_handler(message_class: type):
 # pylint: disable=invalid-name
 add_handler = _DEFAULT_MESSAGE_BUS.add_handler
 handle = _DEFAULT_MESSAGE_BUS.handle
+handle_first = _DEFAULT_MESSAGE_BUS.handle_first
 has_handler_for = _DEFAULT_MESSAGE_BUS.has_handler_for
+prewarm = _DEFAULT_MESSAGE_BUS.prewarm
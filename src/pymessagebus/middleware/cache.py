@@ -0,0 +1,151 @@
+from collections import OrderedDict
+import threading
+import time
+import typing as t
+
+# pylint: disable=too-few-public-methods
+
+
+class CacheMiddlewareConfig(t.NamedTuple):
+    # Only the messages of those classes get their results cached. They must be immutable
+    # and hashable (NamedTuples, frozen dataclasses...), as they are used as cache keys:
+    cached_message_classes: t.Tuple[type, ...]
+    # Maximum number of cached results - the least recently used ones are evicted first:
+    max_entries: int = 1024
+    # Number of seconds after which a cached result expires (`None` for no expiration):
+    ttl: t.Optional[float] = None
+    # Maps message classes (typically commands) to the cached classes whose results
+    # must be dropped when a message of that class is handled by the bus:
+    invalidated_by: t.Optional[t.Mapping[type, t.Tuple[type, ...]]] = None
+
+
+class CacheStats(t.NamedTuple):
+    size: int
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class QueryCache:  # pylint: disable=too-many-instance-attributes
+    def __init__(self, config: CacheMiddlewareConfig) -> None:
+        self._config = config
+        self._cached_message_classes = frozenset(config.cached_message_classes)
+        # Bumped each time the results of a class are invalidated: a result computed from
+        # data read before an invalidation must not be cached after it.
+        self._generations = dict.fromkeys(self._cached_message_classes, 0)
+        self._entries: "OrderedDict[t.Tuple[type, object], t.Tuple[float, t.Any]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                size=len(self._entries),
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                invalidations=self._invalidations,
+            )
+
+    def invalidate(self, message_classes: t.Iterable[type]) -> None:
+        message_classes = frozenset(message_classes)
+        with self._lock:
+            for message_class in message_classes & self._cached_message_classes:
+                self._generations[message_class] += 1
+            stale_keys = [key for key in self._entries if key[0] in message_classes]
+            for key in stale_keys:
+                del self._entries[key]
+            self._invalidations += len(stale_keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            for message_class in self._generations:
+                self._generations[message_class] += 1
+            self._entries.clear()
+
+    def is_cached_class(self, message_class: type) -> bool:
+        return message_class in self._cached_message_classes
+
+    def get_generation(self, message_class: type) -> int:
+        """
+        To be called before handling a message, and given to `set()` with its result.
+        """
+        return self._generations[message_class]
+
+    def get(self, message: object) -> t.Tuple[bool, t.Any]:
+        key = (message.__class__, message)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, result = entry
+                if expires_at >= time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return True, result
+                del self._entries[key]
+            self._misses += 1
+            return False, None
+
+    def set(
+        self, message: object, result: t.Any, generation: t.Optional[int] = None
+    ) -> None:
+        """
+        Caches the result of the message - unless the results of its class were invalidated
+        since `generation` was taken.
+        """
+        ttl = self._config.ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else float("inf")
+        # NamedTuples of different classes with the same values are equal,
+        # so the message class has to be part of the cache key:
+        key = (message.__class__, message)
+        with self._lock:
+            if (
+                generation is not None
+                and generation != self._generations[message.__class__]
+            ):
+                return
+            self._entries[key] = (expires_at, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._config.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+
+def get_cache_middleware(cache: QueryCache) -> t.Callable:
+    # pylint: disable=protected-access
+    invalidated_by = cache._config.invalidated_by or {}
+
+    def cache_middleware(message: object, next_: t.Callable) -> object:
+        message_class = message.__class__
+        if cache.is_cached_class(message_class):
+            try:
+                found, result = cache.get(message)
+            except TypeError:  # unhashable message: let's not cache it
+                return next_(message)
+            if found:
+                return result
+            generation = cache.get_generation(message_class)
+            result = next_(message)
+            cache.set(message, result, generation)
+            return result
+
+        stale_classes = invalidated_by.get(message_class)
+        if stale_classes is None:
+            return next_(message)
+        try:
+            return next_(message)
+        finally:
+            cache.invalidate(stale_classes)
+
+    return cache_middleware
@@ -0,0 +1,308 @@
+import asyncio
+import collections
+import enum
+import functools
+import itertools
+import threading
+import time
+import typing as t
+
+from .. import api
+
+# pylint: disable=too-few-public-methods
+
+
+# A message class - or a handler wrapped with `with_circuit_breaker()`:
+CircuitKey = t.Union[type, t.Callable]
+
+
+class CircuitState(enum.Enum):
+    CLOSED = "closed"  # messages are handled
+    OPEN = "open"  # messages are rejected straight away
+    # A few trial messages are handled, to check if it's working again:
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreakerConfig(t.NamedTuple):
+    # The circuit of a message class opens when the failure rate of its last
+    # `window_size` messages reaches this threshold - once at least `minimum_calls`
+    # messages were handled:
+    failure_rate_threshold: float = 0.5
+    window_size: int = 100
+    minimum_calls: int = 20
+    # Number of seconds during which an open circuit rejects the messages, before
+    # letting `half_open_max_calls` trial messages through:
+    open_duration: float = 30.0
+    half_open_max_calls: int = 1
+    # Only those exceptions count as failures:
+    counted_exceptions: t.Tuple[t.Type[BaseException], ...] = (Exception,)
+    # The message classes protected by a circuit (`None` for all of them):
+    message_classes: t.Optional[t.Tuple[type, ...]] = None
+
+
+class CircuitStats(t.NamedTuple):
+    state: CircuitState
+    calls: int
+    failures: int
+    rejected: int
+    opened: int  # number of times the circuit has been opened
+
+    @property
+    def failure_rate(self) -> float:
+        return self.failures / self.calls if self.calls else 0.0
+
+
+class _Circuit:  # pylint: disable=too-many-instance-attributes
+    __slots__ = (
+        "state",
+        "generation",
+        "outcomes",
+        "window_failures",
+        "opened_at",
+        "half_open_calls",
+        "calls",
+        "failures",
+        "rejected",
+        "opened",
+    )
+
+    def __init__(self, window_size: int, generation: int) -> None:
+        self.state = CircuitState.CLOSED
+        # Changes at each state transition: the outcomes of the messages let through during
+        # a previous generation are not taken into account any more.
+        self.generation = generation
+        # The outcomes (`True` for a failure) of the last messages:
+        self.outcomes: t.Deque[bool] = collections.deque(maxlen=window_size)
+        self.window_failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+
+
+class CircuitBreaker:
+    """
+    Holds one circuit per message class, shared by the (synchronous and async) circuit
+    breaker middlewares. As a middleware wraps the handling of a message by all its
+    handlers, that's one circuit per handler on a CommandBus - but on a MessageBus, the
+    failures of any of the handlers of a message class count for its circuit: the handlers
+    wrapped with `with_circuit_breaker()` get their own circuit instead, keyed by handler.
+    """
+
+    def __init__(self, config: t.Optional[CircuitBreakerConfig] = None) -> None:
+        # pylint: disable=E1120
+        self._config = config or CircuitBreakerConfig()
+        self._message_classes = (
+            frozenset(self._config.message_classes)
+            if self._config.message_classes is not None
+            else None
+        )
+        self._circuits: t.Dict[CircuitKey, _Circuit] = {}
+        self._generations = itertools.count()
+        self._lock = threading.Lock()
+
+    def is_protected_class(self, message_class: type) -> bool:
+        return self._message_classes is None or message_class in self._message_classes
+
+    def stats(self, key: CircuitKey) -> CircuitStats:
+        """
+        Returns the stats of the circuit of a message class - or of a handler wrapped
+        with `with_circuit_breaker()`.
+        """
+        with self._lock:
+            circuit = self._get_circuit(key)
+            self._refresh_state(circuit)
+            return CircuitStats(
+                state=circuit.state,
+                calls=circuit.calls,
+                failures=circuit.failures,
+                rejected=circuit.rejected,
+                opened=circuit.opened,
+            )
+
+    def all_stats(self) -> t.Dict[CircuitKey, CircuitStats]:
+        with self._lock:
+            keys = list(self._circuits)
+        return {key: self.stats(key) for key in keys}
+
+    def reset(self, key: CircuitKey) -> None:
+        """
+        Closes the circuit of this message class (or handler), and forgets its recent failures.
+        """
+        with self._lock:
+            self._circuits.pop(key, None)
+
+    def call(self, key: CircuitKey, function: t.Callable, message: object) -> t.Any:
+        """
+        Calls `function(message)` through the circuit of the given key.
+        """
+        token = self.before_call(key)
+        try:
+            result = function(message)
+        except Exception as err:
+            self.record(key, token, err)
+            raise
+        except BaseException:  # e.g. a `KeyboardInterrupt`: not an outcome
+            self.release(key, token)
+            raise
+        self.record(key, token, None)
+        return result
+
+    async def call_async(
+        self, key: CircuitKey, function: t.Callable, message: object
+    ) -> t.Any:
+        token = self.before_call(key)
+        try:
+            result = await function(message)
+        # (`asyncio.CancelledError` is an `Exception` on Python 3.7)
+        except asyncio.CancelledError:
+            self.release(key, token)
+            raise
+        except Exception as err:
+            self.record(key, token, err)
+            raise
+        except BaseException:
+            self.release(key, token)
+            raise
+        self.record(key, token, None)
+        return result
+
+    def before_call(self, key: CircuitKey) -> int:
+        """
+        Raises a `api.CircuitBreakerOpen` exception if the message must not be handled.
+        Otherwise, returns the token to give back to `record()` - or to `release()`, if the
+        message handling has no outcome (e.g. it was cancelled).
+        """
+        with self._lock:
+            circuit = self._get_circuit(key)
+            self._refresh_state(circuit)
+            if circuit.state is CircuitState.CLOSED:
+                return circuit.generation
+            if (
+                circuit.state is CircuitState.HALF_OPEN
+                and circuit.half_open_calls < self._config.half_open_max_calls
+            ):
+                circuit.half_open_calls += 1
+                return circuit.generation
+            circuit.rejected += 1
+        raise api.CircuitBreakerOpen(f"The circuit of {_describe(key)} is open.")
+
+    def record(
+        self, key: CircuitKey, token: int, error: t.Optional[BaseException]
+    ) -> None:
+        failed = error is not None and isinstance(
+            error, self._config.counted_exceptions
+        )
+        config = self._config
+        with self._lock:
+            circuit = self._get_circuit(key)
+            circuit.calls += 1
+            if failed:
+                circuit.failures += 1
+            if token != circuit.generation:
+                # Let through before the latest state transition: only counted in the stats
+                return
+            if circuit.state is CircuitState.HALF_OPEN:
+                circuit.half_open_calls -= 1
+                if failed:
+                    self._open(circuit)
+                elif circuit.half_open_calls <= 0:
+                    # The trial messages succeeded: back to normal
+                    circuit.state = CircuitState.CLOSED
+                    circuit.generation = next(self._generations)
+                    circuit.outcomes.clear()
+                    circuit.window_failures = 0
+                return
+            if len(circuit.outcomes) == circuit.outcomes.maxlen:
+                circuit.window_failures -= circuit.outcomes[0]
+            circuit.outcomes.append(failed)
+            circuit.window_failures += failed
+            if (
+                len(circuit.outcomes) >= config.minimum_calls
+                and circuit.window_failures / len(circuit.outcomes)
+                >= config.failure_rate_threshold
+            ):
+                self._open(circuit)
+
+    def release(self, key: CircuitKey, token: int) -> None:
+        """
+        Gives back the trial slot of a message whose handling has no outcome.
+        """
+        with self._lock:
+            circuit = self._get_circuit(key)
+            if token == circuit.generation and circuit.state is CircuitState.HALF_OPEN:
+                circuit.half_open_calls -= 1
+
+    def _get_circuit(self, key: CircuitKey) -> _Circuit:
+        circuit = self._circuits.get(key)
+        if circuit is None:
+            circuit = self._circuits[key] = _Circuit(
+                self._config.window_size, next(self._generations)
+            )
+        return circuit
+
+    def _refresh_state(self, circuit: _Circuit) -> None:
+        if (
+            circuit.state is CircuitState.OPEN
+            and time.monotonic() - circuit.opened_at >= self._config.open_duration
+        ):
+            circuit.state = CircuitState.HALF_OPEN
+            circuit.generation = next(self._generations)
+            circuit.half_open_calls = 0
+
+    def _open(self, circuit: _Circuit) -> None:
+        circuit.state = CircuitState.OPEN
+        circuit.generation = next(self._generations)
+        circuit.opened_at = time.monotonic()
+        circuit.opened += 1
+        circuit.outcomes.clear()
+        circuit.window_failures = 0
+
+
+def get_circuit_breaker_middleware(breaker: CircuitBreaker) -> t.Callable:
+    def circuit_breaker_middleware(message: object, next_: t.Callable) -> object:
+        message_class = message.__class__
+        if not breaker.is_protected_class(message_class):
+            return next_(message)
+        return breaker.call(message_class, next_, message)
+
+    return circuit_breaker_middleware
+
+
+def get_async_circuit_breaker_middleware(breaker: CircuitBreaker) -> t.Callable:
+    async def circuit_breaker_middleware(message: object, next_: t.Callable) -> object:
+        message_class = message.__class__
+        if not breaker.is_protected_class(message_class):
+            return await next_(message)
+        return await breaker.call_async(message_class, next_, message)
+
+    return circuit_breaker_middleware
+
+
+def with_circuit_breaker(handler: t.Callable, breaker: CircuitBreaker) -> t.Callable:
+    """
+    Wraps a single handler into its own circuit: on a MessageBus, its failures don't open
+    the circuit of the other handlers of the message. `breaker.stats(handler)` returns the
+    stats of that circuit.
+    """
+    if asyncio.iscoroutinefunction(handler):
+
+        @functools.wraps(handler)
+        async def async_handler_with_circuit_breaker(message: object) -> t.Any:
+            return await breaker.call_async(handler, handler, message)
+
+        return async_handler_with_circuit_breaker
+
+    @functools.wraps(handler)
+    def handler_with_circuit_breaker(message: object) -> t.Any:
+        return breaker.call(handler, handler, message)
+
+    return handler_with_circuit_breaker
+
+
+def _describe(key: CircuitKey) -> str:
+    if isinstance(key, type):
+        return f"message class '{key}'"
+    return f"handler '{getattr(key, '__qualname__', key)}'"
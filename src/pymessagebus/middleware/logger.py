@@ -1,5 +1,7 @@
+import itertools
 import typing as t
 import logging
+import time
 
 # Heavily inspired by the Tactician Logger Middleware :-)
 # @link https://github.com/thephpleague/tactician-logger
@@ -11,6 +13,16 @@ class LoggingMiddlewareConfig(t.NamedTuple):
     mgs_received_level: int = logging.DEBUG
     mgs_succeeded_level: int = logging.DEBUG
     mgs_failed_level: int = logging.ERROR
+    # Only 1 out of N successfully handled messages is logged:
+    mgs_succeeded_sample_rate: int = 1
+    # Adds `message_class`, `duration` (in seconds) and `handler_count` attributes
+    # to the log records, for structured logging formatters:
+    structured: bool = False
+
+
+MSG_RECEIVED = "Message received: %s"
+MSG_SUCCEEDED = "Message succeeded: %s"
+MSG_FAILED = "Message failed: %s"
 
 
 def get_logger_middleware(
@@ -18,27 +30,66 @@ def get_logger_middleware(
 ) -> t.Callable:
     # pylint: disable=E1120
     middleware_config: LoggingMiddlewareConfig = config or LoggingMiddlewareConfig()
+    received_level = middleware_config.mgs_received_level
+    succeeded_level = middleware_config.mgs_succeeded_level
+    failed_level = middleware_config.mgs_failed_level
+    sample_rate = max(1, middleware_config.mgs_succeeded_sample_rate)
+    structured = middleware_config.structured
+    # `itertools.count()` is thread-safe, unlike a `+= 1` on an integer:
+    successes_counter = itertools.count()
+
+    # Log messages use deferred %-style arguments, so that they're only formatted if
+    # a log handler actually processes them - and `logger.isEnabledFor()` (whose result is
+    # cached by the `logging` module until the loggers configuration changes) allows us to skip
+    # all the logging work when the levels we use are disabled.
 
     def logger_middleware(message: object, next_: t.Callable) -> object:
         message_type = type(message)
+        received_enabled = logger.isEnabledFor(received_level)
+        succeeded_enabled = logger.isEnabledFor(succeeded_level)
 
-        logger.log(
-            middleware_config.mgs_received_level, f"Message received: ${message_type}"
-        )
+        if received_enabled:
+            logger.log(
+                received_level,
+                MSG_RECEIVED,
+                message_type,
+                extra={"message_class": message_type} if structured else None,
+            )
 
+        start = time.perf_counter() if structured else 0.0
         try:
             result = next_(message)
         except Exception as err:
-            logger.log(
-                middleware_config.mgs_failed_level,
-                f"Message failed: ${message_type}",
-                exc_info=True,
-            )
+            if logger.isEnabledFor(failed_level):
+                logger.log(
+                    failed_level,
+                    MSG_FAILED,
+                    message_type,
+                    exc_info=True,
+                    extra={
+                        "message_class": message_type,
+                        "duration": time.perf_counter() - start,
+                    }
+                    if structured
+                    else None,
+                )
             raise err
 
-        logger.log(
-            middleware_config.mgs_succeeded_level, f"Message succeeded: ${message_type}"
-        )
+        if succeeded_enabled and (
+            sample_rate == 1 or next(successes_counter) % sample_rate == 0
+        ):
+            logger.log(
+                succeeded_level,
+                MSG_SUCCEEDED,
+                message_type,
+                extra={
+                    "message_class": message_type,
+                    "duration": time.perf_counter() - start,
+                    "handler_count": len(result) if isinstance(result, list) else 1,
+                }
+                if structured
+                else None,
+            )
 
         return result
 
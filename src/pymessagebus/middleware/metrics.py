@@ -0,0 +1,294 @@
+import bisect
+import functools
+import threading
+import time
+import typing as t
+
+# pylint: disable=too-few-public-methods
+
+# Upper bounds of the latency histograms buckets, in nanoseconds: from 1µs to 10s.
+DEFAULT_BUCKETS_NS: t.Tuple[int, ...] = tuple(
+    int(base * 10 ** exponent) for exponent in range(3, 10) for base in (1, 2.5, 5)
+) + (10 ** 10,)
+
+
+class HistogramSnapshot(t.NamedTuple):
+    buckets_ns: t.Tuple[int, ...]
+    # `counts[i]` is the number of observations lower or equal to `buckets_ns[i]` (and greater
+    # than the previous bucket bound); the extra last item counts the ones above all the bounds.
+    counts: t.Tuple[int, ...]
+    total: int  # the number of observations
+    sum_ns: int
+    errors: int
+
+    @property
+    def mean_ns(self) -> float:
+        return self.sum_ns / self.total if self.total else 0.0
+
+    def percentile_ns(self, ratio: float) -> float:
+        """
+        Returns the upper bound of the bucket in which the given percentile falls
+        (`float("inf")` if it's above the highest bucket bound).
+        """
+        if not self.total:
+            return 0.0
+        rank = ratio * self.total
+        cumulated = 0
+        for bucket_bound, bucket_count in zip(self.buckets_ns, self.counts):
+            cumulated += bucket_count
+            if cumulated >= rank:
+                return float(bucket_bound)
+        return float("inf")
+
+
+class MetricsSnapshot(t.NamedTuple):
+    elapsed_seconds: float
+    # keys are the message classes qualified names - the histograms of the classes, or
+    # handlers, which share a qualified name are merged:
+    messages: t.Dict[str, HistogramSnapshot]
+    # keys are the handlers qualified names:
+    handlers: t.Dict[str, HistogramSnapshot]
+
+    def throughput(self, message_class_name: str) -> float:
+        """
+        Average number of messages of the given class handled per second since the recorder
+        creation.
+        """
+        histogram = self.messages.get(message_class_name)
+        if not histogram or not self.elapsed_seconds:
+            return 0.0
+        return histogram.total / self.elapsed_seconds
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum_ns", "errors")
+
+    def __init__(self, buckets_count: int) -> None:
+        self.counts = [0] * (buckets_count + 1)
+        self.sum_ns = 0
+        self.errors = 0
+
+
+class MetricsRecorder:
+    def __init__(self, buckets_ns: t.Sequence[int] = DEFAULT_BUCKETS_NS) -> None:
+        self._buckets_ns = tuple(sorted(buckets_ns))
+        # Each thread records in its own histograms, so that no lock is needed on the hot path:
+        # the histograms of all the threads are only merged when a snapshot is taken.
+        self._shard = threading.local()
+        self._all_shards: t.Dict[threading.Thread, t.Tuple[dict, dict]] = {}
+        # The shards of the threads which ended are folded in there, so that they don't pile up
+        # on the servers which start a thread per request:
+        self._ended_threads_shard: t.Tuple[dict, dict] = ({}, {})
+        self._all_shards_lock = threading.Lock()
+        self._started_at = time.monotonic()
+
+    def record_message(
+        self, message_class: type, elapsed_ns: int, failed: bool
+    ) -> None:
+        histogram = self._get_message_histogram(message_class)
+        histogram.counts[bisect.bisect_left(self._buckets_ns, elapsed_ns)] += 1
+        histogram.sum_ns += elapsed_ns
+        if failed:
+            histogram.errors += 1
+
+    def record_handler(
+        self, handler: t.Callable, elapsed_ns: int, failed: bool
+    ) -> None:
+        try:
+            histograms = self._shard.handlers
+        except AttributeError:
+            histograms = self._init_shard().handlers
+        histogram = histograms.get(handler)
+        if histogram is None:
+            histogram = histograms[handler] = _Histogram(len(self._buckets_ns))
+        histogram.counts[bisect.bisect_left(self._buckets_ns, elapsed_ns)] += 1
+        histogram.sum_ns += elapsed_ns
+        if failed:
+            histogram.errors += 1
+
+    def instrument_handler(self, handler: t.Callable) -> t.Callable:
+        """
+        Returns a wrapped version of the given handler, which records its own latency -
+        to be registered on the bus in place of the original handler.
+        """
+        record = self.record_handler
+        clock = time.perf_counter_ns
+
+        @functools.wraps(handler)
+        def instrumented_handler(message: object) -> t.Any:
+            start = clock()
+            try:
+                result = handler(message)
+            except BaseException:
+                record(handler, clock() - start, True)
+                raise
+            record(handler, clock() - start, False)
+            return result
+
+        return instrumented_handler
+
+    def snapshot(self) -> MetricsSnapshot:
+        messages: t.Dict[str, _Histogram] = {}
+        handlers: t.Dict[str, _Histogram] = {}
+        with self._all_shards_lock:
+            self._fold_ended_threads_shards()
+            # (the ended threads shard is updated under the lock, so it's merged there too)
+            self._merge(messages, self._ended_threads_shard[0])
+            self._merge(handlers, self._ended_threads_shard[1])
+            shards = list(self._all_shards.values())
+        for shard_messages, shard_handlers in shards:
+            self._merge(messages, shard_messages)
+            self._merge(handlers, shard_handlers)
+        return MetricsSnapshot(
+            elapsed_seconds=time.monotonic() - self._started_at,
+            messages={
+                name: self._histogram_snapshot(histogram)
+                for name, histogram in messages.items()
+            },
+            handlers={
+                name: self._histogram_snapshot(histogram)
+                for name, histogram in handlers.items()
+            },
+        )
+
+    def _get_message_histogram(self, message_class: type) -> _Histogram:
+        try:
+            histograms = self._shard.messages
+        except AttributeError:
+            histograms = self._init_shard().messages
+        histogram = histograms.get(message_class)
+        if histogram is None:
+            histogram = histograms[message_class] = _Histogram(len(self._buckets_ns))
+        return histogram
+
+    def _init_shard(self) -> threading.local:
+        shard = self._shard
+        shard.messages = {}
+        shard.handlers = {}
+        with self._all_shards_lock:
+            self._fold_ended_threads_shards()
+            self._all_shards[threading.current_thread()] = (
+                shard.messages,
+                shard.handlers,
+            )
+        return shard
+
+    def _fold_ended_threads_shards(self) -> None:
+        # Must be called with `_all_shards_lock` held. An ended thread won't record anything
+        # anymore, so its histograms can safely be read from here:
+        ended_threads = [thread for thread in self._all_shards if not thread.is_alive()]
+        ended_messages, ended_handlers = self._ended_threads_shard
+        for thread in ended_threads:
+            shard_messages, shard_handlers = self._all_shards.pop(thread)
+            self._merge(ended_messages, shard_messages, by_qualified_name=False)
+            self._merge(ended_handlers, shard_handlers, by_qualified_name=False)
+
+    def _merge(
+        self,
+        target: t.Dict[t.Any, _Histogram],
+        source: t.Dict[t.Any, _Histogram],
+        by_qualified_name: bool = True,
+    ) -> None:
+        # The source histograms are keyed by message class or handler, the target ones by
+        # qualified name - several handlers can share one, e.g. lambdas or closures:
+        for source_key, histogram in list(source.items()):
+            target_key = (
+                _qualified_name(source_key) if by_qualified_name else source_key
+            )
+            merged = target.get(target_key)
+            if merged is None:
+                merged = target[target_key] = _Histogram(len(self._buckets_ns))
+            merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+            merged.sum_ns += histogram.sum_ns
+            merged.errors += histogram.errors
+
+    def _histogram_snapshot(self, histogram: _Histogram) -> HistogramSnapshot:
+        return HistogramSnapshot(
+            buckets_ns=self._buckets_ns,
+            counts=tuple(histogram.counts),
+            total=sum(histogram.counts),
+            sum_ns=histogram.sum_ns,
+            errors=histogram.errors,
+        )
+
+
+def get_metrics_middleware(recorder: MetricsRecorder) -> t.Callable:
+    # This is on the hot path of every message, so the recording is inlined here
+    # rather than delegated to `recorder.record_message()`:
+    # pylint: disable=protected-access
+    shard = recorder._shard
+    buckets_ns = recorder._buckets_ns
+    get_histogram = recorder._get_message_histogram
+    bucket_index = bisect.bisect_left
+    clock = time.perf_counter_ns
+
+    def metrics_middleware(message: object, next_: t.Callable) -> object:
+        start = clock()
+        try:
+            result = next_(message)
+        except BaseException:
+            recorder.record_message(message.__class__, clock() - start, True)
+            raise
+        elapsed_ns = clock() - start
+        try:
+            histogram = shard.messages[message.__class__]
+        except (AttributeError, KeyError):
+            histogram = get_histogram(message.__class__)
+        histogram.counts[bucket_index(buckets_ns, elapsed_ns)] += 1
+        histogram.sum_ns += elapsed_ns
+        return result
+
+    return metrics_middleware
+
+
+def to_prometheus_text(snapshot: MetricsSnapshot, prefix: str = "pymessagebus") -> str:
+    """
+    Renders the snapshot in the Prometheus text exposition format.
+    """
+    lines: t.List[str] = []
+    for kind, label, histograms in (
+        ("message", "message_class", snapshot.messages),
+        ("handler", "handler", snapshot.handlers),
+    ):
+        if not histograms:
+            continue
+        duration_metric = f"{prefix}_{kind}_duration_seconds"
+        errors_metric = f"{prefix}_{kind}_errors_total"
+        lines.append(f"# HELP {duration_metric} Duration of the {kind}s processing.")
+        lines.append(f"# TYPE {duration_metric} histogram")
+        for name, histogram in sorted(histograms.items()):
+            labels = f'{label}="{_escape_label_value(name)}"'
+            cumulated = 0
+            for bucket_bound, bucket_count in zip(
+                histogram.buckets_ns, histogram.counts
+            ):
+                cumulated += bucket_count
+                lines.append(
+                    f'{duration_metric}_bucket{{{labels},le="{bucket_bound / 1e9:g}"}} {cumulated}'
+                )
+            lines.append(
+                f'{duration_metric}_bucket{{{labels},le="+Inf"}} {histogram.total}'
+            )
+            lines.append(
+                f"{duration_metric}_sum{{{labels}}} {histogram.sum_ns / 1e9:g}"
+            )
+            lines.append(f"{duration_metric}_count{{{labels}}} {histogram.total}")
+        lines.append(
+            f"# HELP {errors_metric} Number of {kind}s processings which raised an error."
+        )
+        lines.append(f"# TYPE {errors_metric} counter")
+        for name, histogram in sorted(histograms.items()):
+            labels = f'{label}="{_escape_label_value(name)}"'
+            lines.append(f"{errors_metric}{{{labels}}} {histogram.errors}")
+    return "\n".join(lines) + "\n"
+
+
+def _qualified_name(obj: t.Any) -> str:
+    qualname = getattr(obj, "__qualname__", None)
+    if qualname is None:
+        return repr(obj)
+    return f"{getattr(obj, '__module__', '')}.{qualname}"
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
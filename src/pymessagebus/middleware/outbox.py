@@ -0,0 +1,258 @@
+import sqlite3
+import threading
+import time
+import typing as t
+
+from .._serialization import PickleSerializer
+
+# pylint: disable=too-few-public-methods
+
+
+class OutboxConfig(t.NamedTuple):
+    serializer: t.Any = PickleSerializer()
+    # Acknowledgements are buffered and written by groups of N entries. The ones which are
+    # still buffered when the process crashes are lost, and their messages handled again
+    # on the next replay (the outbox guarantees an "at-least-once" processing):
+    ack_batch_size: int = 100
+    # The SQLite "synchronous" pragma: in WAL mode, "NORMAL" survives an application crash
+    # but can lose the last transactions on a power loss - use "FULL" if that's a concern:
+    synchronous: str = "NORMAL"
+    # With a single message per `handle()`, each append is a transaction - i.e. an fsync.
+    # When this window (in seconds) is set, the messages appended concurrently from several
+    # threads during the window are written in a single transaction: each append waits up
+    # to the window duration, for a much higher throughput under concurrency.
+    group_commit_window: float = 0.0
+
+
+class OutboxEntry(t.NamedTuple):
+    id: int
+    created_at: float
+    message: object
+
+
+class _PendingGroup:
+    __slots__ = ("rows", "first_id", "error", "done")
+
+    def __init__(self, row: t.Tuple[float, bytes]) -> None:
+        self.rows = [row]
+        self.first_id = 0
+        self.error: t.Optional[BaseException] = None
+        self.done = False
+
+
+class SQLiteOutbox:  # pylint: disable=too-many-instance-attributes
+    """
+    A durable journal of messages, stored in a SQLite database (in WAL mode).
+    Messages are appended before their handlers run, and acknowledged once they have been
+    successfully handled: the ones which are still pending on startup can be handled again
+    with `replay()`.
+    """
+
+    def __init__(self, database: str, config: t.Optional[OutboxConfig] = None) -> None:
+        self._config = config or OutboxConfig()
+        self._serializer = self._config.serializer
+        self._lock = threading.RLock()
+        self._pending_acks: t.List[int] = []
+        self._replaying = threading.local()
+        # The appends waiting for the next group commit:
+        self._group: t.Optional[_PendingGroup] = None
+        self._group_condition = threading.Condition()
+        # We manage the transactions ourselves:
+        self._connection = sqlite3.connect(
+            database, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(f"PRAGMA synchronous={self._config.synchronous}")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "created_at REAL NOT NULL, "
+            "payload BLOB NOT NULL, "
+            "acknowledged INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (acknowledged, id)"
+        )
+
+    def append(self, message: object) -> int:
+        if self._config.group_commit_window <= 0:
+            return self.append_many([message])[0]
+        row = (time.time(), self._serializer.dumps(message))
+        with self._group_condition:
+            group = self._group
+            if group is not None:
+                # Another thread leads the current group commit: we just join it.
+                index = len(group.rows)
+                group.rows.append(row)
+                while not group.done:
+                    self._group_condition.wait()
+                if group.error is not None:
+                    raise group.error
+                return group.first_id + index
+            group = self._group = _PendingGroup(row)
+        time.sleep(self._config.group_commit_window)
+        with self._group_condition:
+            self._group = None  # no other row can join the group from now on
+        try:
+            group.first_id = self._insert_rows(group.rows)[0]
+        except BaseException as err:
+            group.error = err
+            raise
+        finally:
+            with self._group_condition:
+                group.done = True
+                self._group_condition.notify_all()
+        return group.first_id
+
+    def append_many(self, messages: t.Iterable[object]) -> t.List[int]:
+        """
+        Writes the messages to the journal in a single transaction - i.e. a single fsync -
+        and returns their entry ids, in the same order.
+        """
+        created_at = time.time()
+        rows = [(created_at, self._serializer.dumps(message)) for message in messages]
+        if not rows:
+            return []
+        return self._insert_rows(rows)
+
+    def acknowledge(self, entry_id: int) -> None:
+        self.acknowledge_many([entry_id])
+
+    def acknowledge_many(self, entry_ids: t.Iterable[int]) -> None:
+        with self._lock:
+            self._pending_acks.extend(entry_ids)
+            if len(self._pending_acks) >= self._config.ack_batch_size:
+                self.flush()
+
+    def flush(self) -> None:
+        """
+        Writes the buffered acknowledgements to the journal.
+        """
+        with self._lock:
+            if not self._pending_acks:
+                return
+            with self._connection:
+                self._connection.execute("BEGIN")
+                self._connection.executemany(
+                    "UPDATE outbox SET acknowledged = 1 WHERE id = ?",
+                    [(entry_id,) for entry_id in self._pending_acks],
+                )
+            self._pending_acks.clear()
+
+    def pending(self) -> t.List[OutboxEntry]:
+        """
+        Returns the entries which have not been acknowledged yet, in their appending order.
+        """
+        with self._lock:
+            self.flush()
+            rows = self._connection.execute(
+                "SELECT id, created_at, payload FROM outbox "
+                "WHERE acknowledged = 0 ORDER BY id"
+            ).fetchall()
+        return [
+            OutboxEntry(entry_id, created_at, self._serializer.loads(payload))
+            for entry_id, created_at, payload in rows
+        ]
+
+    def replay(self, handle: t.Callable[[object], t.Any]) -> int:
+        """
+        Handles again the pending messages - typically on startup, with the `handle` method of
+        the bus - and acknowledges them one by one. Stops at the first message whose handling
+        raises an exception, which is re-raised. Returns the number of replayed messages.
+        The outbox middleware doesn't append the replayed messages to the journal again.
+        """
+        replayed_count = 0
+        self._replaying.active = True
+        try:
+            for entry in self.pending():
+                handle(entry.message)
+                self.acknowledge(entry.id)
+                replayed_count += 1
+        finally:
+            self._replaying.active = False
+            self.flush()
+        return replayed_count
+
+    def is_replaying(self) -> bool:
+        return getattr(self._replaying, "active", False)
+
+    def cleanup(self, older_than: t.Optional[float] = None) -> int:
+        """
+        Deletes the acknowledged entries from the journal - only the ones that were appended
+        more than `older_than` seconds ago, if given. Returns the number of deleted entries.
+        """
+        max_created_at = time.time() - older_than if older_than is not None else None
+        with self._lock:
+            self.flush()
+            with self._connection:
+                self._connection.execute("BEGIN")
+                if max_created_at is None:
+                    cursor = self._connection.execute(
+                        "DELETE FROM outbox WHERE acknowledged = 1"
+                    )
+                else:
+                    cursor = self._connection.execute(
+                        "DELETE FROM outbox WHERE acknowledged = 1 AND created_at < ?",
+                        (max_created_at,),
+                    )
+            return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self.flush()
+            self._connection.close()
+
+    def _insert_rows(self, rows: t.List[t.Tuple[float, bytes]]) -> t.List[int]:
+        with self._lock, self._connection:
+            # We hold the write lock of the database until the end of the transaction,
+            # so the ids of the rows we insert are consecutive:
+            self._connection.execute("BEGIN IMMEDIATE")
+            self._connection.executemany(
+                "INSERT INTO outbox (created_at, payload) VALUES (?, ?)", rows
+            )
+            (last_id,) = self._connection.execute(
+                "SELECT last_insert_rowid()"
+            ).fetchone()
+        return list(range(last_id - len(rows) + 1, last_id + 1))
+
+    def __enter__(self) -> "SQLiteOutbox":
+        return self
+
+    def __exit__(self, *unused_exc_info) -> None:
+        self.close()
+
+
+class _OutboxMiddleware:
+    """
+    The messages are appended to the outbox before their handlers run, and acknowledged once
+    they have been successfully handled: the messages whose handling raised an exception
+    stay pending, and will be handled again by the next `replay()`.
+    """
+
+    __slots__ = ("_outbox",)
+
+    def __init__(self, outbox: SQLiteOutbox) -> None:
+        self._outbox = outbox
+
+    def __call__(self, message: object, next_: t.Callable) -> object:
+        if self._outbox.is_replaying():
+            return next_(message)
+        entry_id = self._outbox.append(message)
+        result = next_(message)
+        self._outbox.acknowledge(entry_id)
+        return result
+
+    def handle_batch(
+        self, messages: t.List[object], next_batch: t.Callable
+    ) -> t.List[t.Any]:
+        # With `handle_many()` the whole batch is appended in a single transaction:
+        if self._outbox.is_replaying():
+            return next_batch(messages)
+        entry_ids = self._outbox.append_many(messages)
+        results = next_batch(messages)
+        self._outbox.acknowledge_many(entry_ids)
+        return results
+
+
+def get_outbox_middleware(outbox: SQLiteOutbox) -> t.Callable:
+    return _OutboxMiddleware(outbox)
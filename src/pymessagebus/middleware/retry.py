@@ -0,0 +1,199 @@
+import asyncio
+import functools
+import random
+import threading
+import time
+import typing as t
+
+from .. import api
+from .._deadlines import remaining_time
+
+# pylint: disable=too-few-public-methods
+
+
+class RetryPolicy(t.NamedTuple):
+    # Total number of attempts, including the first one:
+    max_attempts: int = 3
+    # Only those exceptions trigger a retry...
+    retry_on: t.Tuple[t.Type[BaseException], ...] = (Exception,)
+    # ...except those ones:
+    give_up_on: t.Tuple[t.Type[BaseException], ...] = (
+        api.CircuitBreakerOpen,
+        api.DeadlineExceeded,
+    )
+    # The delay before the Nth retry is `base_delay * multiplier ** (N - 1)` seconds,
+    # capped at `max_delay`...
+    base_delay: float = 0.05
+    multiplier: float = 2.0
+    max_delay: float = 2.0
+    # ...and with "full jitter" a random delay between 0 and that one is used instead,
+    # so that the callers which failed together don't retry together:
+    jitter: bool = True
+
+    def get_delay(self, retry_number: int) -> float:
+        delay = min(
+            self.max_delay, self.base_delay * self.multiplier ** (retry_number - 1)
+        )
+        return random.uniform(0, delay) if self.jitter else delay
+
+    def should_retry(self, error: BaseException) -> bool:
+        return isinstance(error, self.retry_on) and not isinstance(
+            error, self.give_up_on
+        )
+
+
+class RetryMiddlewareConfig(t.NamedTuple):
+    # Retries are opt-in: only the messages whose class is in `policies_per_class` are
+    # retried - unless a policy is given for all the other ones:
+    default_policy: t.Optional[RetryPolicy] = None
+    policies_per_class: t.Optional[t.Mapping[type, t.Optional[RetryPolicy]]] = None
+
+
+class RetryStats(t.NamedTuple):
+    messages: int  # messages handled through the middleware
+    retries: int  # additional attempts
+    recovered: int  # messages which succeeded after at least one retry
+    exhausted: int  # messages which still failed after their last attempt
+
+
+class Retrier:
+    """
+    Holds the retry configuration and counters shared by the (synchronous and async)
+    retry middlewares - and by the handlers wrapped with `with_retry()`. Retries never
+    wait past the deadline of the message, if any.
+    """
+
+    def __init__(self, config: t.Optional[RetryMiddlewareConfig] = None) -> None:
+        # pylint: disable=E1120
+        self._config = config or RetryMiddlewareConfig()
+        self._lock = threading.Lock()
+        self._messages = 0
+        self._retries = 0
+        self._recovered = 0
+        self._exhausted = 0
+
+    def stats(self) -> RetryStats:
+        with self._lock:
+            return RetryStats(
+                messages=self._messages,
+                retries=self._retries,
+                recovered=self._recovered,
+                exhausted=self._exhausted,
+            )
+
+    def get_policy(self, message_class: type) -> t.Optional[RetryPolicy]:
+        policies_per_class = self._config.policies_per_class
+        if policies_per_class is None:
+            return self._config.default_policy
+        return policies_per_class.get(message_class, self._config.default_policy)
+
+    def call(self, policy: RetryPolicy, function: t.Callable, message: object) -> t.Any:
+        attempt = 1
+        while True:
+            try:
+                result = function(message)
+            except Exception as err:  # pylint: disable=broad-except
+                delay = self.get_retry_delay(policy, err, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+            else:
+                self.record(retries=attempt - 1, succeeded=True)
+                return result
+
+    async def call_async(
+        self, policy: RetryPolicy, function: t.Callable, message: object
+    ) -> t.Any:
+        attempt = 1
+        while True:
+            try:
+                result = await function(message)
+            except Exception as err:  # pylint: disable=broad-except
+                delay = self.get_retry_delay(policy, err, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+            else:
+                self.record(retries=attempt - 1, succeeded=True)
+                return result
+
+    def get_retry_delay(
+        self, policy: RetryPolicy, error: BaseException, attempt: int
+    ) -> t.Optional[float]:
+        """
+        Returns the number of seconds to wait before the next attempt, or `None` if the
+        failed attempt must not be retried.
+        """
+        if attempt >= policy.max_attempts or not policy.should_retry(error):
+            self.record(retries=attempt - 1, succeeded=False)
+            return None
+        delay = policy.get_delay(attempt)
+        remaining = remaining_time()
+        if remaining is not None and remaining <= delay:
+            # We would wake up past the deadline:
+            self.record(retries=attempt - 1, succeeded=False)
+            return None
+        return delay
+
+    def record(self, retries: int, succeeded: bool) -> None:
+        with self._lock:
+            self._messages += 1
+            self._retries += retries
+            if retries and succeeded:
+                self._recovered += 1
+            elif not succeeded:
+                self._exhausted += 1
+
+
+def get_retry_middleware(retrier: Retrier) -> t.Callable:
+    """
+    The middleware retries the handling of the whole message: on a MessageBus, the handlers
+    which already succeeded are triggered again - use `with_retry()` to retry a single handler.
+    """
+
+    def retry_middleware(message: object, next_: t.Callable) -> object:
+        policy = retrier.get_policy(message.__class__)
+        if policy is None:
+            return next_(message)
+        return retrier.call(policy, next_, message)
+
+    return retry_middleware
+
+
+def get_async_retry_middleware(retrier: Retrier) -> t.Callable:
+    async def retry_middleware(message: object, next_: t.Callable) -> object:
+        policy = retrier.get_policy(message.__class__)
+        if policy is None:
+            return await next_(message)
+        return await retrier.call_async(policy, next_, message)
+
+    return retry_middleware
+
+
+def with_retry(
+    handler: t.Callable,
+    policy: RetryPolicy = RetryPolicy(),
+    *,
+    retrier: t.Optional[Retrier] = None,
+) -> t.Callable:
+    """
+    Wraps a single handler, so that only its own failures are retried - the other handlers
+    of the message are not triggered again. Its retries are counted in the stats of the
+    given `retrier`, if any.
+    """
+    handler_retrier = retrier or Retrier()
+    if asyncio.iscoroutinefunction(handler):
+
+        @functools.wraps(handler)
+        async def async_handler_with_retry(message: object) -> t.Any:
+            return await handler_retrier.call_async(policy, handler, message)
+
+        return async_handler_with_retry
+
+    @functools.wraps(handler)
+    def handler_with_retry(message: object) -> t.Any:
+        return handler_retrier.call(policy, handler, message)
+
+    return handler_with_retry
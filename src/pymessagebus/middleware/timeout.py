@@ -0,0 +1,132 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import time
+import typing as t
+
+from .. import api
+from .._deadlines import deadline
+
+# pylint: disable=too-few-public-methods
+
+
+class TimeoutMiddlewareConfig(t.NamedTuple):
+    # Number of seconds given to the handling of each message (`None` for no time limit)...
+    timeout: t.Optional[float] = None
+    # ...which can be overridden for some message classes:
+    timeouts_per_class: t.Optional[t.Mapping[type, t.Optional[float]]] = None
+    # Synchronous handlers can't be interrupted: when an executor is given, the handling of
+    # the messages which have a deadline is run on it, and abandoned once the deadline is
+    # exceeded. Without it, the deadline is only checked before the handling starts - and
+    # handlers can call `check_deadline()` to give up cooperatively.
+    executor: t.Optional[concurrent.futures.Executor] = None
+
+
+def get_timeout_middleware(
+    config: t.Optional[TimeoutMiddlewareConfig] = None,
+) -> t.Callable:
+    # pylint: disable=E1120
+    middleware_config: TimeoutMiddlewareConfig = config or TimeoutMiddlewareConfig()
+    default_timeout = middleware_config.timeout
+    timeouts_per_class = middleware_config.timeouts_per_class or {}
+    executor = middleware_config.executor
+
+    def timeout_middleware(message: object, next_: t.Callable) -> object:
+        timeout = timeouts_per_class.get(message.__class__, default_timeout)
+        with deadline(timeout) as expires_at:
+            if expires_at is None:
+                return next_(message)
+            remaining = _get_remaining_time(expires_at, message)
+            if executor is None:
+                return next_(message)
+            # The handling runs in the current context, so that nested messages inherit
+            # the deadline:
+            future = executor.submit(contextvars.copy_context().run, next_, message)
+            try:
+                return future.result(timeout=remaining)
+            except concurrent.futures.TimeoutError:
+                future.cancel()
+                raise _deadline_exceeded(message) from None
+
+    return timeout_middleware
+
+
+def get_async_timeout_middleware(
+    config: t.Optional[TimeoutMiddlewareConfig] = None,
+) -> t.Callable:
+    """
+    The asyncio version of the timeout middleware: the handling of the messages which
+    exceed their deadline is cancelled. The `executor` option doesn't apply here.
+    """
+    # pylint: disable=E1120
+    middleware_config: TimeoutMiddlewareConfig = config or TimeoutMiddlewareConfig()
+    default_timeout = middleware_config.timeout
+    timeouts_per_class = middleware_config.timeouts_per_class or {}
+
+    async def timeout_middleware(message: object, next_: t.Callable) -> object:
+        timeout = timeouts_per_class.get(message.__class__, default_timeout)
+        with deadline(timeout) as expires_at:
+            if expires_at is None:
+                return await next_(message)
+            remaining = _get_remaining_time(expires_at, message)
+            try:
+                return await asyncio.wait_for(next_(message), remaining)
+            except asyncio.TimeoutError:
+                raise _deadline_exceeded(message) from None
+
+    return timeout_middleware
+
+
+def with_timeout(
+    handler: t.Callable,
+    timeout: float,
+    *,
+    executor: t.Optional[concurrent.futures.Executor] = None,
+) -> t.Callable:
+    """
+    Wraps a single handler, so that it gets at most `timeout` seconds (or less, if the
+    deadline of the message is closer). Coroutine handlers are cancelled once their time
+    is up, while the synchronous ones are run on the given executor and abandoned - or
+    only get their deadline checked before they start, without an executor.
+    """
+    if asyncio.iscoroutinefunction(handler):
+
+        @functools.wraps(handler)
+        async def async_handler_with_timeout(message: object) -> t.Any:
+            with deadline(timeout) as expires_at:
+                remaining = _get_remaining_time(t.cast(float, expires_at), message)
+                try:
+                    return await asyncio.wait_for(handler(message), remaining)
+                except asyncio.TimeoutError:
+                    raise _deadline_exceeded(message) from None
+
+        return async_handler_with_timeout
+
+    @functools.wraps(handler)
+    def handler_with_timeout(message: object) -> t.Any:
+        with deadline(timeout) as expires_at:
+            remaining = _get_remaining_time(t.cast(float, expires_at), message)
+            if executor is None:
+                return handler(message)
+            future = executor.submit(contextvars.copy_context().run, handler, message)
+            try:
+                return future.result(timeout=remaining)
+            except concurrent.futures.TimeoutError:
+                future.cancel()
+                raise _deadline_exceeded(message) from None
+
+    return handler_with_timeout
+
+
+def _get_remaining_time(expires_at: float, message: object) -> float:
+    remaining = expires_at - time.monotonic()
+    if remaining <= 0:
+        raise _deadline_exceeded(message)
+    return remaining
+
+
+def _deadline_exceeded(message: object) -> api.DeadlineExceeded:
+    return api.DeadlineExceeded(
+        f"The deadline for the handling of a '{message.__class__}' message has been exceeded."  # pylint: disable=line-too-long
+    )
@@ -24,6 +24,24 @@ def test_commandbus_package_alias():
     assert handling_result == 1
 
 
+def test_async_buses_package_aliases():
+    import asyncio
+
+    from pymessagebus import AsyncMessageBus, AsyncCommandBus
+
+    message_bus = AsyncMessageBus()
+    message_bus.add_handler(EmptyMessage, get_one)
+    command_bus = AsyncCommandBus()
+    command_bus.add_handler(EmptyMessage, get_one)
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(message_bus.handle(EmptyMessage())) == [1]
+        assert loop.run_until_complete(command_bus.handle(EmptyMessage())) == 1
+    finally:
+        loop.close()
+
+
 class EmptyMessage:
     pass
 
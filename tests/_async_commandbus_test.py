@@ -0,0 +1,182 @@
+# pylint: skip-file
+import asyncio
+import typing as t
+
+import pytest
+
+from pymessagebus import api
+from pymessagebus._async_commandbus import AsyncCommandBus
+
+
+def test_simplest_handler():
+    sut = AsyncCommandBus()
+    sut.add_handler(EmptyMessage, get_one)
+
+    message = EmptyMessage()
+    handling_result = run(sut.handle(message))
+    assert handling_result == 1
+
+
+def test_has_handler_for():
+    sut = AsyncCommandBus()
+    sut.add_handler(MessageClassOne, get_one)
+
+    assert sut.has_handler_for(MessageClassOne) is True
+    assert sut.has_handler_for(MessageClassTwo) is False
+
+
+def test_remove_handler():
+    sut = AsyncCommandBus()
+    sut.add_handler(MessageClassOne, get_one)
+    assert sut.has_handler_for(MessageClassOne)
+
+    assert sut.remove_handler(MessageClassOne) is True
+    assert sut.remove_handler(MessageClassOne) is False
+    assert sut.has_handler_for(MessageClassOne) is False
+
+
+def test_commandbus_can_be_configured_to_not_return_anything_on_command_handling():
+    sut = AsyncCommandBus(allow_result=False)
+    sut.add_handler(MessageClassOne, get_one)
+
+    handling_result = run(sut.handle(MessageClassOne()))
+    assert handling_result is None
+
+
+def test_handler_must_be_registered_for_a_message_type():
+    sut = AsyncCommandBus()
+
+    with pytest.raises(api.CommandHandlerNotFound):
+        run(sut.handle(EmptyMessage()))
+
+
+def test_multiple_handlers_for_single_message_triggers_error():
+    sut = AsyncCommandBus()
+    sut.add_handler(EmptyMessage, get_one)
+
+    with pytest.raises(api.CommandHandlerAlreadyRegisteredForAType):
+        sut.add_handler(EmptyMessage, get_one)
+
+
+def test_locking():
+    sut = None
+    test_list = []
+
+    class MessageWithPayload(t.NamedTuple):
+        payload: int
+
+    class OtherMessageWithPayload(MessageWithPayload):
+        pass
+
+    message = MessageWithPayload(payload=33)
+
+    async def handler_which_triggers_handler_two(msg):
+        test_list.append(f"1:{msg.payload}")
+        result = await sut.handle(OtherMessageWithPayload(payload=43))
+        return f"handler_one_was_here:{result}"
+
+    async def handler_two(msg):
+        test_list.append(f"2:{msg.payload}")
+        return "handler_two_was_here"
+
+    sut = AsyncCommandBus()
+    sut.add_handler(MessageWithPayload, handler_which_triggers_handler_two)
+    sut.add_handler(OtherMessageWithPayload, handler_two)
+
+    with pytest.raises(api.CommandBusAlreadyProcessingAMessage):
+        run(sut.handle(message))
+
+    test_list = []
+    sut = AsyncCommandBus(locking=False)
+    sut.add_handler(MessageWithPayload, handler_which_triggers_handler_two)
+    sut.add_handler(OtherMessageWithPayload, handler_two)
+
+    result = run(sut.handle(message))
+    assert test_list == ["1:33", "2:43"]
+    assert result == "handler_one_was_here:handler_two_was_here"
+
+
+def run(coroutine: t.Awaitable) -> t.Any:
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_locking_is_released_when_a_handler_raises():
+    async def errorful_handler(msg):
+        raise RuntimeError("test error")
+
+    sut = AsyncCommandBus()
+    sut.add_handler(MessageClassOne, errorful_handler)
+    sut.add_handler(MessageClassTwo, get_one)
+
+    with pytest.raises(RuntimeError):
+        run(sut.handle(MessageClassOne()))
+    assert run(sut.handle(MessageClassTwo())) == 1
+
+
+def test_locking_is_scoped_to_the_current_task():
+    async def slow_handler(msg):
+        await asyncio.sleep(0.01)
+        return "slow"
+
+    sut = AsyncCommandBus()
+    sut.add_handler(MessageClassOne, slow_handler)
+    sut.add_handler(MessageClassTwo, get_one)
+
+    async def handle_concurrently():
+        return await asyncio.gather(
+            sut.handle(MessageClassOne()), sut.handle(MessageClassTwo())
+        )
+
+    assert run(handle_concurrently()) == ["slow", 1]
+
+
+def test_locking_does_not_stop_the_tasks_started_by_a_handler():
+    sut = AsyncCommandBus()
+    other_bus = AsyncCommandBus()
+
+    async def handler_which_starts_a_task(msg):
+        # The Task inherits the context of this handler, but is not processing a message:
+        task = asyncio.get_running_loop().create_task(sut.handle(MessageClassTwo()))
+        # ...while another bus can process a message in this very Task:
+        return [await task, await other_bus.handle(MessageClassTwo())]
+
+    sut.add_handler(MessageClassOne, handler_which_starts_a_task)
+    sut.add_handler(MessageClassTwo, get_one)
+    other_bus.add_handler(MessageClassTwo, get_one)
+
+    assert run(sut.handle(MessageClassOne())) == [1, 1]
+
+
+def test_middlewares_get_a_list_of_results():
+    middleware_results = []
+
+    async def middleware(message, next):
+        result = await next(message)
+        middleware_results.append(result)
+        return result
+
+    sut = AsyncCommandBus(middlewares=[middleware])
+    sut.add_handler(MessageClassOne, get_one)
+
+    assert run(sut.handle(MessageClassOne())) == 1
+    assert middleware_results == [[1]]
+
+
+class EmptyMessage:
+    pass
+
+
+class MessageClassOne:
+    pass
+
+
+class MessageClassTwo:
+    pass
+
+
+async def get_one(_):
+    return 1
@@ -0,0 +1,232 @@
+# pylint: skip-file
+import asyncio
+import typing as t
+
+import pytest
+
+from pymessagebus import api
+from pymessagebus._async_messagebus import AsyncMessageBus
+
+
+def test_simplest_handler_can_have_no_handlers_for_a_message():
+    sut = AsyncMessageBus()
+
+    message = EmptyMessage()
+    handling_result = run(sut.handle(message))
+    assert handling_result == []
+
+
+def test_simplest_handler():
+    sut = AsyncMessageBus()
+    sut.add_handler(EmptyMessage, get_one)
+
+    message = EmptyMessage()
+    handling_result = run(sut.handle(message))
+    assert handling_result == [1]
+
+
+def test_sync_handlers_can_be_mixed_with_coroutine_handlers():
+    sut = AsyncMessageBus()
+    sut.add_handler(EmptyMessage, get_one)
+    sut.add_handler(EmptyMessage, sync_get_two)
+    sut.add_handler(EmptyMessage, get_three)
+
+    message = EmptyMessage()
+    handling_result = run(sut.handle(message))
+    assert handling_result == [1, 2, 3]
+
+
+def test_has_handler_for():
+    sut = AsyncMessageBus()
+    sut.add_handler(MessageClassOne, get_one)
+
+    assert sut.has_handler_for(MessageClassOne) is True
+    assert sut.has_handler_for(MessageClassTwo) is False
+
+
+def test_remove_handler():
+    sut = AsyncMessageBus()
+    sut.add_handler(MessageClassOne, get_one)
+    assert sut.has_handler_for(MessageClassOne)
+
+    assert sut.remove_handler(MessageClassOne, get_one) is True
+    assert sut.remove_handler(MessageClassOne, get_two) is False
+    assert sut.has_handler_for(MessageClassOne) is False
+
+
+def test_handler_message_must_be_a_type():
+    sut = AsyncMessageBus()
+
+    not_a_type = EmptyMessage()
+    with pytest.raises(api.MessageHandlerMappingRequiresAType):
+        sut.add_handler(not_a_type, get_one)
+
+
+def test_handlers_run_sequentially_by_default():
+    events = []
+
+    async def slow_handler(message):
+        events.append("slow handler start")
+        await asyncio.sleep(0.01)
+        events.append("slow handler end")
+        return "slow"
+
+    async def fast_handler(message):
+        events.append("fast handler")
+        return "fast"
+
+    sut = AsyncMessageBus()
+    sut.add_handler(EmptyMessage, slow_handler)
+    sut.add_handler(EmptyMessage, fast_handler)
+
+    handling_result = run(sut.handle(EmptyMessage()))
+    assert handling_result == ["slow", "fast"]
+    assert events == ["slow handler start", "slow handler end", "fast handler"]
+
+
+def test_handlers_can_run_concurrently():
+    events = []
+
+    async def slow_handler(message):
+        events.append("slow handler start")
+        await asyncio.sleep(0.01)
+        events.append("slow handler end")
+        return "slow"
+
+    async def fast_handler(message):
+        events.append("fast handler")
+        return "fast"
+
+    sut = AsyncMessageBus(concurrent_handlers=True)
+    sut.add_handler(EmptyMessage, slow_handler)
+    sut.add_handler(EmptyMessage, fast_handler)
+
+    handling_result = run(sut.handle(EmptyMessage()))
+    # Results still come in the handlers registration order:
+    assert handling_result == ["slow", "fast"]
+    assert events == ["slow handler start", "fast handler", "slow handler end"]
+
+
+def test_middlewares():
+    class MessageWithList(t.NamedTuple):
+        payload: t.List[str]
+
+    async def middleware_one(
+        message: MessageWithList, next: api.AsyncCallNextMiddleware
+    ):
+        message.payload.append("middleware one: does something before the handler")
+        result = await next(message)
+        message.payload.append("middleware one: does something after the handler")
+        return result
+
+    async def middleware_two(
+        message: MessageWithList, next: api.AsyncCallNextMiddleware
+    ):
+        message.payload.append("middleware two: does something before the handler")
+        result = await next(message)
+        message.payload.append("middleware two: does something after the handler")
+        return result
+
+    async def handler_one(message: MessageWithList):
+        message.payload.append("handler one does something")
+        return "handler one result"
+
+    async def handler_two(message: MessageWithList):
+        message.payload.append("handler two does something")
+        return "handler two result"
+
+    sut = AsyncMessageBus(middlewares=[middleware_one, middleware_two])
+    sut.add_handler(MessageWithList, handler_one)
+    sut.add_handler(MessageWithList, handler_two)
+
+    message = MessageWithList(payload=["initial message payload"])
+    result = run(sut.handle(message))
+    assert result == ["handler one result", "handler two result"]
+    assert message.payload == [
+        "initial message payload",
+        "middleware one: does something before the handler",
+        "middleware two: does something before the handler",
+        "handler one does something",
+        "handler two does something",
+        "middleware two: does something after the handler",
+        "middleware one: does something after the handler",
+    ]
+
+
+def test_handlers_priority_and_predicates():
+    for concurrent_handlers in (False, True):
+        sut = AsyncMessageBus(concurrent_handlers=concurrent_handlers)
+        sut.add_handler(EmptyMessage, get_one)
+        sut.add_handler(EmptyMessage, get_two, priority=1)
+        sut.add_handler(EmptyMessage, get_three, predicate=lambda m: False)
+
+        assert run(sut.handle(EmptyMessage())) == [2, 1]
+
+
+def test_handlers_can_stop_propagation():
+    async def stopping_handler(message):
+        return api.StopPropagation("stopped")
+
+    sut = AsyncMessageBus()
+    sut.add_handler(EmptyMessage, get_one)
+    sut.add_handler(EmptyMessage, stopping_handler)
+    sut.add_handler(EmptyMessage, get_two)
+    assert run(sut.handle(EmptyMessage())) == [1, "stopped"]
+
+    # Concurrent handlers are all triggered, but the result is still unwrapped:
+    sut = AsyncMessageBus(concurrent_handlers=True)
+    sut.add_handler(EmptyMessage, get_one)
+    sut.add_handler(EmptyMessage, stopping_handler)
+    sut.add_handler(EmptyMessage, get_two)
+    assert run(sut.handle(EmptyMessage())) == [1, "stopped", 2]
+
+
+def test_handle_first():
+    async def get_none(message):
+        return None
+
+    async def get_first(message):
+        return "first"
+
+    sut = AsyncMessageBus(concurrent_handlers=True)
+    assert run(sut.handle_first(EmptyMessage())) is None
+
+    sut.add_handler(EmptyMessage, get_none)
+    sut.add_handler(EmptyMessage, get_first)
+    sut.add_handler(EmptyMessage, get_two)
+    assert run(sut.handle_first(EmptyMessage())) == "first"
+
+
+def run(coroutine: t.Awaitable) -> t.Any:
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class EmptyMessage:
+    pass
+
+
+class MessageClassOne:
+    pass
+
+
+class MessageClassTwo:
+    pass
+
+
+async def get_one(_):
+    return 1
+
+
+async def get_two(_):
+    return 2
+
+
+async def get_three(_):
+    return 3
+
+
+sync_get_two = lambda _: 2
@@ -0,0 +1,149 @@
+# pylint: skip-file
+import threading
+import time
+import typing as t
+
+from pymessagebus._coalescing import CoalescingConfig
+from pymessagebus._messagebus import MessageBus
+
+
+def test_messages_are_coalesced_per_key():
+    handled = []
+    sut = MessageBus()
+    sut.add_handler(ProjectionIsStale, handled.append)
+    sut.set_coalescing(
+        ProjectionIsStale,
+        CoalescingConfig(window=60, key=lambda message: message.entity_id),
+    )
+
+    assert sut.handle(ProjectionIsStale(entity_id=1, version=1)) == []
+    sut.handle(ProjectionIsStale(entity_id=2, version=1))
+    sut.handle(ProjectionIsStale(entity_id=1, version=2))
+    sut.handle(ProjectionIsStale(entity_id=1, version=3))
+    assert handled == []
+    assert sut.coalescing_stats(ProjectionIsStale) == (4, 0, 2)
+
+    sut.flush_coalesced()
+    # Only the latest message of each key is handled:
+    assert handled == [ProjectionIsStale(1, 3), ProjectionIsStale(2, 1)]
+    assert sut.coalescing_stats(ProjectionIsStale) == (4, 2, 0)
+
+    # Other message classes are not coalesced:
+    assert sut.handle(OtherMessage()) == []
+    assert sut.coalescing_stats(OtherMessage) is None
+
+
+def test_messages_can_be_merged():
+    handled = []
+    sut = MessageBus()
+    sut.add_handler(ProjectionIsStale, handled.append)
+    sut.set_coalescing(
+        ProjectionIsStale,
+        CoalescingConfig(
+            window=60,
+            key=lambda message: message.entity_id,
+            merge=lambda pending, new: pending._replace(
+                version=pending.version + new.version
+            ),
+        ),
+    )
+
+    for version in (1, 2, 3):
+        sut.handle(ProjectionIsStale(entity_id=1, version=version))
+    sut.flush_coalesced()
+    assert handled == [ProjectionIsStale(1, 6)]
+
+
+def test_messages_are_handled_at_the_end_of_the_window():
+    handled = threading.Event()
+    handled_messages = []
+
+    def handler(message):
+        handled_messages.append(message)
+        handled.set()
+
+    sut = MessageBus(middlewares=[lambda message, next: next(message)])
+    sut.add_handler(ProjectionIsStale, handler)
+    sut.set_coalescing(ProjectionIsStale, CoalescingConfig(window=0.01))
+
+    sut.handle(ProjectionIsStale(1, 1))
+    sut.handle(ProjectionIsStale(1, 1))
+    assert handled.wait(1)
+    assert handled_messages == [ProjectionIsStale(1, 1)]
+
+
+def test_disabling_coalescing_handles_pending_messages():
+    handled = []
+    sut = MessageBus()
+    sut.add_handler(ProjectionIsStale, handled.append)
+    sut.set_coalescing(ProjectionIsStale, CoalescingConfig(window=60))
+
+    sut.handle(ProjectionIsStale(1, 1))
+    sut.set_coalescing(ProjectionIsStale, None)
+    assert handled == [ProjectionIsStale(1, 1)]
+    assert sut.handle(ProjectionIsStale(1, 2)) == [None]
+    assert handled == [ProjectionIsStale(1, 1), ProjectionIsStale(1, 2)]
+
+
+def test_handler_errors_are_given_to_on_error():
+    errors = []
+    reported = threading.Event()
+
+    def on_error(message, error):
+        errors.append((message, error))
+        reported.set()
+
+    def errorful_handler(message):
+        raise RuntimeError(message.entity_id)
+
+    sut = MessageBus()
+    sut.add_handler(ProjectionIsStale, errorful_handler)
+    sut.set_coalescing(
+        ProjectionIsStale,
+        CoalescingConfig(window=0.01, key=lambda m: m.entity_id, on_error=on_error),
+    )
+
+    sut.handle(ProjectionIsStale(1, 1))
+    assert reported.wait(1)
+    sut.handle(ProjectionIsStale(2, 1))
+    sut.flush_coalesced()
+    assert [message for message, _ in errors] == [
+        ProjectionIsStale(1, 1),
+        ProjectionIsStale(2, 1),
+    ]
+    assert all(isinstance(error, RuntimeError) for _, error in errors)
+
+
+def test_a_single_scheduler_thread_runs_while_messages_are_pending():
+    handled = threading.Event()
+    sut = MessageBus()
+    sut.add_handler(ProjectionIsStale, lambda message: handled.set())
+    sut.set_coalescing(
+        ProjectionIsStale, CoalescingConfig(window=0.01, key=lambda m: m.entity_id)
+    )
+
+    for entity_id in range(10):
+        sut.handle(ProjectionIsStale(entity_id, 1))
+    assert get_scheduler_threads_count() == 1
+    assert handled.wait(1)
+    for _ in range(100):
+        if not get_scheduler_threads_count():
+            break
+        time.sleep(0.01)
+    assert get_scheduler_threads_count() == 0
+    assert sut.coalescing_stats(ProjectionIsStale) == (10, 10, 0)
+
+
+def get_scheduler_threads_count():
+    return sum(
+        thread.name == "pymessagebus-coalescer" for thread in threading.enumerate()
+    )
+
+
+class ProjectionIsStale(t.NamedTuple):
+    entity_id: int
+    version: int
+
+
+class OtherMessage:
+    pass
@@ -174,6 +174,161 @@ def test_locking():
     assert result == "handler_one_was_here:handler_two_was_here"
 
 
+def test_handle_many():
+    sut = CommandBus()
+    sut.add_handler(MessageClassOne, get_one)
+    sut.add_handler(MessageClassTwo, get_two)
+
+    handling_results = sut.handle_many(
+        [MessageClassOne(), MessageClassTwo(), MessageClassOne()]
+    )
+    assert handling_results == [1, 2, 1]
+
+    sut = CommandBus(allow_result=False)
+    sut.add_handler(MessageClassOne, get_one)
+    assert sut.handle_many([MessageClassOne(), MessageClassOne()]) == [None, None]
+
+
+def test_handle_many_checks_handlers_before_handling_anything():
+    handled = []
+    sut = CommandBus()
+    sut.add_handler(MessageClassOne, handled.append)
+
+    with pytest.raises(api.CommandHandlerNotFound):
+        sut.handle_many([MessageClassOne(), MessageClassTwo()])
+    assert handled == []
+
+
+def test_iter_handle_many():
+    sut = CommandBus()
+    sut.add_handler(MessageClassOne, get_one)
+    sut.add_handler(MessageClassTwo, get_two)
+
+    messages = (MessageClassOne() if i % 2 else MessageClassTwo() for i in range(5))
+    assert list(sut.iter_handle_many(messages, chunk_size=2)) == [2, 1, 2, 1, 2]
+
+
+@pytest.mark.parametrize("chunk_size", [0, -1])
+def test_iter_handle_many_rejects_invalid_chunk_sizes(chunk_size):
+    sut = CommandBus()
+    sut.add_handler(MessageClassOne, get_one)
+
+    with pytest.raises(ValueError, match="chunk size"):
+        sut.iter_handle_many([MessageClassOne()], chunk_size=chunk_size)
+
+
+def test_locking_is_released_when_a_handler_raises():
+    def errorful_handler(msg):
+        raise RuntimeError("test error")
+
+    sut = CommandBus()
+    sut.add_handler(MessageClassOne, errorful_handler)
+    sut.add_handler(MessageClassTwo, get_two)
+
+    with pytest.raises(RuntimeError):
+        sut.handle(MessageClassOne())
+    assert sut.handle(MessageClassTwo()) == 2
+
+
+def test_locking_is_scoped_to_the_current_thread():
+    import threading
+
+    handler_started = threading.Event()
+    other_thread_done = threading.Event()
+    other_thread_results = []
+
+    def blocking_handler(msg):
+        handler_started.set()
+        assert other_thread_done.wait(1)
+        return "blocking handler result"
+
+    def other_thread():
+        handler_started.wait(1)
+        other_thread_results.append(sut.handle(MessageClassTwo()))
+        other_thread_done.set()
+
+    sut = CommandBus()
+    sut.add_handler(MessageClassOne, blocking_handler)
+    sut.add_handler(MessageClassTwo, get_two)
+
+    thread = threading.Thread(target=other_thread)
+    thread.start()
+    assert sut.handle(MessageClassOne()) == "blocking handler result"
+    thread.join()
+    assert other_thread_results == [2]
+
+
+def test_middlewares_get_a_list_of_results():
+    middleware_results = []
+
+    def middleware(message, next):
+        result = next(message)
+        middleware_results.append(result)
+        return result
+
+    sut = CommandBus(middlewares=[middleware])
+    sut.add_handler(EmptyMessage, get_one)
+
+    assert sut.handle(EmptyMessage()) == 1
+    assert middleware_results == [[1]]
+    assert not hasattr(sut, "__dict__")
+
+
+def test_batch_aware_middlewares_get_lists_of_results():
+    batches_results = []
+
+    class BatchAwareMiddleware:
+        def __call__(self, message, next):
+            return next(message)
+
+        def handle_batch(self, messages, next_batch):
+            results = next_batch(messages)
+            batches_results.append(results)
+            return results
+
+    sut = CommandBus(middlewares=[BatchAwareMiddleware()])
+    sut.add_handler(MessageClassOne, get_one)
+
+    assert sut.handle_many([MessageClassOne(), MessageClassOne()]) == [1, 1]
+    assert batches_results == [[[1], [1]]]
+
+
+def test_middlewares_per_class():
+    middleware_results = []
+
+    def middleware(message, next):
+        result = next(message)
+        middleware_results.append(result)
+        return result
+
+    sut = CommandBus()
+    sut.add_handler(MessageClassOne, get_one)
+    sut.add_handler(MessageClassTwo, get_two)
+    assert sut.handle(MessageClassOne()) == 1
+    sut.add_middleware(MessageClassOne, middleware)
+
+    assert sut.handle(MessageClassOne()) == 1
+    assert sut.handle(MessageClassTwo()) == 2
+    assert middleware_results == [[1]]
+    assert sut.remove_middleware(MessageClassOne, middleware)
+    assert sut.handle(MessageClassOne()) == 1
+    assert middleware_results == [[1]]
+
+
+def test_frozen_bus():
+    sut = CommandBus()
+    sut.add_handler(MessageClassOne, get_one)
+    sut.freeze()
+
+    assert sut.frozen
+    assert sut.handle(MessageClassOne()) == 1
+    with pytest.raises(api.MessageBusFrozen):
+        sut.add_handler(MessageClassTwo, get_two)
+    with pytest.raises(api.MessageBusFrozen):
+        sut.remove_handler(MessageClassOne)
+    assert sut.handle(MessageClassOne()) == 1
+
+
 class EmptyMessage:
     pass
 
@@ -0,0 +1,48 @@
+# pylint: skip-file
+import concurrent.futures
+import threading
+
+import pytest
+
+from pymessagebus import api
+from pymessagebus._deadlines import check_deadline, deadline, remaining_time
+from pymessagebus._messagebus import MessageBus
+from pymessagebus._parallel import ParallelExecutionConfig
+
+
+def test_nested_deadlines_keep_the_closest_one():
+    assert remaining_time() is None
+    with deadline(10) as outer_deadline:
+        assert 9 < remaining_time() <= 10
+        with deadline(100) as inner_deadline:
+            assert inner_deadline == outer_deadline
+        with deadline(1) as inner_deadline:
+            assert inner_deadline < outer_deadline
+            assert remaining_time() <= 1
+        with deadline(None) as inner_deadline:
+            assert inner_deadline == outer_deadline
+        assert remaining_time() > 1
+    assert remaining_time() is None
+
+
+def test_check_deadline():
+    check_deadline()
+    with deadline(0):
+        with pytest.raises(api.DeadlineExceeded):
+            check_deadline()
+
+
+def test_parallel_handlers_honor_the_deadline():
+    release = threading.Event()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        sut = MessageBus(parallel_execution=ParallelExecutionConfig(executor, timeout=10))
+        sut.add_handler(EmptyMessage, lambda message: release.wait(5))
+
+        with deadline(0.02):
+            with pytest.raises(api.DeadlineExceeded):
+                sut.handle(EmptyMessage())
+        release.set()
+
+
+class EmptyMessage:
+    pass
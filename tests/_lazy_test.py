@@ -0,0 +1,82 @@
+# pylint: skip-file
+import pytest
+
+from pymessagebus import api
+from pymessagebus._commandbus import CommandBus
+from pymessagebus._lazy import LazyHandler
+from pymessagebus._messagebus import MessageBus
+
+
+def test_module_path_handlers():
+    sut = MessageBus()
+    sut.add_handler(EmptyMessage, "operator:truth")
+    sut.add_handler(EmptyMessage, "os.path:basename")
+
+    assert sut.has_handler_for(EmptyMessage)
+    assert sut.handle(EmptyMessage()) == [True, "empty"]
+
+    assert sut.remove_handler(EmptyMessage, "os.path:basename") is True
+    assert sut.handle(EmptyMessage()) == [True]
+
+
+def test_loader_handlers_are_loaded_on_first_handling_only():
+    loads = []
+
+    def loader():
+        loads.append("loaded")
+        return get_one
+
+    sut = MessageBus()
+    lazy_handler = LazyHandler(loader)
+    sut.add_handler(EmptyMessage, lazy_handler)
+    sut.add_handler(OtherMessage, get_one)
+    assert loads == []
+
+    sut.handle(OtherMessage())
+    assert loads == []
+
+    assert sut.handle(EmptyMessage()) == [1]
+    assert sut.handle(EmptyMessage()) == [1]
+    assert loads == ["loaded"]
+
+    assert sut.remove_handler(EmptyMessage, lazy_handler) is True
+    assert sut.handle(EmptyMessage()) == []
+
+
+def test_prewarm():
+    loads = []
+
+    def loader():
+        loads.append("loaded")
+        return get_one
+
+    sut = CommandBus()
+    sut.add_handler(EmptyMessage, LazyHandler(loader))
+    sut.prewarm(EmptyMessage)
+    assert loads == ["loaded"]
+    assert sut.handle(EmptyMessage()) == 1
+    assert loads == ["loaded"]
+
+
+def test_invalid_references():
+    sut = MessageBus()
+    with pytest.raises(api.MessageHandlerMappingRequiresACallable):
+        sut.add_handler(EmptyMessage, "not a module path")
+    with pytest.raises(api.MessageHandlerMappingRequiresACallable):
+        LazyHandler(42)
+
+    sut.add_handler(EmptyMessage, "os.path:sep")
+    with pytest.raises(api.MessageHandlerMappingRequiresACallable):
+        sut.handle(EmptyMessage())
+
+
+class EmptyMessage:
+    def __fspath__(self):
+        return "/tmp/empty"
+
+
+class OtherMessage:
+    pass
+
+
+get_one = lambda _: 1
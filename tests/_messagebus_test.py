@@ -1,9 +1,10 @@
 # pylint:  skip-file
+import threading
 import typing as t
 
 import pytest
 
-from pymessagebus import api
+from pymessagebus import LazyHandler, api
 from pymessagebus._messagebus import MessageBus
 
 
@@ -190,6 +191,428 @@ def test_middlewares():
     ]
 
 
+def test_dispatch_plans_are_refreshed_when_handlers_change():
+    sut = MessageBus()
+    sut.add_handler(EmptyMessage, get_one)
+
+    message = EmptyMessage()
+    assert sut.handle(message) == [1]
+
+    sut.add_handler(EmptyMessage, get_two)
+    assert sut.handle(message) == [1, 2]
+
+    sut.remove_handler(EmptyMessage, get_one)
+    assert sut.handle(message) == [2]
+
+    sut.remove_handler(EmptyMessage, get_two)
+    assert sut.handle(message) == []
+
+
+def test_middlewares_are_not_triggered_for_messages_without_handlers():
+    middleware_calls = []
+
+    def middleware(message: object, next: api.CallNextMiddleware):
+        middleware_calls.append(message)
+        return next(message)
+
+    sut = MessageBus(middlewares=[middleware])
+    sut.add_handler(MessageClassOne, get_one)
+
+    assert sut.handle(MessageClassTwo()) == []
+    assert middleware_calls == []
+
+    message = MessageClassOne()
+    assert sut.handle(message) == [1]
+    assert middleware_calls == [message]
+
+
+def test_handle_many():
+    sut = MessageBus()
+    sut.add_handler(MessageClassOne, identity_handler)
+    sut.add_handler(MessageClassOne, get_one)
+    sut.add_handler(MessageClassTwo, identity_handler)
+
+    messages = [MessageClassOne(), MessageClassTwo(), EmptyMessage(), MessageClassOne()]
+    handling_results = sut.handle_many(messages)
+    assert handling_results == [
+        [messages[0], 1],
+        [messages[1]],
+        [],
+        [messages[3], 1],
+    ]
+
+
+def test_handle_many_processes_messages_grouped_by_class():
+    handled = []
+
+    def handler(message):
+        handled.append(message)
+
+    sut = MessageBus()
+    sut.add_handler(MessageClassOne, handler)
+    sut.add_handler(MessageClassTwo, handler)
+
+    messages = [MessageClassOne(), MessageClassTwo(), MessageClassOne()]
+    sut.handle_many(messages)
+    assert handled == [messages[0], messages[2], messages[1]]
+
+
+def test_iter_handle_many():
+    sut = MessageBus()
+    sut.add_handler(MessageClassOne, get_one)
+    sut.add_handler(MessageClassTwo, get_two)
+
+    def messages():
+        for i in range(10):
+            yield MessageClassOne() if i % 3 else MessageClassTwo()
+
+    handling_results = sut.iter_handle_many(messages(), chunk_size=4)
+    assert next(handling_results) == [2]
+    assert list(handling_results) == [[1], [1], [2], [1], [1], [2], [1], [1], [2]]
+
+
+@pytest.mark.parametrize("chunk_size", [0, -1])
+def test_iter_handle_many_rejects_invalid_chunk_sizes(chunk_size):
+    sut = MessageBus()
+    sut.add_handler(MessageClassOne, get_one)
+
+    with pytest.raises(ValueError, match="chunk size"):
+        sut.iter_handle_many([MessageClassOne()], chunk_size=chunk_size)
+
+
+def test_handle_many_with_batch_aware_middlewares():
+    class BatchAwareMiddleware:
+        def __init__(self):
+            self.calls = []
+
+        def __call__(self, message, next):
+            self.calls.append("single")
+            return next(message)
+
+        def handle_batch(self, messages, next_batch):
+            self.calls.append(f"batch of {len(messages)}")
+            return next_batch(messages)
+
+    batch_aware_middleware = BatchAwareMiddleware()
+    sut = MessageBus(middlewares=[batch_aware_middleware])
+    sut.add_handler(MessageClassOne, get_one)
+    sut.add_handler(MessageClassTwo, get_two)
+
+    handling_results = sut.handle_many(
+        [MessageClassOne(), MessageClassTwo(), MessageClassOne()]
+    )
+    assert handling_results == [[1], [2], [1]]
+    assert batch_aware_middleware.calls == ["batch of 2", "batch of 1"]
+
+    # Middlewares which are not batch-aware make the bus fall back to the message-per-message processing:
+    other_middleware = lambda message, next: next(message)
+    sut = MessageBus(middlewares=[batch_aware_middleware, other_middleware])
+    sut.add_handler(MessageClassOne, get_one)
+
+    batch_aware_middleware.calls = []
+    handling_results = sut.handle_many([MessageClassOne(), MessageClassOne()])
+    assert handling_results == [[1], [1]]
+    assert batch_aware_middleware.calls == ["single", "single"]
+
+
+def test_handlers_of_parent_classes_are_not_triggered_by_default():
+    sut = MessageBus()
+    sut.add_handler(ParentMessage, get_one)
+
+    assert sut.has_handler_for(ChildMessage) is False
+    assert sut.handle(ChildMessage()) == []
+
+
+def test_polymorphic_bus():
+    import abc
+
+    class AbstractMessage(abc.ABC):
+        pass
+
+    class ConcreteMessage(AbstractMessage):
+        pass
+
+    sut = MessageBus(polymorphic=True)
+    sut.add_handler(ParentMessage, get_one)
+    sut.add_handler(ChildMessage, get_two)
+    sut.add_handler(AbstractMessage, get_three)
+
+    assert sut.has_handler_for(ChildMessage) is True
+    assert sut.has_handler_for(GrandChildMessage) is True
+    # Handlers registered for the most specific classes come first:
+    assert sut.handle(GrandChildMessage()) == [2, 1]
+    assert sut.handle(ChildMessage()) == [2, 1]
+    assert sut.handle(ParentMessage()) == [1]
+    assert sut.handle(ConcreteMessage()) == [3]
+
+    # Changing the handlers of a parent class updates the subclasses dispatch:
+    sut.add_handler(ParentMessage, get_three)
+    assert sut.handle(GrandChildMessage()) == [2, 1, 3]
+    sut.remove_handler(ParentMessage, get_one)
+    assert sut.handle(GrandChildMessage()) == [2, 3]
+    assert sut.handle_many([ChildMessage(), ParentMessage()]) == [[2, 3], [3]]
+
+
+def test_buses_have_no_instance_dict():
+    sut = MessageBus()
+    assert not hasattr(sut, "__dict__")
+
+
+def test_handlers_priority():
+    sut = MessageBus()
+    sut.add_handler(EmptyMessage, get_one)
+    sut.add_handler(EmptyMessage, get_two, priority=10)
+    sut.add_handler(EmptyMessage, get_three, priority=-5)
+    sut.add_handler(EmptyMessage, identity_handler, priority=10)
+
+    message = EmptyMessage()
+    assert sut.handle(message) == [2, message, 1, 3]
+
+    sut.remove_handler(EmptyMessage, get_two)
+    assert sut.handle(message) == [message, 1, 3]
+
+
+def test_handlers_priority_with_polymorphic_bus():
+    sut = MessageBus(polymorphic=True)
+    sut.add_handler(ParentMessage, get_one, priority=1)
+    sut.add_handler(ParentMessage, get_two)
+    sut.add_handler(ChildMessage, get_three)
+
+    assert sut.handle(ChildMessage()) == [1, 3, 2]
+
+
+def test_handlers_predicates():
+    class MessageWithPayload(t.NamedTuple):
+        payload: int
+
+    sut = MessageBus()
+    sut.add_handler(MessageWithPayload, get_one, predicate=lambda m: m.payload > 10)
+    sut.add_handler(MessageWithPayload, get_two)
+    sut.add_handler(
+        MessageWithPayload, get_three, predicate=lambda m: m.payload % 2 == 0
+    )
+
+    assert sut.handle(MessageWithPayload(payload=1)) == [2]
+    assert sut.handle(MessageWithPayload(payload=2)) == [2, 3]
+    assert sut.handle(MessageWithPayload(payload=11)) == [1, 2]
+    assert sut.handle(MessageWithPayload(payload=12)) == [1, 2, 3]
+
+    with pytest.raises(api.MessageHandlerMappingRequiresACallable):
+        sut.add_handler(MessageWithPayload, get_one, predicate=True)
+
+
+def test_handlers_can_stop_propagation():
+    triggered_handlers = []
+
+    def stopping_handler(message):
+        triggered_handlers.append("stopping")
+        return api.StopPropagation("stopped")
+
+    def other_handler(message):
+        triggered_handlers.append("other")
+        return "other"
+
+    sut = MessageBus()
+    sut.add_handler(EmptyMessage, get_one)
+    sut.add_handler(EmptyMessage, stopping_handler)
+    sut.add_handler(EmptyMessage, other_handler)
+
+    assert sut.handle(EmptyMessage()) == [1, "stopped"]
+    assert triggered_handlers == ["stopping"]
+
+    # With a single handler the result is simply unwrapped:
+    sut.add_handler(MessageClassOne, stopping_handler)
+    assert sut.handle(MessageClassOne()) == ["stopped"]
+
+    # Same thing when some handlers have a predicate:
+    sut.add_handler(MessageClassTwo, get_one, predicate=lambda m: False)
+    sut.add_handler(MessageClassTwo, stopping_handler)
+    sut.add_handler(MessageClassTwo, other_handler)
+    triggered_handlers.clear()
+    assert sut.handle(MessageClassTwo()) == ["stopped"]
+    assert triggered_handlers == ["stopping"]
+
+
+def test_handle_first():
+    triggered_handlers = []
+
+    def get_none(message):
+        triggered_handlers.append("none")
+        return None
+
+    def get_first(message):
+        triggered_handlers.append("first")
+        return "first"
+
+    def get_second(message):
+        triggered_handlers.append("second")
+        return "second"
+
+    received_messages = []
+
+    def middleware(message, next_):
+        received_messages.append(message)
+        return next_(message)
+
+    sut = MessageBus(middlewares=[middleware])
+    assert sut.handle_first(EmptyMessage()) is None
+    assert received_messages == []
+
+    sut.add_handler(EmptyMessage, get_none)
+    sut.add_handler(EmptyMessage, get_first)
+    sut.add_handler(EmptyMessage, get_second)
+
+    message = EmptyMessage()
+    assert sut.handle_first(message) == "first"
+    assert triggered_handlers == ["none", "first"]
+    assert received_messages == [message]
+
+    # Registering a new handler invalidates the compiled plan:
+    sut.add_handler(EmptyMessage, get_second, priority=1)
+    triggered_handlers.clear()
+    assert sut.handle_first(EmptyMessage()) == "second"
+    assert triggered_handlers == ["second"]
+
+    # `StopPropagation` allows a handler to stop the chain with a `None` result:
+    sut.add_handler(MessageClassOne, lambda m: api.StopPropagation())
+    sut.add_handler(MessageClassOne, get_first)
+    assert sut.handle_first(MessageClassOne()) is None
+
+    sut.add_handler(MessageClassTwo, get_first, predicate=lambda m: False)
+    sut.add_handler(MessageClassTwo, get_second)
+    assert sut.handle_first(MessageClassTwo()) == "second"
+
+
+def test_middlewares_per_class():
+    calls = []
+
+    def get_middleware(name: str):
+        def middleware(message, next_):
+            calls.append(name)
+            return next_(message)
+
+        return middleware
+
+    global_middleware = get_middleware("global")
+    sut = MessageBus(middlewares=[global_middleware])
+    sut.add_handler(MessageClassOne, get_one)
+    sut.add_handler(MessageClassTwo, get_two)
+    sut.handle(MessageClassTwo())
+    other_class_dispatch_plan = sut._dispatch_plans[MessageClassTwo]
+
+    class_one_middleware = get_middleware("class one")
+    sut.add_middleware(MessageClassOne, class_one_middleware)
+    sut.add_middleware(MessageClassOne, get_middleware("class one again"))
+    # Only the dispatch plan of the affected class is dropped:
+    assert sut._dispatch_plans[MessageClassTwo] is other_class_dispatch_plan
+
+    assert sut.handle(MessageClassOne()) == [1]
+    assert calls == ["global", "global", "class one", "class one again"]
+    calls.clear()
+    assert sut.handle(MessageClassTwo()) == [2]
+    assert calls == ["global"]
+
+    calls.clear()
+    assert sut.remove_middleware(MessageClassOne, class_one_middleware)
+    assert not sut.remove_middleware(MessageClassOne, class_one_middleware)
+    sut.handle(MessageClassOne())
+    assert calls == ["global", "class one again"]
+
+    with pytest.raises(api.MessageHandlerMappingRequiresACallable):
+        sut.add_middleware(MessageClassOne, "not a middleware")
+
+
+def test_middlewares_per_class_with_polymorphic_bus():
+    calls = []
+
+    def get_middleware(name: str):
+        def middleware(message, next_):
+            calls.append(name)
+            return next_(message)
+
+        return middleware
+
+    sut = MessageBus(polymorphic=True)
+    sut.add_handler(ParentMessage, get_one)
+    sut.add_middleware(ChildMessage, get_middleware("child"))
+    sut.add_middleware(ParentMessage, get_middleware("parent"))
+
+    assert sut.handle(GrandChildMessage()) == [1]
+    assert calls == ["parent", "child"]
+    calls.clear()
+    assert sut.handle(ParentMessage()) == [1]
+    assert calls == ["parent"]
+
+
+def test_plans_compiled_while_the_registry_changes_are_not_kept():
+    sut = MessageBus()
+
+    def load_handler():
+        # The registry changes while the dispatch plan is being compiled:
+        sut.add_handler(EmptyMessage, get_two)
+        return get_one
+
+    sut.add_handler(EmptyMessage, LazyHandler(load_handler))
+    assert sut.handle(EmptyMessage()) == [1]
+    # ...so that this now stale plan has not been kept:
+    assert EmptyMessage not in sut._dispatch_plans
+    assert sut.handle(EmptyMessage()) == [1, 2]
+
+
+def test_registrations_dont_disturb_concurrent_dispatches():
+    sut = MessageBus()
+    sut.add_handler(EmptyMessage, get_one)
+    done = threading.Event()
+    errors = []
+
+    def dispatch():
+        try:
+            while not done.is_set():
+                results = sut.handle(EmptyMessage())
+                assert results[0] == 1 and set(results[1:]) <= {2}
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=dispatch) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for _ in range(300):
+        sut.add_handler(EmptyMessage, get_two)
+        sut.add_middleware(EmptyMessage, passthrough_middleware)
+        sut.remove_handler(EmptyMessage, get_two)
+        sut.remove_middleware(EmptyMessage, passthrough_middleware)
+    done.set()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sut.handle(EmptyMessage()) == [1]
+
+
+def test_frozen_bus():
+    sut = MessageBus()
+    sut.add_handler(MessageClassOne, LazyHandler(lambda: get_one))
+    sut.add_handler(MessageClassTwo, get_two)
+    assert not sut.frozen
+
+    sut.freeze()
+    assert sut.frozen
+    # Dispatch plans are compiled right away:
+    assert set(sut._dispatch_plans) == {MessageClassOne, MessageClassTwo}
+    assert sut.handle(MessageClassOne()) == [1]
+    assert sut.handle(EmptyMessage()) == []
+
+    with pytest.raises(api.MessageBusFrozen):
+        sut.add_handler(MessageClassOne, get_three)
+    with pytest.raises(api.MessageBusFrozen):
+        sut.remove_handler(MessageClassTwo, get_two)
+    with pytest.raises(api.MessageBusFrozen):
+        sut.add_middleware(MessageClassTwo, passthrough_middleware)
+    with pytest.raises(api.MessageBusFrozen):
+        sut.set_parallel_execution(MessageClassTwo, None)
+    assert sut.handle(MessageClassTwo()) == [2]
+
+
 class EmptyMessage:
     pass
 
@@ -202,6 +625,18 @@ class MessageClassTwo:
     pass
 
 
+class ParentMessage:
+    pass
+
+
+class ChildMessage(ParentMessage):
+    pass
+
+
+class GrandChildMessage(ChildMessage):
+    pass
+
+
 def identity_handler(message: object) -> object:
     return message
 
@@ -209,3 +644,7 @@ def identity_handler(message: object) -> object:
 get_one = lambda _: 1
 get_two = lambda _: 2
 get_three = lambda _: 3
+
+
+def passthrough_middleware(message: object, next_: t.Callable) -> object:
+    return next_(message)
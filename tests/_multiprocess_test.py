@@ -0,0 +1,171 @@
+# pylint: skip-file
+import multiprocessing
+import os
+import threading
+import time
+import typing as t
+
+import pytest
+
+from pymessagebus import api, deadline
+from pymessagebus._multiprocess import ProcessMessageBus
+from pymessagebus._serialization import SerializerRegistry
+
+# The ProcessMessageBus requires Python 3.8+:
+pytest.importorskip("multiprocessing.shared_memory")
+
+
+def test_handlers_run_in_worker_processes():
+    with ProcessMessageBus(workers=2) as sut:
+        sut.add_handler(Square, get_square)
+        sut.add_handler(Square, get_pid)
+
+        assert sut.has_handler_for(Square)
+        assert not sut.has_handler_for(EmptyMessage)
+        result = sut.handle(Square(value=3))
+        assert result[0] == 9
+        assert result[1] != os.getpid()
+        # No handlers means an empty list of results, as for a regular MessageBus:
+        assert sut.handle(EmptyMessage()) == []
+
+
+def test_handlers_exceptions_are_set_on_the_futures():
+    with ProcessMessageBus(workers=1) as sut:
+        sut.add_handler(Square, raise_value_error)
+
+        future = sut.dispatch(Square(value=3))
+        with pytest.raises(ValueError, match="3"):
+            future.result(timeout=10)
+
+
+def test_messages_can_be_routed_or_partitioned():
+    with ProcessMessageBus(workers=3) as sut:
+        sut.add_handler(Square, get_pid)
+        sut.add_handler(EmptyMessage, get_pid)
+        sut.route(EmptyMessage, 1)
+        sut.partition_by(Square, lambda message: message.value % 2)
+
+        futures = [sut.dispatch(EmptyMessage()) for _ in range(5)]
+        assert len({future.result(timeout=10)[0] for future in futures}) == 1
+
+        futures = [sut.dispatch(Square(value=i)) for i in range(10)]
+        pids_per_key: t.Dict[int, t.Set[int]] = {0: set(), 1: set()}
+        for i, future in enumerate(futures):
+            pids_per_key[i % 2].add(future.result(timeout=10)[0])
+        assert [len(pids) for pids in pids_per_key.values()] == [1, 1]
+
+        with pytest.raises(ValueError):
+            sut.route(EmptyMessage, 3)
+
+
+def test_ring_buffers_wrap_around():
+    serializer = SerializerRegistry()
+    serializer.register(Square, class_id=1)
+    serializer.register(BigMessage, class_id=2)
+    with ProcessMessageBus(workers=1, serializer=serializer, ring_size=256) as sut:
+        sut.add_handler(Square, get_square)
+
+        futures = [sut.dispatch(Square(value=i)) for i in range(200)]
+        assert [future.result(timeout=10) for future in futures] == [
+            [i * i] for i in range(200)
+        ]
+        with pytest.raises(api.MessageQueueFull):
+            sut.handle(BigMessage(payload=b"x" * 1000))
+
+
+def test_lazy_handlers_with_spawned_processes():
+    mp_context = multiprocessing.get_context("spawn")
+    with ProcessMessageBus(workers=1, mp_context=mp_context) as sut:
+        sut.add_handler(Square, "tests._multiprocess_test:get_square")
+
+        assert sut.handle(Square(value=4)) == [16]
+
+
+def test_handlers_cannot_be_registered_once_started():
+    sut = ProcessMessageBus(workers=1)
+    sut.add_handler(Square, get_square)
+    assert sut.remove_handler(Square, get_square)
+    assert not sut.remove_handler(Square, get_square)
+    sut.start()
+    try:
+        with pytest.raises(RuntimeError):
+            sut.add_handler(Square, get_square)
+    finally:
+        sut.shutdown()
+    with pytest.raises(RuntimeError):
+        sut.dispatch(Square(value=1))
+
+
+def test_a_dead_worker_only_fails_its_own_messages():
+    with ProcessMessageBus(workers=2, timeout=10) as sut:
+        sut.add_handler(Square, get_square)
+        sut.add_handler(EmptyMessage, exit_process)
+        sut.route(EmptyMessage, 0)
+        sut.partition_by(Square, lambda message: 1)
+
+        with pytest.raises(RuntimeError, match="died unexpectedly"):
+            sut.handle(EmptyMessage())
+        # The other worker is not affected...
+        assert sut.handle(Square(value=3)) == [9]
+        # ...while the messages routed to the dead one are rejected right away:
+        with pytest.raises(RuntimeError, match="is dead"):
+            sut.dispatch(EmptyMessage())
+
+
+def test_handle_timeout():
+    with ProcessMessageBus(workers=1, timeout=0.05) as sut:
+        sut.add_handler(Square, sleep_for_value)
+
+        with pytest.raises(api.MessageHandlersTimeout):
+            sut.handle(Square(value=1))
+        with deadline(0.05):
+            with pytest.raises(api.DeadlineExceeded):
+                sut.handle(Square(value=1))
+        assert sut.dispatch(Square(value=0)).result(timeout=10) == [None]
+
+
+def test_shared_memory_is_released_without_waiting():
+    sut = ProcessMessageBus(workers=1, ring_size=256)
+    sut.add_handler(Square, get_square)
+    # Enough messages to have to wait for the worker to free some room in the ring:
+    futures = [sut.dispatch(Square(value=i)) for i in range(100)]
+    memory_names = [memory.name for memory in sut._workers[0].memories]
+
+    sut.shutdown(wait=False)
+    assert [future.result(timeout=10) for future in futures][-1] == [99 * 99]
+    for thread in threading.enumerate():
+        if thread.name == "pymessagebus-process-shutdown":
+            thread.join(timeout=10)
+    assert not any(os.path.exists(f"/dev/shm/{name}") for name in memory_names)
+
+
+class Square(t.NamedTuple):
+    value: int
+
+
+class BigMessage(t.NamedTuple):
+    payload: bytes
+
+
+class EmptyMessage:
+    pass
+
+
+def get_square(message: Square) -> int:
+    return message.value ** 2
+
+
+def get_pid(message: object) -> int:
+    return os.getpid()
+
+
+def raise_value_error(message: Square) -> None:
+    raise ValueError(message.value)
+
+
+def exit_process(message: object) -> None:
+    os._exit(1)
+
+
+def sleep_for_value(message: Square) -> None:
+    time.sleep(message.value)
@@ -0,0 +1,158 @@
+# pylint: skip-file
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+from pymessagebus import api, deadline, remaining_time
+from pymessagebus._messagebus import MessageBus
+from pymessagebus._parallel import ParallelExecutionConfig
+
+
+def test_handlers_run_in_parallel_and_results_keep_registration_order():
+    barrier = threading.Barrier(3, timeout=1)
+
+    def handler(result):
+        def wait_for_the_other_handlers(message):
+            # Would time out if the handlers were run one after another:
+            barrier.wait()
+            return result
+
+        return wait_for_the_other_handlers
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        sut = MessageBus(parallel_execution=ParallelExecutionConfig(executor))
+        sut.add_handler(EmptyMessage, handler(1))
+        sut.add_handler(EmptyMessage, handler(2))
+        sut.add_handler(EmptyMessage, handler(3))
+
+        assert sut.handle(EmptyMessage()) == [1, 2, 3]
+
+
+def test_parallel_execution_can_be_set_per_message_class():
+    threads = []
+
+    def handler(message):
+        threads.append(threading.current_thread())
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        sut = MessageBus()
+        sut.add_handler(MessageClassOne, handler)
+        sut.add_handler(MessageClassTwo, handler)
+        sut.set_parallel_execution(MessageClassOne, ParallelExecutionConfig(executor))
+
+        sut.handle(MessageClassOne())
+        sut.handle(MessageClassTwo())
+        assert threads[0] is not threading.current_thread()
+        assert threads[1] is threading.current_thread()
+
+        sut.set_parallel_execution(MessageClassOne, None)
+        sut.handle(MessageClassOne())
+        assert threads[2] is threading.current_thread()
+
+
+def test_first_error_in_registration_order_is_raised():
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        sut = MessageBus(parallel_execution=ParallelExecutionConfig(executor))
+        sut.add_handler(EmptyMessage, get_one)
+        sut.add_handler(EmptyMessage, raise_value_error)
+        sut.add_handler(EmptyMessage, raise_runtime_error)
+
+        with pytest.raises(ValueError):
+            sut.handle(EmptyMessage())
+
+
+def test_errors_can_be_returned_as_results():
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        config = ParallelExecutionConfig(executor, return_exceptions=True)
+        sut = MessageBus(parallel_execution=config)
+        sut.add_handler(EmptyMessage, raise_value_error)
+        sut.add_handler(EmptyMessage, get_one)
+
+        result = sut.handle(EmptyMessage())
+        assert isinstance(result[0], ValueError)
+        assert result[1] == 1
+
+
+def test_timeout():
+    release = threading.Event()
+
+    def slow_handler(message):
+        release.wait(1)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        config = ParallelExecutionConfig(executor, timeout=0.01)
+        sut = MessageBus(parallel_execution=config)
+        sut.add_handler(EmptyMessage, slow_handler)
+        sut.add_handler(EmptyMessage, get_one)
+
+        with pytest.raises(api.MessageHandlersTimeout):
+            sut.handle(EmptyMessage())
+        release.set()
+
+
+def test_handlers_see_the_dispatching_context():
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        sut = MessageBus(parallel_execution=ParallelExecutionConfig(executor))
+        sut.add_handler(EmptyMessage, lambda message: remaining_time())
+        sut.add_handler(EmptyMessage, lambda message: remaining_time())
+
+        assert sut.handle(EmptyMessage()) == [None, None]
+        with deadline(10):
+            assert all(0 < remaining <= 10 for remaining in sut.handle(EmptyMessage()))
+
+
+def test_process_pool():
+    with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+        sut = MessageBus(parallel_execution=ParallelExecutionConfig(executor))
+        sut.add_handler(EmptyMessage, get_one)
+        sut.add_handler(EmptyMessage, get_two)
+
+        assert sut.handle(EmptyMessage()) == [1, 2]
+
+
+def test_predicates_are_applied_before_submission():
+    submitted = []
+
+    class RecordingExecutor(concurrent.futures.ThreadPoolExecutor):
+        def submit(self, fn, *args, **kwargs):
+            submitted.append(args[0])  # (handler, message), run in a copied context
+            return super().submit(fn, *args, **kwargs)
+
+    with RecordingExecutor(max_workers=2) as executor:
+        sut = MessageBus(parallel_execution=ParallelExecutionConfig(executor))
+        sut.add_handler(EmptyMessage, get_one, predicate=lambda m: False)
+        sut.add_handler(EmptyMessage, get_two)
+
+        assert sut.handle(EmptyMessage()) == [2]
+        assert submitted == [get_two]
+
+
+class EmptyMessage:
+    pass
+
+
+class MessageClassOne:
+    pass
+
+
+class MessageClassTwo:
+    pass
+
+
+def get_one(_):
+    return 1
+
+
+def get_two(_):
+    return 2
+
+
+def raise_value_error(_):
+    time.sleep(0.01)
+    raise ValueError()
+
+
+def raise_runtime_error(_):
+    raise RuntimeError()
@@ -0,0 +1,155 @@
+# pylint: skip-file
+import asyncio
+import threading
+import time
+import typing as t
+
+import pytest
+
+from pymessagebus._async_commandbus import AsyncCommandBus
+from pymessagebus._commandbus import CommandBus
+from pymessagebus._partitioned import AsyncPartitionedBus, PartitionedBus
+
+
+def test_commands_are_ordered_per_partition_key():
+    handled_commands: t.List[RenameCustomer] = []
+
+    def handler(command: RenameCustomer) -> str:
+        time.sleep(0.001 * (command.sequence % 3))
+        handled_commands.append(command)
+        return command.name
+
+    bus = CommandBus()
+    bus.add_handler(RenameCustomer, handler)
+
+    with PartitionedBus(bus, lanes=4) as sut:
+        sut.set_partition_key(RenameCustomer, lambda command: command.customer_id)
+        commands = [
+            RenameCustomer(customer_id=i % 5, sequence=i, name=f"name {i}")
+            for i in range(50)
+        ]
+        futures = [sut.dispatch(command) for command in commands]
+        assert [future.result(timeout=5) for future in futures] == [
+            command.name for command in commands
+        ]
+
+    for customer_id in range(5):
+        assert [c for c in handled_commands if c.customer_id == customer_id] == [
+            c for c in commands if c.customer_id == customer_id
+        ]
+    assert sum(metrics.processed for metrics in sut.metrics()) == 50
+
+
+def test_different_partitions_are_handled_concurrently():
+    # Both commands must be handled at the same time for the barrier to be passed:
+    barrier = threading.Barrier(2, timeout=5)
+
+    def handler(command: RenameCustomer) -> int:
+        barrier.wait()
+        return command.customer_id
+
+    bus = CommandBus()
+    bus.add_handler(RenameCustomer, handler)
+
+    with PartitionedBus(bus, lanes=2) as sut:
+        sut.set_partition_key(RenameCustomer, lambda command: command.customer_id)
+        futures = [
+            sut.dispatch(RenameCustomer(customer_id=i, sequence=0, name=""))
+            for i in (0, 1)
+        ]
+        assert [future.result(timeout=5) for future in futures] == [0, 1]
+
+
+def test_leaving_the_with_block_waits_for_the_queued_commands():
+    handled_commands: t.List[RenameCustomer] = []
+
+    def handler(command: RenameCustomer) -> str:
+        time.sleep(0.01)
+        handled_commands.append(command)
+        return command.name
+
+    bus = CommandBus()
+    bus.add_handler(RenameCustomer, handler)
+
+    with PartitionedBus(bus, lanes=2) as sut:
+        futures = [
+            sut.dispatch(RenameCustomer(customer_id=0, sequence=i, name=f"name {i}"))
+            for i in range(4)
+        ]
+
+    assert len(handled_commands) == 4
+    assert all(future.done() for future in futures)
+
+
+def test_lanes_count_must_be_positive():
+    with pytest.raises(ValueError):
+        PartitionedBus(CommandBus(), lanes=0)
+
+
+def test_async_partitioned_bus():
+    handled_commands: t.List[RenameCustomer] = []
+
+    async def handler(command: RenameCustomer) -> int:
+        await asyncio.sleep(0.001 * (command.sequence % 3))
+        handled_commands.append(command)
+        return command.sequence
+
+    bus = AsyncCommandBus()
+    bus.add_handler(RenameCustomer, handler)
+
+    async def scenario():
+        sut = AsyncPartitionedBus(bus, lanes=3)
+        sut.set_partition_key(RenameCustomer, lambda command: command.customer_id)
+        futures = [
+            await sut.dispatch(RenameCustomer(customer_id=i % 4, sequence=i, name=""))
+            for i in range(20)
+        ]
+        results = await asyncio.gather(*futures)
+        await sut.shutdown()
+        return results
+
+    assert run(scenario()) == list(range(20))
+    for customer_id in range(4):
+        sequences = [c.sequence for c in handled_commands if c.customer_id == customer_id]
+        assert sequences == sorted(sequences)
+
+
+def test_async_partitioned_bus_dispatch_from_a_handler():
+    bus = AsyncCommandBus()
+    sut = AsyncPartitionedBus(bus, lanes=2)
+    sut.set_partition_key(RenameCustomer, lambda command: command.customer_id)
+    follow_ups: t.List[asyncio.Future] = []
+
+    async def handler(command: RenameCustomer) -> int:
+        if command.name == "start":
+            # This first dispatch starts the lane of the follow-up commands: its worker
+            # must not inherit the context of this handler, where the bus is busy.
+            next_command = command._replace(sequence=command.sequence + 1, name="")
+            follow_ups.append(await sut.dispatch(next_command))
+        return command.sequence
+
+    bus.add_handler(RenameCustomer, handler)
+
+    async def scenario():
+        started = await bus.handle(RenameCustomer(customer_id=1, sequence=0, name="start"))
+        follow_up_result = await follow_ups[0]
+        other = await sut.dispatch(RenameCustomer(customer_id=1, sequence=5, name=""))
+        other_result = await other
+        await sut.shutdown()
+        return started, follow_up_result, other_result
+
+    assert run(scenario()) == (0, 1, 5)
+
+
+def run(coroutine: t.Awaitable) -> t.Any:
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class RenameCustomer(t.NamedTuple):
+    customer_id: int
+    sequence: int
+    name: str
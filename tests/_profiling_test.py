@@ -0,0 +1,165 @@
+# pylint: skip-file
+import asyncio
+import contextlib
+import time
+import traceback
+import typing as t
+
+import pytest
+
+from pymessagebus import AsyncMessageBus, CommandBus, MessageBus, Profiler, ProfilerConfig
+
+
+def test_each_layer_and_handler_gets_its_own_frame():
+    profiler = Profiler()
+    sut = MessageBus(middlewares=[sleepy_middleware])
+    sut.add_handler(EmptyMessage, sleepy_handler)
+    sut.add_handler(EmptyMessage, get_one)
+    assert sut.handle(EmptyMessage()) == [None, 1]
+
+    sut.set_profiler(profiler)
+    assert sut.handle(EmptyMessage()) == [None, 1]
+    assert sut.handle(EmptyMessage()) == [None, 1]
+
+    message_frame = f"message:{M}.EmptyMessage"
+    middleware_frame = f"{message_frame};middleware:{M}.sleepy_middleware"
+    stats = profiler.stats()
+    assert set(stats) == {
+        message_frame,
+        middleware_frame,
+        f"{middleware_frame};handler:{M}.sleepy_handler",
+        f"{middleware_frame};handler:{M}.get_one",
+    }
+    assert all(frame_stats.calls == 2 for frame_stats in stats.values())
+    handler_stats = stats[f"{middleware_frame};handler:{M}.sleepy_handler"]
+    assert handler_stats.self_ns >= 2 * 1_000_000
+    assert stats[middleware_frame].self_ns >= 2 * 1_000_000
+    assert stats[middleware_frame].total_ns > (
+        stats[middleware_frame].self_ns + handler_stats.total_ns
+    )
+
+    collapsed_stacks = profiler.collapsed_stacks().splitlines()
+    assert len(collapsed_stacks) == 4
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in collapsed_stacks)
+
+    # Switching the profiler off recompiles the regular dispatch plans:
+    sut.set_profiler(None)
+    profiler.reset()
+    assert sut.handle(EmptyMessage()) == [None, 1]
+    assert profiler.stats() == {}
+
+
+def test_sampling_and_nested_messages():
+    profiler = Profiler(ProfilerConfig(sample_every=3))
+    inner_bus = CommandBus()
+    inner_bus.add_handler(OtherMessage, get_one)
+    inner_bus.set_profiler(profiler)
+    outer_bus = MessageBus()
+    outer_bus.add_handler(EmptyMessage, lambda message: inner_bus.handle(OtherMessage()))
+    outer_bus.set_profiler(profiler)
+
+    for _ in range(6):
+        assert outer_bus.handle(EmptyMessage()) == [1]
+    for _ in range(3):
+        assert inner_bus.handle(OtherMessage()) == 1
+
+    stats = profiler.stats()
+    assert stats[f"message:{M}.EmptyMessage"].calls == 2
+    nested_paths = [p for p in stats if ";" in p and p.endswith("OtherMessage")]
+    # Nested messages of the sampled messages are always profiled, and attached to them:
+    assert nested_paths == [
+        f"message:{M}.EmptyMessage;"
+        f"handler:{M}.test_sampling_and_nested_messages.<locals>.<lambda>;"
+        f"message:{M}.OtherMessage"
+    ]
+    assert stats[nested_paths[0]].calls == 2
+    # ...while the ones of the other messages are sampled on their own:
+    assert stats[f"message:{M}.OtherMessage"].calls == 1
+
+
+def test_span_hooks_and_async_buses():
+    spans = []
+
+    @contextlib.contextmanager
+    def span_factory(name, message):
+        spans.append(("start", name))
+        yield
+        spans.append(("end", name))
+
+    profiler = Profiler(ProfilerConfig(span_factory=span_factory))
+    sut = AsyncMessageBus(middlewares=[async_middleware], concurrent_handlers=True)
+    sut.add_handler(EmptyMessage, async_get_one)
+    sut.add_handler(EmptyMessage, get_one)
+    sut.set_profiler(profiler)
+
+    assert run(sut.handle(EmptyMessage())) == [1, 1]
+    assert run(sut.handle_first(EmptyMessage())) == 1
+    assert spans[:3] == [
+        ("start", f"message:{M}.EmptyMessage"),
+        ("start", f"middleware:{M}.async_middleware"),
+        ("start", f"handler:{M}.async_get_one"),
+    ]
+    assert spans[-1] == ("end", f"message:{M}.EmptyMessage")
+    stats = profiler.stats()
+    handler_path = (
+        f"message:{M}.EmptyMessage;"
+        f"middleware:{M}.async_middleware;"
+        f"handler:{M}.async_get_one"
+    )
+    assert stats[handler_path].calls == 2
+
+
+def test_middleware_layers_are_named_after_their_middleware():
+    def failing_handler(message):
+        raise RuntimeError()
+
+    sut = MessageBus(middlewares=[passthrough_middleware])
+    sut.add_handler(EmptyMessage, failing_handler)
+    with pytest.raises(RuntimeError) as error:
+        sut.handle(EmptyMessage())
+    frame_names = [frame.name for frame in traceback.extract_tb(error.value.__traceback__)]
+    assert "middleware_callable[passthrough_middleware]" in frame_names
+
+
+M = __name__
+
+
+def run(coroutine: t.Awaitable) -> t.Any:
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class EmptyMessage:
+    pass
+
+
+class OtherMessage:
+    pass
+
+
+def sleepy_middleware(message, next_):
+    time.sleep(0.001)
+    return next_(message)
+
+
+def passthrough_middleware(message, next_):
+    return next_(message)
+
+
+async def async_middleware(message, next_):
+    return await next_(message)
+
+
+def sleepy_handler(message):
+    time.sleep(0.001)
+
+
+def get_one(message):
+    return 1
+
+
+async def async_get_one(message):
+    return 1
@@ -0,0 +1,217 @@
+# pylint: skip-file
+import asyncio
+import contextvars
+import threading
+import time
+import typing as t
+
+import pytest
+
+from pymessagebus import api
+from pymessagebus._async_messagebus import AsyncMessageBus
+from pymessagebus._commandbus import CommandBus
+from pymessagebus._messagebus import MessageBus
+from pymessagebus._queued import AsyncQueuedBus, QueuedBus, QueueOverflowPolicy
+
+
+def test_dispatch_returns_a_future():
+    bus = MessageBus()
+    bus.add_handler(EmptyMessage, get_one)
+    bus.add_handler(EmptyMessage, get_two)
+
+    with QueuedBus(bus, workers=2) as sut:
+        futures = [sut.dispatch(EmptyMessage()) for _ in range(10)]
+        assert [future.result(timeout=1) for future in futures] == [[1, 2]] * 10
+
+    metrics = sut.metrics()
+    assert metrics.depth == 0
+    assert metrics.enqueued == 10
+    assert metrics.processed == 10
+    assert metrics.failed == 0
+    assert metrics.max_wait_time >= metrics.mean_wait_time >= 0
+
+
+def test_handling_errors_are_set_on_the_future():
+    bus = CommandBus()
+    bus.add_handler(EmptyMessage, errorful_handler)
+
+    with QueuedBus(bus) as sut:
+        future = sut.dispatch(EmptyMessage())
+        with pytest.raises(RuntimeError):
+            future.result(timeout=1)
+
+    assert sut.metrics().failed == 1
+
+
+def test_overflow_policies():
+    release = threading.Event()
+    handler_started = threading.Event()
+
+    def blocking_handler(message):
+        handler_started.set()
+        release.wait(1)
+        return 1
+
+    bus = MessageBus()
+    bus.add_handler(EmptyMessage, blocking_handler)
+
+    with QueuedBus(bus, max_size=1, overflow=QueueOverflowPolicy.RAISE) as sut:
+        first = sut.dispatch(EmptyMessage())
+        handler_started.wait(1)  # the first message is not in the queue anymore
+        second = sut.dispatch(EmptyMessage())
+        with pytest.raises(api.MessageQueueFull):
+            sut.dispatch(EmptyMessage())
+        release.set()
+        assert first.result(timeout=1) == second.result(timeout=1) == [1]
+
+    release.clear()
+    handler_started.clear()
+    with QueuedBus(bus, max_size=1, overflow=QueueOverflowPolicy.SHED) as sut:
+        sut.dispatch(EmptyMessage())
+        handler_started.wait(1)
+        sut.dispatch(EmptyMessage())
+        shed = sut.dispatch(EmptyMessage())
+        assert shed.cancelled()
+        release.set()
+
+    assert sut.metrics().shed == 1
+    assert sut.metrics().processed == 2
+
+    release.clear()
+    handler_started.clear()
+    with QueuedBus(
+        bus, max_size=1, overflow=QueueOverflowPolicy.BLOCK, block_timeout=0.01
+    ) as sut:
+        sut.dispatch(EmptyMessage())
+        handler_started.wait(1)
+        sut.dispatch(EmptyMessage())
+        with pytest.raises(api.MessageQueueFull):
+            sut.dispatch(EmptyMessage())
+        release.set()
+
+
+def test_async_queued_bus():
+    bus = AsyncMessageBus()
+    bus.add_handler(EmptyMessage, async_get_one)
+
+    async def scenario():
+        sut = AsyncQueuedBus(bus, workers=3)
+        futures = [await sut.dispatch(EmptyMessage()) for _ in range(5)]
+        results = await asyncio.gather(*futures)
+        await sut.shutdown()
+        return results, sut.metrics()
+
+    results, metrics = run(scenario())
+    assert results == [[1]] * 5
+    assert metrics.processed == 5
+
+
+def test_async_queued_bus_overflow():
+    bus = AsyncMessageBus()
+    bus.add_handler(EmptyMessage, async_get_one)
+
+    async def scenario():
+        sut = AsyncQueuedBus(bus, max_size=1, overflow=QueueOverflowPolicy.SHED)
+        # The worker Task doesn't get a chance to run between those two calls:
+        first = await sut.dispatch(EmptyMessage())
+        shed = await sut.dispatch(EmptyMessage())
+        assert shed.cancelled()
+        assert await first == [1]
+        await sut.shutdown()
+        return sut.metrics()
+
+    assert run(scenario()).shed == 1
+
+
+def test_shutdown_waits_for_the_ongoing_dispatches():
+    release = threading.Event()
+    bus = MessageBus()
+    bus.add_handler(EmptyMessage, lambda _: release.wait(5))
+    sut = QueuedBus(bus, max_size=1)
+    first = sut.dispatch(EmptyMessage())
+    sut.dispatch(EmptyMessage())  # fills the queue, while the worker handles `first`
+    # This one blocks until there is some room in the queue:
+    blocked_dispatch: t.List = []
+    dispatcher = threading.Thread(
+        target=lambda: blocked_dispatch.append(sut.dispatch(EmptyMessage()))
+    )
+    dispatcher.start()
+    shutdown = threading.Thread(target=sut.shutdown)
+    shutdown.start()
+    shutdown.join(0.1)
+    with pytest.raises(RuntimeError):
+        sut.dispatch(EmptyMessage())
+    release.set()
+    dispatcher.join()
+    shutdown.join()
+    assert first.result() == [True]
+    # The message dispatched before the shutdown was not left behind the workers' stop:
+    assert blocked_dispatch[0].result(timeout=1) == [True]
+
+
+def test_shutdown_can_wait_for_an_already_shut_down_bus():
+    bus = MessageBus()
+    bus.add_handler(EmptyMessage, lambda _: time.sleep(0.05))
+    sut = QueuedBus(bus)
+    future = sut.dispatch(EmptyMessage())
+    sut.shutdown(wait=False)
+    sut.shutdown(wait=True)
+    assert future.done() and future.exception() is None
+
+
+def test_async_queued_bus_runs_messages_in_their_dispatch_context():
+    bus = AsyncMessageBus()
+    bus.add_handler(EmptyMessage, async_get_request_id)
+
+    async def dispatch_in_request(sut: AsyncQueuedBus, request_id: str):
+        REQUEST_ID.set(request_id)
+        return await sut.dispatch(EmptyMessage())
+
+    async def scenario():
+        sut = AsyncQueuedBus(bus, workers=1)
+        futures = [
+            await asyncio.get_running_loop().create_task(
+                dispatch_in_request(sut, request_id)
+            )
+            for request_id in ("first", "second")
+        ]
+        results = await asyncio.gather(*futures)
+        # The worker started by the first dispatch doesn't carry its context:
+        results.append(await (await sut.dispatch(EmptyMessage())))
+        await sut.shutdown()
+        return results
+
+    assert run(scenario()) == [["first"], ["second"], [None]]
+
+
+def run(coroutine: t.Awaitable) -> t.Any:
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class EmptyMessage:
+    pass
+
+
+def errorful_handler(message: object) -> object:
+    raise RuntimeError("test error")
+
+
+async def async_get_one(_):
+    return 1
+
+
+REQUEST_ID: contextvars.ContextVar[t.Optional[str]] = contextvars.ContextVar(
+    "request_id", default=None
+)
+
+
+async def async_get_request_id(_):
+    return REQUEST_ID.get()
+
+
+get_one = lambda _: 1
+get_two = lambda _: 2
@@ -0,0 +1,119 @@
+# pylint: skip-file
+import dataclasses
+import typing as t
+
+import pytest
+
+from pymessagebus import api
+from pymessagebus._serialization import SerializerRegistry
+
+
+def test_fixed_size_messages_round_trip():
+    sut = SerializerRegistry()
+    sut.register(PriceChanged, class_id=1)
+
+    message = PriceChanged(product_id=42, price=9.99, on_sale=True)
+    data = sut.dumps(message)
+    assert isinstance(data, bytes)
+    # Header (4 bytes) + int64 + double + bool:
+    assert len(data) == 4 + 8 + 8 + 1
+    assert sut.loads(data) == message
+    assert sut.loads(memoryview(bytearray(data))) == message
+
+
+def test_variable_size_and_optional_fields():
+    sut = SerializerRegistry()
+    sut.register(CustomerRenamed, class_id=2)
+
+    message = CustomerRenamed(customer_id=1, name="Zoé", avatar=b"\x00\x01", note=None)
+    assert sut.loads(sut.dumps(message)) == message
+    message = CustomerRenamed(customer_id=1, name="", avatar=b"", note="VIP")
+    assert sut.loads(memoryview(sut.dumps(message))) == message
+
+
+def test_dataclass_messages():
+    sut = SerializerRegistry()
+    sut.register(OrderShipped, class_id=3)
+
+    message = OrderShipped(order_id=7, carrier="UPS")
+    assert sut.loads(sut.dumps(message)) == message
+
+
+def test_versioned_class_ids():
+    sut = SerializerRegistry()
+    sut.register(PriceChangedV1, class_id=1, version=1)
+    old_data = sut.dumps(PriceChangedV1(product_id=42, price=9.99))
+    sut.register(PriceChanged, class_id=1, version=2)
+
+    # Messages serialized with the previous version of the class can still be decoded:
+    assert sut.loads(old_data) == PriceChangedV1(product_id=42, price=9.99)
+    new_data = sut.dumps(PriceChanged(product_id=42, price=9.99, on_sale=False))
+    assert sut.loads(new_data) == PriceChanged(product_id=42, price=9.99, on_sale=False)
+    assert sut.class_ids() == {(1, 1): PriceChangedV1, (1, 2): PriceChanged}
+
+
+def test_errors():
+    sut = SerializerRegistry()
+    sut.register(PriceChanged, class_id=1)
+
+    with pytest.raises(api.MessageSerializationError):
+        sut.register(CustomerRenamed, class_id=1)
+    with pytest.raises(api.MessageSerializationError):
+        sut.register(MessageWithAList, class_id=2)
+    with pytest.raises(api.MessageSerializationError):
+        sut.register(EmptyMessage, class_id=3)
+    with pytest.raises(api.MessageSerializationError):
+        sut.dumps(OrderShipped(order_id=1, carrier="UPS"))
+    with pytest.raises(api.MessageSerializationError):
+        sut.dumps(PriceChanged(product_id=2 ** 64, price=1.0, on_sale=False))
+    with pytest.raises(api.MessageSerializationError):
+        sut.loads(b"\xff\xff\x01\x00")
+    with pytest.raises(api.MessageSerializationError):
+        sut.loads(b"")
+
+
+def test_truncated_messages():
+    sut = SerializerRegistry()
+    sut.register(PriceChanged, class_id=1)
+    sut.register(CustomerRenamed, class_id=2)
+
+    for message in (
+        PriceChanged(product_id=1, price=9.99, on_sale=True),
+        CustomerRenamed(customer_id=1, name="Zoë", avatar=b"\x89PNG", note=None),
+    ):
+        data = sut.dumps(message)
+        for size in range(4, len(data)):
+            with pytest.raises(api.MessageSerializationError):
+                sut.loads(memoryview(data)[:size])
+
+
+class PriceChanged(t.NamedTuple):
+    product_id: int
+    price: float
+    on_sale: bool
+
+
+class PriceChangedV1(t.NamedTuple):
+    product_id: int
+    price: float
+
+
+class CustomerRenamed(t.NamedTuple):
+    customer_id: int
+    name: str
+    avatar: bytes
+    note: t.Optional[str]
+
+
+@dataclasses.dataclass(frozen=True)
+class OrderShipped:
+    order_id: int
+    carrier: str
+
+
+class MessageWithAList(t.NamedTuple):
+    items: t.List[int]
+
+
+class EmptyMessage:
+    pass
@@ -0,0 +1,124 @@
+# pylint: skip-file
+
+import time
+import typing as t
+
+from pymessagebus import CommandBus
+from pymessagebus.middleware.cache import (
+    CacheMiddlewareConfig,
+    QueryCache,
+    get_cache_middleware,
+)
+
+
+def test_results_of_cached_classes_are_cached():
+    cache = QueryCache(CacheMiddlewareConfig(cached_message_classes=(GetCustomer,)))
+    command_bus, calls = get_command_bus(cache)
+
+    assert command_bus.handle(GetCustomer(customer_id=1)) == "customer 1"
+    assert command_bus.handle(GetCustomer(customer_id=1)) == "customer 1"
+    assert command_bus.handle(GetCustomer(customer_id=2)) == "customer 2"
+    assert calls == [GetCustomer(1), GetCustomer(2)]
+
+    # Other messages are not cached:
+    command_bus.handle(RenameCustomer(customer_id=1))
+    command_bus.handle(RenameCustomer(customer_id=1))
+    assert calls[2:] == [RenameCustomer(1), RenameCustomer(1)]
+
+    stats = cache.stats()
+    assert stats.size == 2
+    assert stats.hits == 1
+    assert stats.misses == 2
+    assert stats.hit_ratio == 1 / 3
+
+
+def test_lru_eviction():
+    cache = QueryCache(
+        CacheMiddlewareConfig(cached_message_classes=(GetCustomer,), max_entries=2)
+    )
+    command_bus, calls = get_command_bus(cache)
+
+    command_bus.handle(GetCustomer(1))
+    command_bus.handle(GetCustomer(2))
+    command_bus.handle(GetCustomer(1))  # "2" is now the least recently used one
+    command_bus.handle(GetCustomer(3))
+    command_bus.handle(GetCustomer(1))
+    command_bus.handle(GetCustomer(2))
+    assert calls == [GetCustomer(1), GetCustomer(2), GetCustomer(3), GetCustomer(2)]
+    assert cache.stats().evictions == 2
+
+
+def test_ttl_expiration():
+    cache = QueryCache(
+        CacheMiddlewareConfig(cached_message_classes=(GetCustomer,), ttl=0.01)
+    )
+    command_bus, calls = get_command_bus(cache)
+
+    command_bus.handle(GetCustomer(1))
+    command_bus.handle(GetCustomer(1))
+    time.sleep(0.02)
+    command_bus.handle(GetCustomer(1))
+    assert calls == [GetCustomer(1), GetCustomer(1)]
+
+
+def test_invalidation():
+    cache = QueryCache(
+        CacheMiddlewareConfig(
+            cached_message_classes=(GetCustomer, GetOrder),
+            invalidated_by={RenameCustomer: (GetCustomer,)},
+        )
+    )
+    command_bus, calls = get_command_bus(cache)
+
+    command_bus.handle(GetCustomer(1))
+    command_bus.handle(GetOrder(1))
+    command_bus.handle(RenameCustomer(1))
+    command_bus.handle(GetCustomer(1))
+    command_bus.handle(GetOrder(1))
+    assert calls == [GetCustomer(1), GetOrder(1), RenameCustomer(1), GetCustomer(1)]
+    assert cache.stats().invalidations == 1
+
+
+def test_results_read_before_an_invalidation_are_not_cached():
+    cache = QueryCache(CacheMiddlewareConfig(cached_message_classes=(GetCustomer,)))
+    command_bus = CommandBus(middlewares=[get_cache_middleware(cache)])
+    calls = []
+
+    def handler(message):
+        calls.append(message)
+        if len(calls) == 1:
+            # e.g. a command handled by another thread, while this query is handled:
+            cache.invalidate([GetCustomer])
+        return "stale" if len(calls) == 1 else "fresh"
+
+    command_bus.add_handler(GetCustomer, handler)
+
+    assert command_bus.handle(GetCustomer(1)) == "stale"
+    assert command_bus.handle(GetCustomer(1)) == "fresh"
+    assert command_bus.handle(GetCustomer(1)) == "fresh"
+    assert len(calls) == 2
+
+
+class GetCustomer(t.NamedTuple):
+    customer_id: int
+
+
+class GetOrder(t.NamedTuple):
+    order_id: int
+
+
+class RenameCustomer(t.NamedTuple):
+    customer_id: int
+
+
+def get_command_bus(cache: QueryCache) -> t.Tuple[CommandBus, t.List[object]]:
+    calls = []
+
+    def handler(message):
+        calls.append(message)
+        return f"customer {message[0]}"
+
+    command_bus = CommandBus(middlewares=[get_cache_middleware(cache)])
+    for message_class in (GetCustomer, GetOrder, RenameCustomer):
+        command_bus.add_handler(message_class, handler)
+    return command_bus, calls
@@ -0,0 +1,215 @@
+# pylint: skip-file
+
+import asyncio
+import time
+import typing as t
+
+import pytest
+
+from pymessagebus import AsyncCommandBus, CommandBus, MessageBus, api
+from pymessagebus.middleware.circuit_breaker import (
+    CircuitBreaker,
+    CircuitBreakerConfig,
+    CircuitState,
+    get_async_circuit_breaker_middleware,
+    get_circuit_breaker_middleware,
+    with_circuit_breaker,
+)
+
+
+def test_circuit_opens_when_the_failure_rate_crosses_the_threshold():
+    breaker = CircuitBreaker(
+        CircuitBreakerConfig(failure_rate_threshold=0.5, minimum_calls=4)
+    )
+    command_bus = CommandBus(middlewares=[get_circuit_breaker_middleware(breaker)])
+    handler = SwitchableHandler()
+    command_bus.add_handler(FragileMessage, handler)
+    command_bus.add_handler(OtherMessage, lambda message: "other")
+
+    command_bus.handle(FragileMessage())
+    command_bus.handle(FragileMessage())
+    handler.failing = True
+    with pytest.raises(ConnectionError):
+        command_bus.handle(FragileMessage())
+    assert breaker.stats(FragileMessage).state is CircuitState.CLOSED
+    with pytest.raises(ConnectionError):
+        command_bus.handle(FragileMessage())
+    assert breaker.stats(FragileMessage).state is CircuitState.OPEN
+
+    # The handler is not called any more...
+    with pytest.raises(api.CircuitBreakerOpen):
+        command_bus.handle(FragileMessage())
+    assert handler.calls == 4
+    # ...but the other message classes have their own circuit:
+    assert command_bus.handle(OtherMessage()) == "other"
+
+    stats = breaker.stats(FragileMessage)
+    assert (stats.calls, stats.failures, stats.rejected, stats.opened) == (4, 2, 1, 1)
+    assert stats.failure_rate == 0.5
+    assert breaker.stats(OtherMessage).state is CircuitState.CLOSED
+
+
+def test_half_open_circuit():
+    breaker = CircuitBreaker(CircuitBreakerConfig(minimum_calls=1, open_duration=0.02))
+    command_bus = CommandBus(middlewares=[get_circuit_breaker_middleware(breaker)])
+    handler = SwitchableHandler(failing=True)
+    command_bus.add_handler(FragileMessage, handler)
+
+    with pytest.raises(ConnectionError):
+        command_bus.handle(FragileMessage())
+    time.sleep(0.03)
+    assert breaker.stats(FragileMessage).state is CircuitState.HALF_OPEN
+    # A failed trial message opens the circuit again:
+    with pytest.raises(ConnectionError):
+        command_bus.handle(FragileMessage())
+    with pytest.raises(api.CircuitBreakerOpen):
+        command_bus.handle(FragileMessage())
+
+    time.sleep(0.03)
+    handler.failing = False
+    assert command_bus.handle(FragileMessage()) == "ok"
+    stats = breaker.stats(FragileMessage)
+    assert stats.state is CircuitState.CLOSED
+    assert stats.opened == 2
+
+
+def test_only_the_configured_classes_and_exceptions_are_counted():
+    config = CircuitBreakerConfig(
+        minimum_calls=1,
+        counted_exceptions=(ConnectionError,),
+        message_classes=(FragileMessage,),
+    )
+    breaker = CircuitBreaker(config)
+    command_bus = CommandBus(middlewares=[get_circuit_breaker_middleware(breaker)])
+    command_bus.add_handler(
+        FragileMessage, SwitchableHandler(failing=True, error=ValueError)
+    )
+    command_bus.add_handler(OtherMessage, SwitchableHandler(failing=True))
+
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            command_bus.handle(FragileMessage())
+    assert breaker.stats(FragileMessage).state is CircuitState.CLOSED
+    # Unprotected message classes don't go through the circuit breaker:
+    with pytest.raises(ConnectionError):
+        command_bus.handle(OtherMessage())
+    assert list(breaker.all_stats()) == [FragileMessage]
+
+
+def test_async_circuit_breaker_middleware():
+    breaker = CircuitBreaker(CircuitBreakerConfig(minimum_calls=1))
+    command_bus = AsyncCommandBus(
+        middlewares=[get_async_circuit_breaker_middleware(breaker)]
+    )
+    handler = SwitchableHandler(failing=True)
+
+    async def async_handler(message):
+        return handler(message)
+
+    command_bus.add_handler(FragileMessage, async_handler)
+
+    with pytest.raises(ConnectionError):
+        run(command_bus.handle(FragileMessage()))
+    with pytest.raises(api.CircuitBreakerOpen):
+        run(command_bus.handle(FragileMessage()))
+    breaker.reset(FragileMessage)
+    handler.failing = False
+    assert run(command_bus.handle(FragileMessage())) == "ok"
+
+
+def test_with_circuit_breaker_gives_each_handler_its_own_circuit():
+    breaker = CircuitBreaker(CircuitBreakerConfig(minimum_calls=1))
+    projection = SwitchableHandler(failing=True)
+    notification = SwitchableHandler()
+    protected_projection = with_circuit_breaker(projection, breaker)
+    message_bus = MessageBus()
+    message_bus.add_handler(FragileMessage, protected_projection)
+    message_bus.add_handler(FragileMessage, with_circuit_breaker(notification, breaker))
+
+    with pytest.raises(ConnectionError):
+        message_bus.handle(FragileMessage())
+    assert breaker.stats(projection).state is CircuitState.OPEN
+    with pytest.raises(api.CircuitBreakerOpen):
+        protected_projection(FragileMessage())
+    message_bus.remove_handler(FragileMessage, protected_projection)
+    # The circuit of the other handler is still closed:
+    assert message_bus.handle(FragileMessage()) == ["ok"]
+    assert breaker.stats(notification).state is CircuitState.CLOSED
+
+
+def test_outcomes_from_a_previous_state_are_ignored():
+    breaker = CircuitBreaker(CircuitBreakerConfig(minimum_calls=1, open_duration=0.02))
+    # A slow message is let through while the circuit is closed...
+    slow_token = breaker.before_call(FragileMessage)
+    breaker.record(FragileMessage, breaker.before_call(FragileMessage), ConnectionError())
+    time.sleep(0.03)
+    trial_token = breaker.before_call(FragileMessage)
+    assert breaker.stats(FragileMessage).state is CircuitState.HALF_OPEN
+    # ...and its success doesn't close the half-open circuit, nor frees its trial slot:
+    breaker.record(FragileMessage, slow_token, None)
+    assert breaker.stats(FragileMessage).state is CircuitState.HALF_OPEN
+    with pytest.raises(api.CircuitBreakerOpen):
+        breaker.before_call(FragileMessage)
+    breaker.record(FragileMessage, trial_token, None)
+    stats = breaker.stats(FragileMessage)
+    assert stats.state is CircuitState.CLOSED
+    assert (stats.calls, stats.failures) == (3, 1)
+
+
+def test_cancelled_messages_are_not_recorded():
+    breaker = CircuitBreaker(CircuitBreakerConfig(minimum_calls=1, open_duration=0.02))
+    command_bus = AsyncCommandBus(
+        middlewares=[get_async_circuit_breaker_middleware(breaker)]
+    )
+
+    async def slow_handler(message):
+        await asyncio.sleep(1)
+
+    command_bus.add_handler(FragileMessage, slow_handler)
+
+    async def cancel_handling():
+        task = asyncio.get_running_loop().create_task(
+            command_bus.handle(FragileMessage())
+        )
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    breaker.record(FragileMessage, breaker.before_call(FragileMessage), ConnectionError())
+    time.sleep(0.03)
+    # The cancelled trial message neither closes the circuit nor keeps its trial slot:
+    run(cancel_handling())
+    stats = breaker.stats(FragileMessage)
+    assert (stats.state, stats.calls) == (CircuitState.HALF_OPEN, 1)
+    breaker.before_call(FragileMessage)
+
+
+class SwitchableHandler:
+    def __init__(
+        self, failing: bool = False, error: t.Type[Exception] = ConnectionError
+    ):
+        self.failing = failing
+        self.error = error
+        self.calls = 0
+
+    def __call__(self, message):
+        self.calls += 1
+        if self.failing:
+            raise self.error()
+        return "ok"
+
+
+def run(coroutine: t.Awaitable) -> t.Any:
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class FragileMessage:
+    pass
+
+
+class OtherMessage:
+    pass
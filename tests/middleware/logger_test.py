@@ -28,13 +28,13 @@ def test_middleware_basic(caplog):
 
         assert len(log_records) == 2
         assert (
-            log_records[0].msg
-            == "Message received: $<class 'logger_test.MessageClassOne'>"
+            log_records[0].getMessage()
+            == "Message received: <class 'logger_test.MessageClassOne'>"
         )
         assert log_records[0].levelno == logging.DEBUG
         assert (
-            log_records[1].msg
-            == "Message succeeded: $<class 'logger_test.MessageClassOne'>"
+            log_records[1].getMessage()
+            == "Message succeeded: <class 'logger_test.MessageClassOne'>"
         )
         assert log_records[1].levelno == logging.DEBUG
 
@@ -54,13 +54,13 @@ def test_middleware_with_error(caplog):
 
         assert len(log_records) == 2
         assert (
-            log_records[0].msg
-            == "Message received: $<class 'logger_test.MessageClassOne'>"
+            log_records[0].getMessage()
+            == "Message received: <class 'logger_test.MessageClassOne'>"
         )
         assert log_records[0].levelno == logging.DEBUG
         assert (
-            log_records[1].msg
-            == "Message failed: $<class 'logger_test.MessageClassOne'>"
+            log_records[1].getMessage()
+            == "Message failed: <class 'logger_test.MessageClassOne'>"
         )
         assert log_records[1].levelno == logging.ERROR
 
@@ -82,13 +82,13 @@ def test_middleware_with_custom_log_levels(caplog):
         log_records = caplog.records
 
         assert (
-            log_records[0].msg
-            == "Message received: $<class 'logger_test.MessageClassOne'>"
+            log_records[0].getMessage()
+            == "Message received: <class 'logger_test.MessageClassOne'>"
         )
         assert log_records[0].levelno == logging.CRITICAL
         assert (
-            log_records[1].msg
-            == "Message succeeded: $<class 'logger_test.MessageClassOne'>"
+            log_records[1].getMessage()
+            == "Message succeeded: <class 'logger_test.MessageClassOne'>"
         )
         assert log_records[1].levelno == logging.WARNING
 
@@ -111,21 +111,101 @@ def test_middleware_with_custom_log_levels_with_error(caplog):
         log_records = caplog.records
 
         assert (
-            log_records[0].msg
-            == "Message received: $<class 'logger_test.MessageClassOne'>"
+            log_records[0].getMessage()
+            == "Message received: <class 'logger_test.MessageClassOne'>"
         )
         assert log_records[0].levelno == logging.WARNING
         assert (
-            log_records[1].msg
-            == "Message failed: $<class 'logger_test.MessageClassOne'>"
+            log_records[1].getMessage()
+            == "Message failed: <class 'logger_test.MessageClassOne'>"
         )
         assert log_records[1].levelno == logging.INFO
 
 
+def test_middleware_uses_deferred_formatting(caplog):
+    logger_name = f"{__name__}.{random.randint(1000, 9999)}"
+    logger = logging.getLogger(logger_name)
+
+    sut = get_logger_middleware(logger)
+    message_bus = MessageBus(middlewares=[sut])
+    message_bus.add_handler(MessageClassOne, get_one)
+
+    with caplog.at_level(logging.DEBUG, logger=logger_name):
+        message_bus.handle(MessageClassOne())
+        log_records = caplog.records
+
+        assert log_records[0].msg == "Message received: %s"
+        assert log_records[0].args == (MessageClassOne,)
+
+
+def test_middleware_skips_disabled_levels(caplog):
+    logger_name = f"{__name__}.{random.randint(1000, 9999)}"
+    logger = logging.getLogger(logger_name)
+
+    sut = get_logger_middleware(logger)
+    message_bus = MessageBus(middlewares=[sut])
+    message_bus.add_handler(MessageClassOne, get_one)
+    message_bus.add_handler(MessageClassTwo, errorful_handler)
+
+    with caplog.at_level(logging.INFO, logger=logger_name):
+        assert message_bus.handle(MessageClassOne()) == [1]
+        assert caplog.records == []
+
+        with pytest.raises(RuntimeError):
+            message_bus.handle(MessageClassTwo())
+        assert len(caplog.records) == 1
+        assert caplog.records[0].levelno == logging.ERROR
+
+
+def test_middleware_with_successes_sampling(caplog):
+    logger_name = f"{__name__}.{random.randint(1000, 9999)}"
+    logger = logging.getLogger(logger_name)
+
+    sut_config = LoggingMiddlewareConfig(
+        mgs_received_level=logging.NOTSET, mgs_succeeded_sample_rate=3
+    )
+    sut = get_logger_middleware(logger, sut_config)
+    message_bus = MessageBus(middlewares=[sut])
+    message_bus.add_handler(MessageClassOne, get_one)
+
+    with caplog.at_level(logging.DEBUG, logger=logger_name):
+        for _ in range(7):
+            message_bus.handle(MessageClassOne())
+        succeeded_records = [
+            record
+            for record in caplog.records
+            if record.getMessage().startswith("Message succeeded")
+        ]
+        assert len(succeeded_records) == 3
+
+
+def test_middleware_with_structured_fields(caplog):
+    logger_name = f"{__name__}.{random.randint(1000, 9999)}"
+    logger = logging.getLogger(logger_name)
+
+    sut = get_logger_middleware(logger, LoggingMiddlewareConfig(structured=True))
+    message_bus = MessageBus(middlewares=[sut])
+    message_bus.add_handler(MessageClassOne, get_one)
+    message_bus.add_handler(MessageClassOne, get_one)
+
+    with caplog.at_level(logging.DEBUG, logger=logger_name):
+        message_bus.handle(MessageClassOne())
+        log_records = caplog.records
+
+        assert log_records[0].message_class is MessageClassOne
+        assert log_records[1].message_class is MessageClassOne
+        assert log_records[1].duration >= 0
+        assert log_records[1].handler_count == 2
+
+
 class MessageClassOne:
     pass
 
 
+class MessageClassTwo:
+    pass
+
+
 def errorful_handler(message: object) -> object:
     raise RuntimeError("test error")
 
@@ -0,0 +1,161 @@
+# pylint: skip-file
+
+import threading
+
+import pytest
+
+from pymessagebus import MessageBus
+from pymessagebus.middleware.metrics import (
+    MetricsRecorder,
+    get_metrics_middleware,
+    to_prometheus_text,
+)
+
+
+def test_middleware_records_messages_latencies():
+    recorder = MetricsRecorder()
+    message_bus = MessageBus(middlewares=[get_metrics_middleware(recorder)])
+    message_bus.add_handler(MessageClassOne, get_one)
+    message_bus.add_handler(MessageClassTwo, errorful_handler)
+
+    for _ in range(3):
+        assert message_bus.handle(MessageClassOne()) == [1]
+    with pytest.raises(RuntimeError):
+        message_bus.handle(MessageClassTwo())
+
+    snapshot = recorder.snapshot()
+    histogram_one = snapshot.messages["metrics_test.MessageClassOne"]
+    assert histogram_one.total == 3
+    assert histogram_one.errors == 0
+    assert histogram_one.sum_ns > 0
+    assert 0 < histogram_one.percentile_ns(0.5) <= histogram_one.percentile_ns(0.99)
+    assert snapshot.throughput("metrics_test.MessageClassOne") > 0
+    histogram_two = snapshot.messages["metrics_test.MessageClassTwo"]
+    assert histogram_two.total == 1
+    assert histogram_two.errors == 1
+
+
+def test_instrumented_handlers():
+    recorder = MetricsRecorder()
+    message_bus = MessageBus()
+    message_bus.add_handler(MessageClassOne, recorder.instrument_handler(get_one))
+    message_bus.add_handler(MessageClassOne, recorder.instrument_handler(get_two))
+
+    assert message_bus.handle(MessageClassOne()) == [1, 2]
+
+    snapshot = recorder.snapshot()
+    assert snapshot.messages == {}
+    assert snapshot.handlers["metrics_test.get_one"].total == 1
+    assert snapshot.handlers["metrics_test.get_two"].total == 1
+
+
+def test_handlers_sharing_a_qualified_name_are_merged():
+    def get_handler(result):
+        def handler(message):
+            return result
+
+        return handler
+
+    recorder = MetricsRecorder()
+    message_bus = MessageBus()
+    message_bus.add_handler(MessageClassOne, recorder.instrument_handler(get_handler(1)))
+    message_bus.add_handler(MessageClassOne, recorder.instrument_handler(get_handler(2)))
+
+    assert message_bus.handle(MessageClassOne()) == [1, 2]
+
+    handlers = recorder.snapshot().handlers
+    assert len(handlers) == 1
+    assert list(handlers.values())[0].total == 2
+
+
+def test_histograms_buckets():
+    recorder = MetricsRecorder(buckets_ns=[100, 1000])
+    recorder.record_message(MessageClassOne, 50, False)
+    recorder.record_message(MessageClassOne, 100, False)
+    recorder.record_message(MessageClassOne, 500, False)
+    recorder.record_message(MessageClassOne, 5000, True)
+
+    histogram = recorder.snapshot().messages["metrics_test.MessageClassOne"]
+    assert histogram.counts == (2, 1, 1)
+    assert histogram.total == 4
+    assert histogram.sum_ns == 5650
+    assert histogram.errors == 1
+    assert histogram.percentile_ns(0.5) == 100
+    assert histogram.percentile_ns(0.75) == 1000
+    assert histogram.percentile_ns(0.99) == float("inf")
+
+
+def test_threads_records_are_merged():
+    recorder = MetricsRecorder()
+
+    def record():
+        for _ in range(100):
+            recorder.record_message(MessageClassOne, 10, False)
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    record()
+
+    assert recorder.snapshot().messages["metrics_test.MessageClassOne"].total == 500
+
+
+def test_ended_threads_records_are_folded():
+    recorder = MetricsRecorder()
+
+    def record():
+        recorder.record_message(MessageClassOne, 10, False)
+        recorder.record_handler(get_one, 10, True)
+
+    for _ in range(50):
+        thread = threading.Thread(target=record)
+        thread.start()
+        thread.join()
+
+    snapshot = recorder.snapshot()
+    assert snapshot.messages["metrics_test.MessageClassOne"].total == 50
+    assert snapshot.handlers["metrics_test.get_one"].errors == 50
+    # the shards of the ended threads don't pile up:
+    assert len(recorder._all_shards) == 0
+    record()
+    assert recorder.snapshot().messages["metrics_test.MessageClassOne"].total == 51
+
+
+def test_prometheus_text_export():
+    recorder = MetricsRecorder(buckets_ns=[1000, 1_000_000])
+    recorder.record_message(MessageClassOne, 500, False)
+    recorder.record_message(MessageClassOne, 2000, True)
+    recorder.record_handler(get_one, 500, False)
+
+    text = to_prometheus_text(recorder.snapshot())
+    lines = text.splitlines()
+    assert "# TYPE pymessagebus_message_duration_seconds histogram" in lines
+    labels = 'message_class="metrics_test.MessageClassOne"'
+    assert f'pymessagebus_message_duration_seconds_bucket{{{labels},le="1e-06"}} 1' in lines
+    assert f'pymessagebus_message_duration_seconds_bucket{{{labels},le="0.001"}} 2' in lines
+    assert f'pymessagebus_message_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in lines
+    assert f"pymessagebus_message_duration_seconds_count{{{labels}}} 2" in lines
+    assert f"pymessagebus_message_errors_total{{{labels}}} 1" in lines
+    assert 'pymessagebus_handler_errors_total{handler="metrics_test.get_one"} 0' in lines
+
+
+class MessageClassOne:
+    pass
+
+
+class MessageClassTwo:
+    pass
+
+
+def errorful_handler(message: object) -> object:
+    raise RuntimeError("test error")
+
+
+def get_one(_):
+    return 1
+
+
+def get_two(_):
+    return 2
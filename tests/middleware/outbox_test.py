@@ -0,0 +1,120 @@
+# pylint: skip-file
+
+import threading
+import typing as t
+
+import pytest
+
+from pymessagebus import CommandBus, MessageBus, SerializerRegistry
+from pymessagebus.middleware.outbox import (
+    OutboxConfig,
+    SQLiteOutbox,
+    get_outbox_middleware,
+)
+
+
+def test_handled_messages_are_journaled_and_acknowledged(tmp_path):
+    with SQLiteOutbox(str(tmp_path / "outbox.db")) as outbox:
+        message_bus = MessageBus(middlewares=[get_outbox_middleware(outbox)])
+        message_bus.add_handler(OrderPlaced, lambda order: order.order_id)
+
+        assert message_bus.handle(OrderPlaced(order_id=1)) == [1]
+        assert outbox.pending() == []
+        assert outbox.cleanup() == 1
+
+
+def test_failed_messages_are_replayed_on_startup(tmp_path):
+    database = str(tmp_path / "outbox.db")
+    handled_messages = []
+
+    def flaky_handler(order: OrderPlaced):
+        if order.order_id == 2:
+            raise RuntimeError("crash!")
+        handled_messages.append(order)
+
+    with SQLiteOutbox(database) as outbox:
+        command_bus = CommandBus(middlewares=[get_outbox_middleware(outbox)])
+        command_bus.add_handler(OrderPlaced, flaky_handler)
+        command_bus.handle(OrderPlaced(order_id=1))
+        with pytest.raises(RuntimeError):
+            command_bus.handle(OrderPlaced(order_id=2))
+
+    # Let's simulate a restart of the application:
+    with SQLiteOutbox(database) as outbox:
+        pending = outbox.pending()
+        assert [entry.message for entry in pending] == [OrderPlaced(order_id=2)]
+
+        command_bus = CommandBus(middlewares=[get_outbox_middleware(outbox)])
+        command_bus.add_handler(OrderPlaced, handled_messages.append)
+        assert outbox.replay(command_bus.handle) == 1
+        assert handled_messages == [OrderPlaced(order_id=1), OrderPlaced(order_id=2)]
+        # The replayed message was not appended to the journal again:
+        assert outbox.pending() == []
+        assert outbox.cleanup() == 2
+
+
+def test_acknowledgements_are_buffered(tmp_path):
+    config = OutboxConfig(ack_batch_size=3)
+    with SQLiteOutbox(str(tmp_path / "outbox.db"), config) as outbox:
+        entry_ids = outbox.append_many([OrderPlaced(order_id=i) for i in range(4)])
+        outbox.acknowledge(entry_ids[0])
+        outbox.acknowledge(entry_ids[1])
+        assert outbox.cleanup(older_than=3600) == 0
+        outbox.acknowledge(entry_ids[2])
+        assert outbox.cleanup() == 3
+        assert [entry.id for entry in outbox.pending()] == [entry_ids[3]]
+
+
+def test_handle_many_appends_the_batch_in_one_go(tmp_path):
+    with SQLiteOutbox(str(tmp_path / "outbox.db")) as outbox:
+        appended_batches = []
+        append_many = outbox.append_many
+        outbox.append_many = lambda messages: (
+            appended_batches.append(list(messages)) or append_many(messages)
+        )
+        message_bus = MessageBus(middlewares=[get_outbox_middleware(outbox)])
+        message_bus.add_handler(OrderPlaced, lambda order: order.order_id)
+
+        messages = [OrderPlaced(order_id=i) for i in range(3)]
+        assert message_bus.handle_many(messages) == [[0], [1], [2]]
+        assert appended_batches == [messages]
+        assert outbox.cleanup() == 3
+
+
+def test_concurrent_appends_are_group_committed(tmp_path):
+    config = OutboxConfig(group_commit_window=0.05)
+    with SQLiteOutbox(str(tmp_path / "outbox.db"), config) as outbox:
+        committed_groups = []
+        insert_rows = outbox._insert_rows
+        outbox._insert_rows = lambda rows: (
+            committed_groups.append(len(rows)) or insert_rows(rows)
+        )
+        entry_ids = {}
+
+        def append(order_id):
+            entry_ids[order_id] = outbox.append(OrderPlaced(order_id=order_id))
+
+        threads = [threading.Thread(target=append, args=(i,)) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sum(committed_groups) == 10
+        assert len(committed_groups) < 10
+        assert {
+            entry.id: entry.message.order_id for entry in outbox.pending()
+        } == {entry_id: order_id for order_id, entry_id in entry_ids.items()}
+
+
+def test_serializer_can_be_replaced(tmp_path):
+    serializer = SerializerRegistry()
+    serializer.register(OrderPlaced, class_id=1)
+    config = OutboxConfig(serializer=serializer)
+    with SQLiteOutbox(str(tmp_path / "outbox.db"), config) as outbox:
+        outbox.append(OrderPlaced(order_id=1))
+        assert [entry.message for entry in outbox.pending()] == [OrderPlaced(order_id=1)]
+
+
+class OrderPlaced(t.NamedTuple):
+    order_id: int
@@ -0,0 +1,156 @@
+# pylint: skip-file
+
+import asyncio
+import typing as t
+
+import pytest
+
+from pymessagebus import AsyncCommandBus, AsyncMessageBus, CommandBus, MessageBus
+from pymessagebus import api, deadline
+from pymessagebus.middleware.retry import (
+    Retrier,
+    RetryMiddlewareConfig,
+    RetryPolicy,
+    get_async_retry_middleware,
+    get_retry_middleware,
+    with_retry,
+)
+
+
+def test_failing_messages_are_retried():
+    retrier = Retrier(RetryMiddlewareConfig(default_policy=FAST_POLICY))
+    command_bus = CommandBus(middlewares=[get_retry_middleware(retrier)])
+    command_bus.add_handler(FlakyMessage, FlakyHandler(failures=2))
+    command_bus.add_handler(BrokenMessage, FlakyHandler(failures=10))
+
+    assert command_bus.handle(FlakyMessage()) == "ok after 3 attempts"
+    with pytest.raises(ConnectionError):
+        command_bus.handle(BrokenMessage())
+
+    assert retrier.stats() == (2, 4, 1, 1)
+
+
+def test_policies_per_class_and_per_exception_type():
+    config = RetryMiddlewareConfig(
+        default_policy=None,
+        policies_per_class={
+            FlakyMessage: FAST_POLICY._replace(retry_on=(ConnectionError,))
+        },
+    )
+    retrier = Retrier(config)
+    command_bus = CommandBus(middlewares=[get_retry_middleware(retrier)])
+    command_bus.add_handler(FlakyMessage, FlakyHandler(failures=1, error=ValueError))
+    command_bus.add_handler(BrokenMessage, FlakyHandler(failures=1))
+
+    # Not a retryable exception:
+    with pytest.raises(ValueError):
+        command_bus.handle(FlakyMessage())
+    # Not a retried message class:
+    with pytest.raises(ConnectionError):
+        command_bus.handle(BrokenMessage())
+    assert retrier.stats().retries == 0
+
+
+def test_retries_are_opt_in():
+    retrier = Retrier()
+    command_bus = CommandBus(middlewares=[get_retry_middleware(retrier)])
+    handler = FlakyHandler(failures=1)
+    command_bus.add_handler(FlakyMessage, handler)
+
+    with pytest.raises(ConnectionError):
+        command_bus.handle(FlakyMessage())
+    assert handler.attempts == 1
+
+
+def test_with_retry_only_retries_the_failing_handler():
+    charges = []
+    retrier = Retrier()
+    message_bus = MessageBus()
+    message_bus.add_handler(FlakyMessage, charges.append)
+    message_bus.add_handler(
+        FlakyMessage, with_retry(FlakyHandler(failures=2), FAST_POLICY, retrier=retrier)
+    )
+
+    message = FlakyMessage()
+    assert message_bus.handle(message) == [None, "ok after 3 attempts"]
+    assert charges == [message]
+    assert retrier.stats() == (1, 2, 1, 0)
+
+
+def test_with_retry_on_async_handlers():
+    handler = FlakyHandler(failures=1)
+
+    async def async_handler(message):
+        return handler(message)
+
+    message_bus = AsyncMessageBus()
+    message_bus.add_handler(FlakyMessage, with_retry(async_handler, FAST_POLICY))
+
+    assert run(message_bus.handle(FlakyMessage())) == ["ok after 2 attempts"]
+
+
+def test_retries_dont_exceed_the_deadline():
+    policy = RetryPolicy(max_attempts=10, base_delay=1, jitter=False)
+    retrier = Retrier(RetryMiddlewareConfig(default_policy=policy))
+    command_bus = CommandBus(middlewares=[get_retry_middleware(retrier)])
+    handler = FlakyHandler(failures=5)
+    command_bus.add_handler(FlakyMessage, handler)
+
+    with deadline(0.5):
+        with pytest.raises(ConnectionError):
+            command_bus.handle(FlakyMessage())
+    assert handler.attempts == 1
+
+
+def test_backoff_delays():
+    policy = RetryPolicy(base_delay=0.1, multiplier=3, max_delay=0.5, jitter=False)
+    assert [policy.get_delay(n) for n in (1, 2, 3)] == [0.1, pytest.approx(0.3), 0.5]
+    policy = policy._replace(jitter=True)
+    assert all(0 <= policy.get_delay(2) <= 0.3 for _ in range(20))
+    assert not policy.should_retry(api.CircuitBreakerOpen())
+
+
+def test_async_retry_middleware():
+    retrier = Retrier(RetryMiddlewareConfig(default_policy=FAST_POLICY))
+    command_bus = AsyncCommandBus(middlewares=[get_async_retry_middleware(retrier)])
+    handler = FlakyHandler(failures=1)
+
+    async def async_handler(message):
+        return handler(message)
+
+    command_bus.add_handler(FlakyMessage, async_handler)
+
+    assert run(command_bus.handle(FlakyMessage())) == "ok after 2 attempts"
+    assert retrier.stats() == (1, 1, 1, 0)
+
+
+FAST_POLICY = RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.005)
+
+
+class FlakyHandler:
+    def __init__(self, failures: int, error: t.Type[Exception] = ConnectionError):
+        self.failures = failures
+        self.error = error
+        self.attempts = 0
+
+    def __call__(self, message):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise self.error()
+        return f"ok after {self.attempts} attempts"
+
+
+def run(coroutine: t.Awaitable) -> t.Any:
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class FlakyMessage:
+    pass
+
+
+class BrokenMessage:
+    pass
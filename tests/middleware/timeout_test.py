@@ -0,0 +1,148 @@
+# pylint: skip-file
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+import typing as t
+
+import pytest
+
+from pymessagebus import (
+    AsyncMessageBus,
+    CommandBus,
+    MessageBus,
+    check_deadline,
+    remaining_time,
+)
+from pymessagebus import api
+from pymessagebus.middleware.timeout import (
+    TimeoutMiddlewareConfig,
+    get_async_timeout_middleware,
+    get_timeout_middleware,
+    with_timeout,
+)
+
+
+def test_slow_handlers_are_abandoned_with_an_executor():
+    release = threading.Event()
+
+    def slow_handler(message):
+        release.wait(5)
+        return "too late"
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        config = TimeoutMiddlewareConfig(
+            timeouts_per_class={SlowMessage: 0.05}, executor=executor
+        )
+        command_bus = CommandBus(middlewares=[get_timeout_middleware(config)])
+        command_bus.add_handler(SlowMessage, slow_handler)
+        command_bus.add_handler(FastMessage, lambda message: remaining_time())
+
+        started_at = time.monotonic()
+        with pytest.raises(api.DeadlineExceeded):
+            command_bus.handle(SlowMessage())
+        assert time.monotonic() - started_at < 1
+        # Messages without a timeout are not constrained:
+        assert command_bus.handle(FastMessage()) is None
+        release.set()
+
+
+def test_nested_messages_inherit_the_deadline():
+    inner_bus = CommandBus(middlewares=[get_timeout_middleware()])
+    inner_bus.add_handler(FastMessage, lambda message: remaining_time())
+
+    def outer_handler(message):
+        time.sleep(0.06)
+        # The deadline of the outer message is already exceeded:
+        return inner_bus.handle(FastMessage())
+
+    config = TimeoutMiddlewareConfig(timeout=0.05)
+    outer_bus = CommandBus(middlewares=[get_timeout_middleware(config)])
+    outer_bus.add_handler(SlowMessage, outer_handler)
+
+    with pytest.raises(api.DeadlineExceeded):
+        outer_bus.handle(SlowMessage())
+
+    outer_bus = CommandBus(
+        middlewares=[get_timeout_middleware(TimeoutMiddlewareConfig(timeout=10))]
+    )
+    outer_bus.add_handler(SlowMessage, lambda message: inner_bus.handle(FastMessage()))
+    assert 0 < outer_bus.handle(SlowMessage()) <= 10
+
+
+def test_handlers_can_check_the_deadline_cooperatively():
+    def cooperative_handler(message):
+        time.sleep(0.02)
+        check_deadline()
+
+    message_bus = MessageBus(
+        middlewares=[get_timeout_middleware(TimeoutMiddlewareConfig(timeout=0.01))]
+    )
+    message_bus.add_handler(SlowMessage, cooperative_handler)
+
+    with pytest.raises(api.DeadlineExceeded):
+        message_bus.handle(SlowMessage())
+
+
+def test_async_handlers_are_cancelled():
+    cancelled = []
+
+    async def slow_handler(message):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(message)
+            raise
+
+    config = TimeoutMiddlewareConfig(timeout=0.02)
+    message_bus = AsyncMessageBus(middlewares=[get_async_timeout_middleware(config)])
+    message_bus.add_handler(SlowMessage, slow_handler)
+    message_bus.add_handler(FastMessage, async_get_one)
+
+    with pytest.raises(api.DeadlineExceeded):
+        run(message_bus.handle(SlowMessage()))
+    assert len(cancelled) == 1
+    assert run(message_bus.handle(FastMessage())) == [1]
+
+
+def test_per_handler_timeouts():
+    async def slow_async_handler(message):
+        await asyncio.sleep(5)
+
+    message_bus = AsyncMessageBus()
+    message_bus.add_handler(SlowMessage, with_timeout(slow_async_handler, 0.02))
+    with pytest.raises(api.DeadlineExceeded):
+        run(message_bus.handle(SlowMessage()))
+
+    release = threading.Event()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        message_bus = MessageBus()
+        message_bus.add_handler(FastMessage, with_timeout(lambda m: 1, 1))
+        message_bus.add_handler(
+            SlowMessage, with_timeout(lambda m: release.wait(5), 0.02, executor=executor)
+        )
+        assert message_bus.handle(FastMessage()) == [1]
+        with pytest.raises(api.DeadlineExceeded):
+            message_bus.handle(SlowMessage())
+        release.set()
+
+
+def run(coroutine: t.Awaitable) -> t.Any:
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class SlowMessage:
+    pass
+
+
+class FastMessage:
+    pass
+
+
+async def async_get_one(_):
+    return 1